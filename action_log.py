@@ -0,0 +1,352 @@
+import heapq
+import sys
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+
+# Default number of entries kept before the oldest are overwritten
+DEFAULT_CAPACITY = 10000
+
+
+class ActionRecord:
+    # Read-only view of one log entry. Strings are interned by the log, and
+    # the time is only formatted when a row is actually rendered.
+    __slots__ = ("seq", "timestamp", "device", "action", "user")
+
+    def __init__(self, seq, timestamp, device, action, user):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.device = device
+        self.action = action
+        self.user = user
+
+    @property
+    def time(self):
+        return datetime.fromtimestamp(self.timestamp).strftime("%H:%M:%S")
+
+    @property
+    def date(self):
+        return datetime.fromtimestamp(self.timestamp).strftime("%Y-%m-%d")
+
+    def __repr__(self):
+        return f"ActionRecord({self.seq}, {self.date} {self.time}, {self.device!r}, {self.action!r}, {self.user!r})"
+
+
+class _Interner:
+    # Maps strings to small integer codes and back. Each code counts the log
+    # entries using it; once the last one is evicted the string is dropped
+    # and its code reused, so one-off strings (scene and telemetry entries
+    # list their changes) do not accumulate beyond what the ring holds.
+    def __init__(self):
+        self.codes = {}
+        self.strings = []
+        # Lower-cased copies for case-insensitive matching (None once released)
+        self.folded = []
+        self.refs = []
+        self._free = []
+
+    # Code of a string, counting one more use of it
+    def code(self, string):
+        code = self.codes.get(string)
+        if code is None:
+            if self._free:
+                code = self._free.pop()
+                self.strings[code] = string
+                self.folded[code] = string.lower()
+            else:
+                code = len(self.strings)
+                self.strings.append(string)
+                self.folded.append(string.lower())
+                self.refs.append(0)
+            self.codes[string] = code
+        self.refs[code] += 1
+        return code
+
+    def release(self, code):
+        self.refs[code] -= 1
+        if not self.refs[code]:
+            del self.codes[self.strings[code]]
+            self.strings[code] = self.folded[code] = None
+            self._free.append(code)
+
+    # Codes of every string the predicate accepts (given the lower-cased string)
+    def matching(self, predicate):
+        return {code for code, string in enumerate(self.folded) if string is not None and predicate(string)}
+
+
+class _Postings:
+    # Sequence numbers in ascending order, as a compact array. Dropping the
+    # oldest is O(1): the head moves forward and the array is compacted once
+    # more than half of it is dead.
+    __slots__ = ("seqs", "head")
+
+    def __init__(self):
+        self.seqs = array("q")
+        self.head = 0
+
+    def append(self, seq):
+        self.seqs.append(seq)
+
+    def popleft(self):
+        self.head += 1
+        if self.head > 64 and self.head * 2 > len(self.seqs):
+            del self.seqs[:self.head]
+            self.head = 0
+
+    def __len__(self):
+        return len(self.seqs) - self.head
+
+    # Index range of the sequence numbers in low..high-1
+    def span(self, low, high):
+        return bisect_left(self.seqs, low, self.head), bisect_left(self.seqs, high, self.head)
+
+    # Newest first
+    def newest(self, n):
+        seqs = self.seqs
+        stop = max(len(seqs) - n, self.head)
+        return [seqs[i] for i in range(len(seqs) - 1, stop - 1, -1)]
+
+
+class ActionLog:
+    # Fixed-capacity ring buffer of actions stored column-wise: an epoch
+    # timestamp plus interned device, action and user codes per entry.
+    # Every entry gets a sequence number; its slot is seq % capacity.
+    #
+    # Indexes: postings (sequence numbers in order) per device, per
+    # (device, action) pair and per user, and the ring itself, which is
+    # time-ordered and is binary searched for time ranges. "Last N for
+    # device X" is O(N); filtered queries walk the most selective index and
+    # check the other filters against the columns. A grouped entry (a scene,
+    # a telemetry report) is also indexed under every device it changed, so
+    # it shows up in that device's recent actions and device filters.
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self._timestamps = array("d", [0.0]) * capacity
+        self._devices = array("I", [0]) * capacity
+        self._actions = array("I", [0]) * capacity
+        self._users = array("I", [0]) * capacity
+        self._strings = _Interner()
+        self._next_seq = 0
+        # code -> postings; pairs are keyed by (device code, action code)
+        self._by_device = {}
+        self._by_pair = {}
+        self._by_user = {}
+        # slot -> device codes of the other devices a grouped entry changed
+        self._changed = {}
+
+    # `changed` lists the devices a grouped entry changed
+    def append(self, timestamp, device, action, user, changed=()):
+        seq = self._next_seq
+        slot = seq % self.capacity
+        if seq >= self.capacity:
+            # The evicted entry is the oldest overall, so it is also the
+            # oldest one in its indexes
+            _unindex(self._by_device, self._devices[slot])
+            _unindex(self._by_pair, (self._devices[slot], self._actions[slot]))
+            _unindex(self._by_user, self._users[slot])
+            for code in self._changed.pop(slot, ()):
+                _unindex(self._by_device, code)
+                _unindex(self._by_pair, (code, self._actions[slot]))
+                self._strings.release(code)
+            for code in (self._devices[slot], self._actions[slot], self._users[slot]):
+                self._strings.release(code)
+        device_code = self._strings.code(device)
+        action_code = self._strings.code(action)
+        user_code = self._strings.code(user)
+        self._timestamps[slot] = timestamp
+        self._devices[slot] = device_code
+        self._actions[slot] = action_code
+        self._users[slot] = user_code
+        _index(self._by_device, device_code, seq)
+        _index(self._by_pair, (device_code, action_code), seq)
+        _index(self._by_user, user_code, seq)
+        if changed:
+            codes = tuple(self._strings.code(other) for other in dict.fromkeys(changed) if other != device)
+            self._changed[slot] = codes
+            for code in codes:
+                _index(self._by_device, code, seq)
+                _index(self._by_pair, (code, action_code), seq)
+        self._next_seq = seq + 1
+        return seq
+
+    def record(self, seq):
+        if not self.first_seq <= seq < self._next_seq:
+            raise IndexError(f"entry {seq} is not in the log")
+        slot = seq % self.capacity
+        strings = self._strings.strings
+        return ActionRecord(
+            seq,
+            self._timestamps[slot],
+            strings[self._devices[slot]],
+            strings[self._actions[slot]],
+            strings[self._users[slot]],
+        )
+
+    @property
+    def first_seq(self):
+        return max(self._next_seq - self.capacity, 0)
+
+    @property
+    def next_seq(self):
+        return self._next_seq
+
+    def __len__(self):
+        return min(self._next_seq, self.capacity)
+
+    # Approximate bytes held by the columns, indexes and interned strings
+    @property
+    def nbytes(self):
+        arrays = [self._timestamps, self._devices, self._actions, self._users]
+        for index in (self._by_device, self._by_pair, self._by_user):
+            arrays.extend(postings.seqs for postings in index.values())
+        strings = sum(sys.getsizeof(string) for string in self._strings.strings if string is not None)
+        return sum(values.itemsize * len(values) for values in arrays) + strings
+
+    def __iter__(self):
+        # Newest first, like the old list that was built with insert(0, ...)
+        for seq in range(self._next_seq - 1, self.first_seq - 1, -1):
+            yield self.record(seq)
+
+    def recent(self, n):
+        last = self._next_seq - 1
+        return [self.record(last - i) for i in range(min(n, len(self)))]
+
+    def recent_for_device(self, device, n):
+        postings = self._by_device.get(self._strings.codes.get(device))
+        if not postings:
+            return []
+        return [self.record(seq) for seq in postings.newest(n)]
+
+    def devices(self):
+        strings = self._strings.strings
+        return [strings[code] for code in self._by_device]
+
+    def actions(self):
+        strings = self._strings.strings
+        return list(dict.fromkeys(strings[action] for _, action in self._by_pair))
+
+    # Sequence numbers of matching entries, newest first. All filters are
+    # optional and combined with AND:
+    #   device  exact device id, or a grouped entry that changed it
+    #   action  case-insensitive prefix of the action ("Set to" matches every set point)
+    #   start, end  epoch seconds, start inclusive and end exclusive
+    #   text    whitespace-separated terms, each found in the device, action or user
+    #   before, after  only entries with seq < before / seq > after (for paging)
+    # The result is a generator over live indexes: consume it before the
+    # log is appended to again.
+    def query(self, device=None, action=None, start=None, end=None, text=None, before=None, after=None):
+        low, high = self.first_seq, self._next_seq
+        if after is not None:
+            low = max(low, after + 1)
+        if before is not None:
+            high = min(high, before)
+        if start is not None:
+            low = max(low, self._seek(start))
+        if end is not None:
+            high = min(high, self._seek(end))
+
+        # Each filter is a list of (columns, codes) clauses, all of which
+        # must hold: one of the columns holds one of the codes (for _changed,
+        # one of the devices a grouped entry changed). It also lists the
+        # postings whose union is exactly the entries it accepts.
+        strings = self._strings
+        changed = self._changed
+        device_columns = (self._devices, changed)
+        filters = []
+        device_codes = None
+        if device is not None:
+            code = strings.codes.get(device)
+            device_codes = set() if code is None else {code}
+        if action is not None:
+            prefix = action.lower()
+            action_codes = strings.matching(lambda string: string.startswith(prefix))
+            clauses = [((self._actions,), action_codes)]
+            if device_codes is not None:
+                clauses.append((device_columns, device_codes))
+            lists = [postings for (d, a), postings in self._by_pair.items()
+                     if a in action_codes and (device_codes is None or d in device_codes)]
+            filters.append((clauses, lists))
+        elif device_codes is not None:
+            filters.append(([(device_columns, device_codes)], _lists(self._by_device, device_codes)))
+        for term in (text or "").lower().split():
+            codes = strings.matching(lambda string: term in string)
+            lists = _lists(self._by_device, codes) + _lists(self._by_user, codes)
+            lists += [postings for (_, a), postings in self._by_pair.items() if a in codes]
+            filters.append(([((self._devices, self._actions, self._users, changed), codes)], lists))
+        if low >= high or any(not lists for _, lists in filters):
+            return
+
+        # Walk the index with the fewest entries in range (or the range
+        # itself) and check the remaining filters per entry
+        candidates = range(high - 1, low - 1, -1)
+        best = high - low
+        driver = None
+        for f in filters:
+            spans = [(postings.seqs, postings.span(low, high)) for postings in f[1]]
+            size = sum(stop - begin for _, (begin, stop) in spans)
+            if size < best:
+                best, driver = size, f
+                walks = [_descending(seqs, begin, stop) for seqs, (begin, stop) in spans]
+                candidates = walks[0] if len(walks) == 1 else heapq.merge(*walks, reverse=True)
+        checks = [clause for f in filters if f is not driver for clause in f[0]]
+        capacity = self.capacity
+        previous = None
+        for seq in candidates:
+            # Free text lists can overlap (a term in both device and action)
+            if seq == previous:
+                continue
+            previous = seq
+            slot = seq % capacity
+            for columns, codes in checks:
+                for column in columns:
+                    if column is changed:
+                        if slot in changed and not codes.isdisjoint(changed[slot]):
+                            break
+                    elif column[slot] in codes:
+                        break
+                else:
+                    break
+            else:
+                yield seq
+
+    # First sequence number whose timestamp is at or after ts. Entries are
+    # logged in time order, so the ring is a sorted index over time.
+    def _seek(self, ts):
+        low, high = self.first_seq, self._next_seq
+        timestamps, capacity = self._timestamps, self.capacity
+        while low < high:
+            middle = (low + high) // 2
+            if timestamps[middle % capacity] < ts:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def clear(self):
+        self.__init__(self.capacity)
+
+
+def _index(postings_by_code, code, seq):
+    postings = postings_by_code.get(code)
+    if postings is None:
+        postings = postings_by_code[code] = _Postings()
+    postings.append(seq)
+
+
+def _unindex(postings_by_code, code):
+    postings = postings_by_code[code]
+    postings.popleft()
+    if not postings:
+        del postings_by_code[code]
+
+
+def _lists(postings_by_code, codes):
+    return [postings_by_code[code] for code in codes if code in postings_by_code]
+
+
+def _descending(seqs, begin, stop):
+    for i in range(stop - 1, begin - 1, -1):
+        yield seqs[i]
@@ -0,0 +1,227 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from energy import HOUR
+
+# Report periods, by name
+PERIODS = ("day", "week", "month")
+
+
+class Tariff:
+    # Time-of-use price per kWh. `periods` are (start hour, end hour, price)
+    # in local time, end exclusive and allowed to wrap past midnight; every
+    # other hour costs `default`.
+
+    def __init__(self, default, periods=()):
+        self.default = default
+        self.periods = list(periods)
+        self.hourly_prices = np.full(24, float(default))
+        for start, end, price in self.periods:
+            self.hourly_prices[np.arange(start, end if end > start else end + 24) % 24] = price
+
+    @classmethod
+    def from_dict(cls, spec):
+        return cls(spec["default"], spec.get("periods", ()))
+
+
+class EnergySeries:
+    # Energy (Wh) per fixed-width bucket, the first starting at `start`
+    def __init__(self, start, step, wh):
+        self.start = start
+        self.step = step
+        self.wh = np.asarray(wh, dtype=np.float64)
+
+    @property
+    def times(self):
+        return self.start + self.step * np.arange(len(self.wh), dtype=np.float64)
+
+
+class PeriodReport:
+    # Energy of one report period: totals, per device and per local hour of day
+    def __init__(self, start, end, kwh, cost, device_kwh, hour_profile, closed):
+        self.start = start
+        self.end = end
+        self.kwh = kwh
+        self.cost = cost
+        self.device_kwh = device_kwh
+        self.hour_profile = hour_profile
+        self.closed = closed
+
+
+# Energy of [start, stop) read straight out of a meter's bucket ring, with
+# the energy drawn since its last change spread over the buckets it covers
+def meter_series(meter, start, stop, now, hourly=True):
+    buckets = meter.hour_buckets if hourly else meter.minute_buckets
+    width = buckets.width
+    first, last = int(start // width), int(-(-stop // width))
+    numbers = np.arange(first, last, dtype=np.int64)
+    stamps = _ring(np.frombuffer(buckets.stamp, dtype=np.int64), first, len(numbers))
+    wh = np.where(stamps == numbers, _ring(np.frombuffer(buckets.wh, dtype=np.float64), first, len(numbers)), 0.0)
+    since = meter.settled_until
+    if since is not None and meter.power and since < min(now, stop):
+        # Only the buckets from the last change on can have pending energy
+        low = max(int(since // width) - first, 0)
+        bucket_start = numbers[low:] * float(width)
+        overlap = np.minimum(bucket_start + width, now) - np.maximum(bucket_start, since)
+        wh[low:] += meter.power * np.clip(overlap, 0.0, None) / HOUR
+    return EnergySeries(first * width, width, wh)
+
+
+# Slots of buckets first..first+count-1 of a ring, by slicing instead of
+# indexing every element; past the retention the ring repeats (and the
+# stamps no longer match)
+def _ring(values, first, count):
+    slot = first % len(values)
+    if slot + count <= len(values):
+        return values[slot:slot + count]
+    return np.resize(np.concatenate((values[slot:], values[:slot])), count)
+
+
+# Hourly sums of a series of shorter buckets that divide the hour
+def hourly_series(series):
+    if series.step >= HOUR:
+        return series
+    first_hour = int(series.start // HOUR)
+    per_hour = HOUR // series.step
+    skip = int((series.start - first_hour * HOUR) // series.step)
+    offsets = np.arange(0, len(series.wh) + skip, per_hour, dtype=np.int64) - skip
+    offsets[0] = 0
+    return EnergySeries(first_hour * HOUR, HOUR, np.add.reduceat(series.wh, offsets) if len(series.wh) else series.wh)
+
+
+# Index of the first bucket of a series starting at or after each moment
+def bucket_edges(series, moments):
+    edges = np.ceil((np.asarray(moments) - series.start) / series.step)
+    return np.clip(edges, 0, len(series.wh)).astype(np.int64)
+
+
+# Start of the local period containing ts, as a datetime
+def period_start(ts, period):
+    day = datetime.fromtimestamp(ts).replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_period(start, period):
+    if period == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=7 if period == "week" else 1)
+
+
+# Epoch seconds of the local boundaries of `count` consecutive periods, the
+# last one containing `ts` (count + 1 values)
+def period_boundaries(ts, period, count):
+    start = period_start(ts, period)
+    for _ in range(count - 1):
+        start = period_start(start.timestamp() - 1, period)
+    boundaries = [start]
+    for _ in range(count):
+        boundaries.append(next_period(boundaries[-1], period))
+    return np.array([moment.timestamp() for moment in boundaries])
+
+
+# Local hour of day (0-23) of each bucket of an hourly series; one datetime
+# call per day, not per bucket
+def hour_of_day(series):
+    if len(series.wh) == 0:
+        return np.zeros(0, dtype=np.int64)
+    end = series.start + series.step * len(series.wh)
+    midnights = period_boundaries(end - 1, "day", int((end - series.start) // 86400) + 2)
+    edges = bucket_edges(series, midnights)
+    # The first midnight is at or before the series start, the last after its end
+    day = np.repeat(np.arange(len(midnights) - 1), np.diff(edges))
+    return np.minimum((series.times - midnights[day]) // HOUR, 23).astype(np.int64)
+
+
+# Sum of the values of each period [boundaries[i], boundaries[i + 1])
+def period_sums(series, values, boundaries):
+    cumulative = np.concatenate(([0.0], np.cumsum(values)))
+    edges = bucket_edges(series, boundaries)
+    return cumulative[edges[1:]] - cumulative[edges[:-1]]
+
+
+# Wh per local hour of day of each period, as a (periods, 24) array
+def hour_profiles(series, hours, boundaries):
+    edges = bucket_edges(series, boundaries)
+    inside = slice(edges[0], edges[-1])
+    period = np.repeat(np.arange(len(boundaries) - 1), np.diff(edges))
+    flat = np.bincount(period * 24 + hours[inside], weights=series.wh[inside],
+                       minlength=(len(boundaries) - 1) * 24)
+    return flat.reshape(len(boundaries) - 1, 24)
+
+
+# kWh, cost and hour-of-day profile (Wh) of a series over each period
+def aggregate(series, boundaries, tariff):
+    series = hourly_series(series)
+    hours = hour_of_day(series)
+    kwh = period_sums(series, series.wh, boundaries) / 1000
+    cost = period_sums(series, series.wh * tariff.hourly_prices[hours], boundaries) / 1000
+    return kwh, cost, hour_profiles(series, hours, boundaries)
+
+
+class EnergyAnalytics:
+    # Energy reports over a controller's total and per-device meters. Periods
+    # that ended before the meters settled never change again, so their
+    # reports are cached; a new report only computes the open period (and
+    # any period not seen before), all of them in one vectorized pass.
+
+    def __init__(self, controller, tariff):
+        self.controller = controller
+        self.tariff = tariff
+        self.computed = 0
+        self._cache = {}
+
+    def report(self, period, count, now=None):
+        now = self.controller.clock() if now is None else now
+        boundaries = period_boundaries(now, period, count)
+        reports = [self._cache.get((period, start)) for start in boundaries[:-1]]
+        missing = [i for i, report in enumerate(reports) if report is None]
+        if missing:
+            span = boundaries[missing[0]:missing[-1] + 2]
+            settled = self.controller.energy.settled_until
+            for i, report in zip(range(missing[0], missing[-1] + 1), self._compute(span, now)):
+                report.closed = settled is not None and bool(report.end <= settled)
+                if report.closed:
+                    self._cache[(period, report.start)] = report
+                if reports[i] is None:
+                    reports[i] = report
+        return reports
+
+    def _compute(self, boundaries, now):
+        start, stop = boundaries[0], boundaries[-1]
+        series = meter_series(self.controller.energy, start, stop, now)
+        kwh, cost, profiles = aggregate(series, boundaries, self.tariff)
+        device_kwh = {
+            device_id: period_sums(series, meter_series(meter, start, stop, now).wh, boundaries) / 1000
+            for device_id, meter in self.controller.device_energy.items()
+        }
+        self.computed += len(boundaries) - 1
+        return [
+            PeriodReport(float(boundaries[i]), float(boundaries[i + 1]), float(kwh[i]), float(cost[i]),
+                         {device_id: float(values[i]) for device_id, values in device_kwh.items()},
+                         profiles[i], False)
+            for i in range(len(boundaries) - 1)
+        ]
+
+
+# Local hours of day with the most energy use over the reports, highest first
+def peak_hours(reports, top=3):
+    profile = np.sum([report.hour_profile for report in reports], axis=0)
+    order = np.argsort(profile)[::-1][:top]
+    return [int(hour) for hour in order if profile[hour] > 0]
+
+
+# Each device's share of the energy over the reports, highest first
+def device_shares(reports):
+    totals = {}
+    for report in reports:
+        for device_id, kwh in report.device_kwh.items():
+            totals[device_id] = totals.get(device_id, 0.0) + kwh
+    total = sum(totals.values())
+    if total <= 0:
+        return []
+    return sorted(((device_id, kwh / total) for device_id, kwh in totals.items()), key=lambda item: -item[1])
@@ -0,0 +1,301 @@
+import asyncio
+import heapq
+import itertools
+import threading
+from datetime import datetime, timedelta
+
+# Recorded as the user of actions issued by rules, followed by the rule name
+AUTOMATION_USER = "Automation"
+
+
+# Whether a device counts as on; devices without an on/off switch (the fan)
+# are on while their value is above the minimum
+def is_on(device):
+    return device.on if device.toggle else device.value is not None and device.value > device.min_value
+
+
+class Command:
+    # A device change issued by a rule. on=False switches a device off (for
+    # the fan: sets the lowest speed); value sets the slider value. Commands
+    # that would not change anything are skipped, so nothing is logged.
+
+    def __init__(self, device, on=None, value=None):
+        self.device = device
+        self.on = on
+        self.value = value
+
+    def run(self, controller, user):
+        change = self.change(controller.device(self.device))
+        if change is not None:
+            _, on, value = change
+            if on is not None:
+                controller.set_on(self.device, on, user=user)
+            if value is not None:
+                controller.set_value(self.device, value, user=user)
+
+    # (device_id, on, value) for HomeController.apply_batch, None if the
+    # device is already in the commanded state
+    def change(self, device):
+        on = value = None
+        if self.on is not None and is_on(device) != self.on:
+            if device.toggle:
+                on = self.on
+            elif not self.on:
+                value = device.min_value
+        if self.value is not None and device.value != device.value_type(self.value):
+            value = self.value
+        return None if on is None and value is None else (self.device, on, value)
+
+    def __repr__(self):
+        return f"Command({self.device!r}, on={self.on!r}, value={self.value!r})"
+
+
+class Scene:
+    # Named set of commands applied together as one batch: one log entry,
+    # one power recompute and one notification, however many devices change
+
+    def __init__(self, name, commands):
+        self.name = name
+        self.commands = list(commands)
+
+    def run(self, controller, user=None):
+        changes = [command.change(controller.device(command.device)) for command in self.commands]
+        return controller.apply_batch(self.name, [change for change in changes if change is not None], user=user)
+
+
+# Build a scene from a dict, e.g.
+#   {"name": "Night mode", "devices": {"light1": {"on": False}, "thermostat": {"on": True, "value": 19}}}
+def scene_from_dict(spec):
+    return Scene(spec["name"], [
+        Command(device_id, on=state.get("on"), value=state.get("value"))
+        for device_id, state in spec["devices"].items()
+    ])
+
+
+class TimeRule:
+    # Runs its command every day at `at` ("HH:MM", local time)
+
+    def __init__(self, name, at, command):
+        self.name = name
+        self.at = at
+        hour, minute = at.split(":")
+        self.hour, self.minute = int(hour), int(minute)
+        self.command = command
+
+    # Epoch seconds of the first run after `now`
+    def next_run(self, now):
+        moment = datetime.fromtimestamp(now).replace(hour=self.hour, minute=self.minute, second=0, microsecond=0)
+        if moment.timestamp() <= now:
+            moment += timedelta(days=1)
+        return moment.timestamp()
+
+
+class ConditionRule:
+    # Runs its command when when(device) becomes true for the watched device.
+    # Edge-triggered: it fires again only after the condition was false.
+
+    def __init__(self, name, watch, when, command):
+        self.name = name
+        self.watch = watch
+        self.when = when
+        self.command = command
+        self.active = False
+
+
+class PowerCapRule:
+    # Keeps the total power at or below `limit` watts. While it is above,
+    # every change switches off the next device of `shed` that draws power;
+    # without a shed list, the (first) device whose change pushed it over.
+
+    def __init__(self, name, limit, shed=()):
+        self.name = name
+        self.limit = limit
+        self.shed = list(shed)
+
+    def command(self, controller, change):
+        if controller.power() <= self.limit:
+            return None
+        if self.shed:
+            candidates = [controller.device(device_id) for device_id in self.shed]
+        else:
+            candidates = change.devices
+        for device in candidates:
+            if controller.registry.device_power(device.id) > 0:
+                return Command(device.id, on=False)
+        return None
+
+
+# Named conditions for rules written as data
+CONDITIONS = {
+    "on": is_on,
+    "off": lambda device: not is_on(device),
+}
+
+
+# Build a rule from a dict, e.g.
+#   {"type": "time", "name": "Lock door", "at": "23:00", "device": "door1", "on": True}
+#   {"type": "condition", "name": "...", "watch": "thermostat", "when": "off", "device": "fan", "on": False}
+#   {"type": "power_cap", "name": "...", "limit": 200, "shed": ["fan", "thermostat"]}
+def rule_from_dict(spec):
+    kind = spec["type"]
+    if kind == "power_cap":
+        return PowerCapRule(spec["name"], spec["limit"], spec.get("shed", ()))
+    command = Command(spec["device"], on=spec.get("on"), value=spec.get("value"))
+    if kind == "time":
+        return TimeRule(spec["name"], spec["at"], command)
+    if kind == "condition":
+        return ConditionRule(spec["name"], spec["watch"], CONDITIONS[spec["when"]], command)
+    raise ValueError(f"unknown rule type: {kind!r}")
+
+
+class AutomationEngine:
+    # Runs rules on an asyncio loop in a background thread.
+    #
+    # Time rules wait in a heap ordered by their next run, behind a single
+    # loop timer for the earliest one. Condition rules are indexed by the
+    # device they watch, so a change only evaluates the rules of its device
+    # (plus the power caps). Nothing polls: when no change arrives and no
+    # timer is due, the loop is blocked, whatever the number of rules.
+    # Rule state is only touched on the loop thread.
+
+    def __init__(self, controller, user=AUTOMATION_USER):
+        self.controller = controller
+        self.clock = controller.clock
+        self.user = user
+        self.fired = 0
+        self.evaluated = 0
+        self.errors = 0
+        self._timers = []
+        self._order = itertools.count()
+        self._watchers = {}
+        self._power_rules = []
+        self._rules = {}
+        self._timer = None
+        self._timer_due = None
+        self._loop = None
+        self._thread = None
+        self._unsubscribe = None
+
+    def rules(self):
+        return list(self._rules.values())
+
+    def add(self, rule):
+        self._call(self._add, rule)
+        return rule
+
+    def remove(self, rule):
+        self._call(self._remove, rule)
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, args=(ready,), name="automation", daemon=True)
+        self._thread.start()
+        ready.wait()
+        self._unsubscribe = self.controller.subscribe(self._changed)
+        self._loop.call_soon_threadsafe(self._arm)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._unsubscribe()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._thread = self._loop = self._timer = self._timer_due = None
+
+    # Wait until everything queued on the loop so far has run
+    def drain(self):
+        if self._loop is not None:
+            done = threading.Event()
+            self._loop.call_soon_threadsafe(done.set)
+            done.wait()
+
+    def _run_loop(self, ready):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop.call_soon(ready.set)
+        self._loop.run_forever()
+
+    def _call(self, function, *args):
+        if self._loop is None:
+            function(*args)
+        else:
+            self._loop.call_soon_threadsafe(function, *args)
+
+    def _add(self, rule):
+        self._rules[id(rule)] = rule
+        if isinstance(rule, TimeRule):
+            heapq.heappush(self._timers, (rule.next_run(self.clock()), next(self._order), rule))
+            self._arm()
+        elif isinstance(rule, ConditionRule):
+            self._watchers.setdefault(rule.watch, []).append(rule)
+            if rule.watch in self.controller.registry:
+                rule.active = bool(rule.when(self.controller.device(rule.watch)))
+        else:
+            self._power_rules.append(rule)
+
+    def _remove(self, rule):
+        # Removed time rules are dropped from the heap when they come due
+        if self._rules.pop(id(rule), None) is None:
+            return
+        if isinstance(rule, ConditionRule):
+            self._watchers[rule.watch].remove(rule)
+        elif isinstance(rule, PowerCapRule):
+            self._power_rules.remove(rule)
+
+    # Point the loop timer at the earliest time rule
+    def _arm(self):
+        due = self._timers[0][0] if self._timers else None
+        if self._loop is None or (self._timer is not None and due == self._timer_due):
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if due is not None:
+            self._timer = self._loop.call_later(max(due - self.clock(), 0), self._fire_due)
+            self._timer_due = due
+
+    def _fire_due(self):
+        self._timer = None
+        now = self.clock()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, rule = heapq.heappop(self._timers)
+            if id(rule) not in self._rules:
+                continue
+            self._run(rule, rule.command)
+            heapq.heappush(self._timers, (rule.next_run(now), next(self._order), rule))
+        self._arm()
+
+    # Controller listener; runs on the thread that issued the command
+    def _changed(self, change):
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self._evaluate, change)
+
+    def _evaluate(self, change):
+        for device in change.devices:
+            for rule in self._watchers.get(device.id, ()):
+                self.evaluated += 1
+                active = bool(rule.when(device))
+                if active and not rule.active:
+                    self._run(rule, rule.command)
+                rule.active = active
+        for rule in self._power_rules:
+            self.evaluated += 1
+            command = rule.command(self.controller, change)
+            if command is not None:
+                self._run(rule, command)
+
+    def _run(self, rule, command):
+        self.fired += 1
+        try:
+            command.run(self.controller, user=f"{self.user}: {rule.name}")
+        except (KeyError, ValueError, TypeError) as e:
+            self.errors += 1
+            self.controller.log("system", f"Rule '{rule.name}' failed: {e}")
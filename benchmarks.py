@@ -0,0 +1,569 @@
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from itertools import islice
+
+from action_log import ActionLog
+from automation import AutomationEngine, Command, ConditionRule, CONDITIONS, Scene, TimeRule
+from energy import EnergyMeter, MINUTE
+from home_controller import HomeController
+from instrumentation import INSTRUMENTS, Instruments
+from loadgen import LoadGenerator, SimulatedClock, household
+from storage import HomeStore
+from telemetry import TelemetryIngestor, TelemetryPublisher
+
+# Default file for --save-baseline / --compare
+BASELINE_PATH = "benchmarks_baseline.json"
+
+# Allowed slowdown (or growth of per-op costs) before a result counts as a regression
+REGRESSION_TOLERANCE = 0.25
+
+# Action log sizes the scaling benchmarks are run at
+LOG_SIZES = (10 ** 3, 10 ** 5, 10 ** 6)
+
+# Stored history sizes the past-state reconstruction benchmark is run at
+HISTORY_SIZES = (10 ** 4, 10 ** 5)
+
+
+class FakePage:
+    # Stand-in for ft.Page that records update() calls instead of talking to
+    # a client. Attributes the app sets (title, padding, ...) are just stored.
+
+    def __init__(self, count_controls=False):
+        self.controls = []
+        self.update_count = 0
+        self.controls_sent = 0
+        self.count_controls = count_controls
+        self.on_close = None
+
+    def add(self, *controls):
+        self.controls.extend(controls)
+        self.update()
+
+    def update(self, *controls):
+        self.update_count += 1
+        if self.count_controls:
+            self.controls_sent += sum(1 for root in self.controls for _ in walk(root))
+
+
+def walk(control):
+    yield control
+    for child in control._get_children():
+        yield from walk(child)
+
+
+class _ClickEvent:
+    def __init__(self, control):
+        self.control = control
+        self.data = None
+
+
+class _ScrollEvent(_ClickEvent):
+    def __init__(self, control, pixels):
+        super().__init__(control)
+        self.pixels = pixels
+
+
+def find(root, predicate):
+    return [control for control in walk(root) if predicate(control)]
+
+
+def click(control):
+    control.on_click(_ClickEvent(control))
+
+
+class ControlCounter:
+    # Counts flet controls constructed while active
+    def __init__(self, ft):
+        self.ft = ft
+        self.count = 0
+        self._original = None
+
+    def __enter__(self):
+        original = self._original = self.ft.Control.__init__
+
+        def counting_init(control, *args, **kwargs):
+            self.count += 1
+            original(control, *args, **kwargs)
+
+        self.ft.Control.__init__ = counting_init
+        return self
+
+    def __exit__(self, *exc):
+        self.ft.Control.__init__ = self._original
+
+
+def measure(fn, ops, page=None, counter=None):
+    gc.collect()
+    updates = page.update_count if page is not None else 0
+    created = counter.count if counter is not None else 0
+    start = time.perf_counter()
+    for i in range(ops):
+        fn(i)
+    elapsed = time.perf_counter() - start
+    result = {"ops_per_sec": round(ops / elapsed, 1)}
+    if page is not None:
+        result["updates_per_op"] = round((page.update_count - updates) / ops, 3)
+    if counter is not None:
+        result["controls_per_op"] = round((counter.count - created) / ops, 3)
+
+    # Separate, shorter pass for memory so tracing does not skew the timing
+    sample = max(ops // 10, 1)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(sample):
+        fn(i)
+    result["bytes_per_op"] = round((tracemalloc.get_traced_memory()[0] - before) / sample, 1)
+    tracemalloc.stop()
+    return result
+
+
+def core_benchmarks(ops):
+    results = {}
+    controller = HomeController()
+    thermostat = controller.device("thermostat")
+    values = [thermostat.min_value + (i % thermostat.divisions) * 0.5 for i in range(thermostat.divisions)]
+    results["core.add_action"] = measure(lambda i: controller.log("bench", "Ping"), ops)
+    results["core.calculate_power"] = measure(lambda i: controller.power(), ops)
+    results["core.toggle"] = measure(lambda i: controller.toggle("light1"), ops)
+    results["core.set_value"] = measure(lambda i: controller.set_value("thermostat", values[i % len(values)]), ops)
+
+    # Four device changes as one scene vs. as four commands
+    scenes = [Scene(f"Scene {k}", [Command("light1", on=k == 0), Command("door1", on=k == 1),
+                                   Command("thermostat", value=19 + k), Command("fan", value=1 + k)])
+              for k in range(2)]
+    results["core.scene"] = measure(lambda i: scenes[i % 2].run(controller), ops)
+    results["core.scene_as_commands"] = measure(
+        lambda i: [command.run(controller, user=None) for command in scenes[i % 2].commands], ops
+    )
+    return results
+
+
+def scale_benchmarks(ops, sizes=LOG_SIZES):
+    results = {}
+    for size in sizes:
+        controller = HomeController(log_capacity=size)
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for i in range(size):
+            controller.log("bench", "Ping")
+        log_bytes = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        results[f"scale.log_bytes_per_entry@{size}"] = {"bytes_per_op": round(log_bytes / size, 1)}
+        results[f"scale.toggle@{size}"] = measure(lambda i: controller.toggle("light1"), ops)
+        results[f"scale.recent_for_device@{size}"] = measure(
+            lambda i: controller.recent_actions(5, device="light1"), ops
+        )
+    return results
+
+
+class DictLog:
+    # The previous action log layout, kept as the reference point for the
+    # record format benchmarks: one formatted dict per entry in a ring buffer
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = [None] * capacity
+        self.next_seq = 0
+
+    def append(self, timestamp, device, action, user):
+        self.entries[self.next_seq % self.capacity] = {
+            "timestamp": timestamp,
+            "time": datetime.fromtimestamp(timestamp).strftime("%H:%M:%S"),
+            "device": device,
+            "action": action,
+            "user": user
+        }
+        self.next_seq += 1
+
+
+def record_format_benchmarks(ops, size=LOG_SIZES[1]):
+    # Bytes per retained entry and append cost of the dict form against the
+    # columnar ActionLog, with the same mix of devices and actions
+    results = {}
+    names = ["light1", "door1", "thermostat", "fan"]
+    actions = ["Turn ON", "Turn OFF", "Lock", "Unlock"] + [f"Set to {t / 2:.1f}°C" for t in range(20, 61)]
+    start = 1.7e9
+    for name, factory in (("dict", DictLog), ("compact", ActionLog)):
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        # Construction is traced too, since the compact log preallocates its columns
+        log = factory(size)
+
+        def append(i, log=log):
+            log.append(start + i, names[i % len(names)], actions[i % len(actions)], "User")
+
+        for i in range(size):
+            append(i)
+        log_bytes = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        results[f"records.{name}.bytes_per_entry"] = {"bytes_per_op": round(log_bytes / size, 1)}
+        timing = measure(append, ops)
+        results[f"records.{name}.append"] = {"ops_per_sec": timing["ops_per_sec"]}
+    return results
+
+
+def query_benchmarks(ops, size=LOG_SIZES[-1]):
+    # Filtered queries (first 100 matches) over a log of realistic entries
+    devices = HomeController().devices()
+    log = ActionLog(size)
+    start = 1.7e9
+    for i in range(size):
+        device = devices[i % len(devices)]
+        if device.has_value:
+            device.value = device.min_value + (i // len(devices)) % (device.divisions + 1) * (
+                (device.max_value - device.min_value) / device.divisions)
+            action = device.value_text()
+        else:
+            device.on = (i // len(devices)) % 2 == 0
+            action = device.toggle_action()
+        log.append(start + i, device.id, action, "Guest" if i % 7 == 0 else "User")
+    middle = start + size / 2
+    queries = {
+        "device": {"device": "thermostat"},
+        "device_action": {"device": "door1", "action": "Unlock"},
+        "device_time_range": {"device": "thermostat", "start": middle, "end": middle + 4 * 3600},
+        "action_prefix": {"action": "Set to"},
+        "text": {"text": "door unlock"},
+        "text_user": {"text": "guest fan"},
+        "no_match": {"device": "light1", "action": "Unlock"},
+    }
+    results = {}
+    for name, filters in queries.items():
+        results[f"query.{name}@{size}"] = measure(lambda i: list(islice(log.query(**filters), 100)), ops)
+    return results
+
+
+def automation_benchmarks(ops, rules=5000):
+    # Changes with thousands of rules registered, most of them watching other
+    # devices or waiting on timers, and the CPU used while nothing happens
+    controller = HomeController()
+    engine = AutomationEngine(controller)
+    for i in range(rules):
+        engine.add(TimeRule(f"time {i}", f"{i % 24:02d}:{i % 60:02d}", Command("light1", on=i % 2 == 0)))
+        engine.add(ConditionRule(f"condition {i}", f"sensor{i % 500}", CONDITIONS["on"], Command("fan", on=False)))
+    engine.add(ConditionRule("door watcher", "door1", CONDITIONS["on"], Command("door1", on=True)))
+    engine.start()
+    try:
+        def toggle(i):
+            controller.toggle("door1")
+            if i % 100 == 99:
+                engine.drain()
+
+        result = measure(toggle, ops)
+        engine.drain()
+        result["rules_evaluated_per_op"] = round(engine.evaluated / (ops + max(ops // 10, 1)), 3)
+        idle = time.process_time()
+        time.sleep(1)
+        results = {f"automation.toggle@{2 * rules}_rules": result,
+                   f"automation.idle@{2 * rules}_rules": {"cpu_seconds_per_sec": round(time.process_time() - idle, 4)}}
+    finally:
+        engine.stop()
+    return results
+
+
+def instrumentation_benchmarks(ops):
+    # Cost of the timing wrapper on an empty function, off and on, and of a
+    # fully instrumented toggle with instrumentation off and on
+    results = {}
+    instruments = Instruments()
+    timed = instruments.timed("bench.noop")(lambda i: None)
+    results["instrumentation.bare_call"] = measure(lambda i: None, ops * 10)
+    results["instrumentation.timed_call_off"] = measure(timed, ops * 10)
+    instruments.enable()
+    results["instrumentation.timed_call_on"] = measure(timed, ops * 10)
+
+    controller = HomeController()
+    enabled = INSTRUMENTS.enabled
+    try:
+        for state in (False, True):
+            INSTRUMENTS.enable(state)
+            results[f"instrumentation.toggle_{'on' if state else 'off'}"] = measure(
+                lambda i: controller.toggle("light1"), ops * 10
+            )
+    finally:
+        INSTRUMENTS.enable(enabled)
+    return results
+
+
+def telemetry_benchmarks(ops, batch=1000, messages=200000):
+    # Applying coalesced batches of device messages, and the whole pipeline
+    # (bounded queue, worker, controller) with the refresh cap lifted
+    controller = HomeController()
+    publisher = TelemetryPublisher(controller.devices(), seed=0)
+    batches = [list(publisher.messages(batch)) for _ in range(10)]
+    ingestor = TelemetryIngestor(controller)
+    result = measure(lambda i: ingestor.apply(batches[i % len(batches)]), max(ops // 10, 3))
+    result["messages_per_sec"] = round(result["ops_per_sec"] * batch, 1)
+    results = {f"telemetry.apply_batch@{batch}": result}
+
+    ingestor = TelemetryIngestor(controller, max_rate=None)
+    stream = list(publisher.messages(messages))
+    ingestor.start()
+    start = time.perf_counter()
+    for message in stream:
+        ingestor.submit(message)
+    ingestor.stop()
+    elapsed = time.perf_counter() - start
+    results["telemetry.pipeline"] = {"messages_per_sec": round(messages / elapsed, 1),
+                                     "messages_per_batch": round(messages / max(ingestor.batches, 1), 1)}
+    return results
+
+
+def analytics_benchmarks(ops, days=365):
+    # A year of per-minute energy aggregated into days, weeks and months with
+    # time-of-use cost, and energy reports with the closed-period cache
+    try:
+        import analytics
+    except ImportError:
+        return {}
+    np = analytics.np
+    minutes = days * 24 * 60
+    now = time.time()
+    meter = EnergyMeter(minute_retention=minutes)
+    buckets = meter.minute_buckets
+    numbers = np.arange(int(now // MINUTE) - minutes + 1, int(now // MINUTE) + 1, dtype=np.int64)
+    np.frombuffer(buckets.stamp, dtype=np.int64)[numbers % minutes] = numbers
+    np.frombuffer(buckets.wh, dtype=np.float64)[numbers % minutes] = np.random.default_rng(0).uniform(0.0, 5.0, minutes)
+    tariff = analytics.Tariff(0.20, [(0, 7, 0.12), (17, 21, 0.32)])
+    start = numbers[0] * MINUTE
+
+    results = {}
+    for period, count in (("day", days), ("week", days // 7), ("month", 12)):
+        boundaries = analytics.period_boundaries(now, period, count)
+        results[f"analytics.year_of_minutes_by_{period}"] = measure(
+            lambda i: analytics.aggregate(analytics.meter_series(meter, start, now, now, hourly=False), boundaries, tariff),
+            max(ops // 100, 3),
+        )
+
+    controller = HomeController()
+    for i in range(1000):
+        controller.toggle(("light1", "thermostat")[i % 2])
+    reports = analytics.EnergyAnalytics(controller, tariff)
+    results["analytics.report_days_cold"] = measure(
+        lambda i: analytics.EnergyAnalytics(controller, tariff).report("day", 30), max(ops // 10, 3)
+    )
+    results["analytics.report_days_cached"] = measure(lambda i: reports.report("day", 30), ops)
+    return results
+
+
+def history_benchmarks(ops, sizes=HISTORY_SIZES):
+    # Reconstructing the state at a random past moment should cost the same
+    # however long the stored history is: one checkpoint lookup plus at most
+    # one checkpoint interval of replay
+    results = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "history.db")
+            now = [1.7e9]
+            store = HomeStore(path)
+            store.start()
+            controller = HomeController(log_capacity=1000, store=store, clock=lambda: now[0])
+            thermostat = controller.device("thermostat")
+            for i in range(size):
+                now[0] += 10
+                if i % 3:
+                    controller.toggle(("light1", "door1", "thermostat")[i % 3])
+                else:
+                    controller.set_value("thermostat", thermostat.min_value + (i % thermostat.divisions) * 0.5)
+            controller.close()
+            start, end = 1.7e9, now[0]
+            store = HomeStore(path)
+            controller = HomeController(store=store, clock=lambda: end)
+            controller.restore()
+            moments = random.Random(0).sample(range(int(start), int(end)), min(ops, 1000))
+            replayed = []
+            result = measure(lambda i: replayed.append(controller.state_at(moments[i % len(moments)]).replayed), ops)
+            result["replayed_per_op"] = round(sum(replayed) / len(replayed), 1)
+            results[f"history.state_at@{size}"] = result
+            store.close()
+    return results
+
+
+def load_benchmarks(days=7, devices=24, rate=600, log_capacity=1000):
+    # A seeded week of household events on a simulated clock. The log wraps
+    # many times over, so its size shows whether anything accumulates beyond
+    # the entries it keeps.
+    clock = SimulatedClock()
+    controller = HomeController(household(devices), log_capacity=log_capacity, clock=clock)
+    report = LoadGenerator(controller, clock, seed=0, rate=rate).run(days * 86400)
+    result = {"events_per_sec": round(report.events_per_sec, 1)}
+    for kind, histogram in sorted(report.latency.items()):
+        result[f"{kind}_p99_ms"] = round(histogram.percentile(99) / 1e6, 4)
+    result["log_bytes"] = controller.action_log.nbytes
+    return {f"load.household_week@{devices}": result}
+
+
+def ui_benchmarks(ops):
+    try:
+        import flet as ft
+    except ImportError:
+        print("flet is not installed; skipping UI benchmarks", file=sys.stderr)
+        return {}
+    import individual_task3 as app
+
+    # Flush on every event so updates_per_op is the round-trips of one interaction
+    app.RENDER_MAX_FPS = None
+    results = {}
+    page = FakePage()
+    controller = HomeController()
+    with ControlCounter(ft) as counter:
+        views = app.main(page, controller)
+        results["ui.first_frame"] = {"first_frame_ms": round(views.first_frame_ms, 2)}
+        overview = page.controls[0]
+
+        def button(text):
+            return find(overview, lambda c: getattr(c, "text", None) == text and getattr(c, "on_click", None))[0]
+
+        def toggle_button(device_id):
+            # The toggle button sits next to the device's Details button in its card
+            card_rows = find(overview, lambda c: isinstance(c, ft.Row) and any(
+                isinstance(child, ft.ElevatedButton) for child in c.controls))
+            toggles = [control for row in card_rows for control in row.controls
+                       if isinstance(control, ft.ElevatedButton) and control.text in ("ON", "OFF")]
+            # Cards are laid out on/off devices first, then slider devices
+            devices = [device for device in controller.devices() if device.toggle and not device.has_value]
+            devices += [device for device in controller.devices() if device.toggle and device.has_value]
+            return toggles[[device.id for device in devices].index(device_id)]
+
+        for device in controller.devices():
+            if device.toggle:
+                control = toggle_button(device.id)
+                results[f"ui.toggle[{device.id}]"] = measure(lambda i: click(control), ops, page, counter)
+
+        sliders = find(overview, lambda c: isinstance(c, ft.Slider))
+        for device, slider in zip([d for d in controller.devices() if d.has_value], sliders):
+            steps = [device.min_value + (device.max_value - device.min_value) * k / device.divisions
+                     for k in range(device.divisions + 1)]
+
+            def commit(i, slider=slider, steps=steps):
+                slider.value = steps[i % len(steps)]
+                slider.on_change_end(_ClickEvent(slider))
+
+            results[f"ui.slider_commit[{device.id}]"] = measure(commit, ops, page, counter)
+
+        # A scene changes every device in one batch: one log entry, one render
+        scenes = [button(spec["name"]) for spec in app.SCENES]
+        results["ui.scene"] = measure(lambda i: click(scenes[i % len(scenes)]), ops, page, counter)
+
+        statistics = button("Statistics")
+        overview_button = button("Overview")
+        results["ui.show_statistics"] = measure(
+            lambda i: click(statistics if i % 2 == 0 else overview_button), ops, page, counter
+        )
+
+        # With Statistics on screen every action also updates the log table
+        click(statistics)
+        light = toggle_button("light1")
+        results["ui.toggle_on_statistics"] = measure(lambda i: click(light), ops, page, counter)
+
+        # Scrolling the History view only refills its fixed window of rows
+        click(button("History"))
+        history = find(page.controls[0], lambda c: isinstance(c, ft.ListView))[0]
+        rows = len(controller.action_log)
+        results["ui.history_scroll"] = measure(
+            lambda i: history.on_scroll(_ScrollEvent(history, (i * 7919 % rows) * app.HISTORY_ROW_HEIGHT)),
+            ops, page, counter
+        )
+
+        # Build once and average navigation time of every view, Details included
+        click(button("Overview"))
+        click(button("Details"))
+        for name, timing in views.timings.items():
+            if timing.visits:
+                results[f"ui.view[{name}]"] = {
+                    "build_ms": round(timing.build_ms, 2),
+                    "navigate_ms": round(timing.average_ms, 3),
+                }
+
+    # Controls sent per update, on a separate page with counting enabled
+    page = FakePage(count_controls=True)
+    app.main(page, HomeController())
+    light = find(page.controls[0], lambda c: isinstance(c, ft.ElevatedButton) and c.text in ("ON", "OFF"))[0]
+    sent = page.controls_sent
+    updates = page.update_count
+    for i in range(min(ops, 200)):
+        click(light)
+    results["ui.controls_per_update"] = {
+        "controls_per_update": round((page.controls_sent - sent) / max(page.update_count - updates, 1), 1)
+    }
+    return results
+
+
+def run(ops=2000, sizes=LOG_SIZES, ui=True):
+    results = {}
+    results.update(core_benchmarks(ops * 10))
+    results.update(scale_benchmarks(ops, sizes))
+    results.update(record_format_benchmarks(ops * 10))
+    results.update(query_benchmarks(ops, sizes[-1]))
+    results.update(automation_benchmarks(ops))
+    results.update(instrumentation_benchmarks(ops))
+    results.update(telemetry_benchmarks(ops))
+    results.update(analytics_benchmarks(ops))
+    results.update(history_benchmarks(ops))
+    results.update(load_benchmarks())
+    if ui:
+        results.update(ui_benchmarks(ops))
+    return results
+
+
+# Metrics where higher is better; every other metric is a per-op cost
+HIGHER_IS_BETTER = {"ops_per_sec", "messages_per_sec", "events_per_sec"}
+
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(name, {}).get(metric)
+            if old is None:
+                continue
+            if metric in HIGHER_IS_BETTER:
+                if value < old * (1 - tolerance):
+                    regressions.append((name, metric, old, value))
+            elif value > old * (1 + tolerance) + 0.01:
+                regressions.append((name, metric, old, value))
+    return regressions
+
+
+def print_results(results):
+    width = max(len(name) for name in results)
+    for name, metrics in results.items():
+        print(f"{name:<{width}}  " + "  ".join(f"{metric}={value}" for metric, value in metrics.items()))
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the smart home controller hot paths")
+    parser.add_argument("--ops", type=int, default=2000, help="operations per benchmark")
+    parser.add_argument("--quick", action="store_true", help="skip the 10^6 action log size")
+    parser.add_argument("--no-ui", action="store_true", help="only run the headless benchmarks")
+    parser.add_argument("--save-baseline", nargs="?", const=BASELINE_PATH, help="write results as the baseline")
+    parser.add_argument("--compare", nargs="?", const=BASELINE_PATH, help="compare against a saved baseline")
+    args = parser.parse_args(argv)
+
+    sizes = LOG_SIZES[:-1] if args.quick else LOG_SIZES
+    results = run(args.ops, sizes, ui=not args.no_ui)
+    print_results(results)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"baseline written to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f))
+        for name, metric, old, new in regressions:
+            print(f"REGRESSION {name} {metric}: {old} -> {new}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,182 @@
+import math
+
+
+# Power models: called with a device, return its current draw in watts
+
+class FixedPower:
+    # Constant draw while the device is on
+    def __init__(self, watts):
+        self.watts = watts
+
+    def __call__(self, device):
+        return self.watts if device.on else 0
+
+
+class SetPointPower:
+    # Base draw plus a cost per degree between the set point and a reference
+    def __init__(self, base, per_degree, reference=20):
+        self.base = base
+        self.per_degree = per_degree
+        self.reference = reference
+
+    def __call__(self, device):
+        if not device.on or device.value is None:
+            return 0
+        return self.base + abs(device.value - self.reference) * self.per_degree
+
+
+class LevelPower:
+    # Draw proportional to the level (e.g. fan speed); level 0 is off
+    def __init__(self, watts_per_level):
+        self.watts_per_level = watts_per_level
+
+    def __call__(self, device):
+        return (device.value or 0) * self.watts_per_level
+
+
+class Device:
+    # One controllable device. `on` is the on/off (or locked) flag, `value`
+    # the slider value for devices that have one. The action texts are what
+    # ends up in the action log.
+
+    def __init__(self, device_id, name, kind, power_model, on=False, value=None,
+                 toggle=True, value_type=float, min_value=None, max_value=None, divisions=None,
+                 on_action="Turn ON", off_action="Turn OFF", value_action=None, hint=""):
+        self.id = device_id
+        self.name = name
+        self.kind = kind
+        self.power_model = power_model
+        self.on = on
+        self.value = value
+        self.toggle = toggle
+        self.value_type = value_type
+        self.min_value = min_value
+        self.max_value = max_value
+        self.divisions = divisions
+        self.on_action = on_action
+        self.off_action = off_action
+        self.value_action = value_action
+        self.hint = hint
+
+    @property
+    def has_value(self):
+        return self.value_action is not None
+
+    def power(self):
+        return self.power_model(self)
+
+    def toggle_action(self):
+        return self.on_action if self.on else self.off_action
+
+    def value_text(self):
+        return self.value_action.format(value=self.value)
+
+    # Kinds of action this device logs; value actions by their fixed prefix
+    def action_types(self):
+        types = [self.on_action, self.off_action] if self.toggle else []
+        if self.has_value:
+            types.append(self.value_action.split("{")[0].strip())
+        return types
+
+
+# Factories for the device types the dashboard knows how to show
+
+def light(device_id, name, watts=60):
+    return Device(device_id, name, "light", FixedPower(watts), hint=f"{watts}W when ON")
+
+
+def door_lock(device_id, name, watts=5):
+    return Device(device_id, name, "door", FixedPower(watts),
+                  on_action="Lock", off_action="Unlock", hint=f"{watts}W when locked")
+
+
+def thermostat(device_id, name, set_point=22.0, base=50, per_degree=10, min_value=15, max_value=30):
+    return Device(device_id, name, "thermostat", SetPointPower(base, per_degree), value=set_point,
+                  min_value=min_value, max_value=max_value, divisions=(max_value - min_value) * 2,
+                  value_action="Set to {value:.1f}°C",
+                  hint=f"Base {base}W + {per_degree}W per °C diff")
+
+
+def fan(device_id, name, watts_per_level=30, max_level=3):
+    return Device(device_id, name, "fan", LevelPower(watts_per_level), value=0, toggle=False, value_type=int,
+                  min_value=0, max_value=max_level, divisions=max_level,
+                  value_action="Speed set to {value}", hint=f"{watts_per_level}W per speed level")
+
+
+def default_devices():
+    return [
+        light("light1", "Living Room Light"),
+        door_lock("door1", "Front Door"),
+        thermostat("thermostat", "Thermostat"),
+        fan("fan", "Ceiling Fan"),
+    ]
+
+
+class DeviceRegistry:
+    # Devices by id, in insertion order, with a running power total.
+    # A state change adjusts the total by that device's delta instead of
+    # re-evaluating every device.
+
+    def __init__(self, devices=()):
+        self._devices = {}
+        self._power = {}
+        self.total_power = 0.0
+        for device in devices:
+            self.add(device)
+
+    def add(self, device):
+        if device.id in self._devices:
+            raise ValueError(f"duplicate device id: {device.id}")
+        self._devices[device.id] = device
+        watts = device.power()
+        self._power[device.id] = watts
+        self.total_power += watts
+        return device
+
+    def remove(self, device_id):
+        device = self._devices.pop(device_id)
+        self.total_power -= self._power.pop(device_id)
+        return device
+
+    def get(self, device_id):
+        return self._devices[device_id]
+
+    def __contains__(self, device_id):
+        return device_id in self._devices
+
+    def __iter__(self):
+        return iter(self._devices.values())
+
+    def __len__(self):
+        return len(self._devices)
+
+    # Change a device's state and return the change in total power
+    def update(self, device_id, on=None, value=None):
+        device = self._devices[device_id]
+        if on is not None:
+            device.on = on
+        if value is not None:
+            device.value = device.value_type(value)
+        watts = device.power()
+        delta = watts - self._power[device_id]
+        self._power[device_id] = watts
+        self.total_power += delta
+        return delta
+
+    # Use a measured draw for a device until its state next changes
+    def report_power(self, device_id, watts):
+        delta = watts - self._power[device_id]
+        self._power[device_id] = watts
+        self.total_power += delta
+        return delta
+
+    def device_power(self, device_id):
+        return self._power[device_id]
+
+    def power(self):
+        return round(self.total_power, 1)
+
+    # Re-sum every device exactly, dropping accumulated float error
+    def recalculate(self):
+        self.total_power = math.fsum(self._power.values())
+        return self.power()
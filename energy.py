@@ -0,0 +1,144 @@
+import time
+from array import array
+from datetime import datetime, timedelta
+
+MINUTE = 60
+HOUR = 3600
+
+# Default retention: one week of minutes, a bit over a year of hours
+DEFAULT_MINUTE_RETENTION = 7 * 24 * 60
+DEFAULT_HOUR_RETENTION = 400 * 24
+
+
+class _Buckets:
+    # Ring of energy buckets indexed by bucket number (epoch seconds // width).
+    # A slot whose stamp does not match the requested bucket has been reused
+    # (or never written) and reads as 0.
+
+    def __init__(self, width, retention):
+        self.width = width
+        self.retention = retention
+        self.wh = array("d", [0.0]) * retention
+        self.stamp = array("q", [-1]) * retention
+
+    def add(self, bucket, wh):
+        slot = bucket % self.retention
+        if self.stamp[slot] != bucket:
+            self.stamp[slot] = bucket
+            self.wh[slot] = 0.0
+        self.wh[slot] += wh
+
+    def get(self, bucket):
+        slot = bucket % self.retention
+        return self.wh[slot] if self.stamp[slot] == bucket else 0.0
+
+
+class EnergyMeter:
+    # Integrates power (W) over time into energy (Wh). record() is called with
+    # the new total power whenever it changes; the previous power is integrated
+    # over the time it was drawn into minute buckets, which also roll up into
+    # hour buckets. Queries include the energy drawn since the last change.
+    # Buckets are aligned to epoch minutes/hours, which match local hour
+    # boundaries in whole-hour time zones.
+
+    def __init__(self, minute_retention=DEFAULT_MINUTE_RETENTION,
+                 hour_retention=DEFAULT_HOUR_RETENTION, clock=time.time):
+        self.clock = clock
+        self._minutes = _Buckets(MINUTE, minute_retention)
+        self._hours = _Buckets(HOUR, hour_retention)
+        self.power = 0.0
+        self._since = None
+        # Hour buckets changed since the last take_dirty_hours()
+        self._dirty_hours = set()
+
+    def record(self, watts, ts=None):
+        ts = self.clock() if ts is None else ts
+        if self._since is not None:
+            self._integrate(self._since, ts, self.power)
+        self.power = watts
+        self._since = ts
+
+    def _integrate(self, start, end, watts):
+        if watts == 0:
+            return
+        t = start
+        while t < end:
+            minute = int(t // MINUTE)
+            segment_end = min((minute + 1) * MINUTE, end)
+            wh = watts * (segment_end - t) / HOUR
+            self._minutes.add(minute, wh)
+            self._hours.add(minute // 60, wh)
+            self._dirty_hours.add(minute // 60)
+            t = segment_end
+
+    # Bucket rings for vectorized readers (see analytics.py)
+    @property
+    def hour_buckets(self):
+        return self._hours
+
+    @property
+    def minute_buckets(self):
+        return self._minutes
+
+    # Time up to which all energy is in the buckets (None before the first
+    # record); energy since then is only added by queries
+    @property
+    def settled_until(self):
+        return self._since
+
+    # Oldest hour bucket (epoch hours) still kept at `now`
+    def first_retained_hour(self, now=None):
+        now = self.clock() if now is None else now
+        return int(now // HOUR) - self._hours.retention + 1
+
+    # (hour, Wh) of every hour bucket changed since the last call, for persisting
+    def take_dirty_hours(self):
+        hours = [(hour, self._hours.get(hour)) for hour in sorted(self._dirty_hours)]
+        self._dirty_hours.clear()
+        return hours
+
+    # Restore hour buckets saved by take_dirty_hours()
+    def load_hours(self, hours):
+        for hour, wh in hours:
+            self._hours.add(hour, wh)
+
+    # Energy drawn since the last record() that falls inside [start, end)
+    def _pending(self, start, end, now):
+        if self._since is None or self.power == 0:
+            return 0.0
+        overlap = min(end, now) - max(start, self._since)
+        return self.power * overlap / HOUR if overlap > 0 else 0.0
+
+    def _series(self, buckets, start, count, now):
+        now = self.clock() if now is None else now
+        first = int(start // buckets.width)
+        values = []
+        for bucket in range(first, first + count):
+            bucket_start = bucket * buckets.width
+            values.append(buckets.get(bucket) + self._pending(bucket_start, bucket_start + buckets.width, now))
+        return values
+
+    # Wh per minute for `count` minutes starting at `start`
+    def minutely(self, start, count, now=None):
+        return self._series(self._minutes, start, count, now)
+
+    # Wh per hour for `count` hours starting at `start`
+    def hourly(self, start, count, now=None):
+        return self._series(self._hours, start, count, now)
+
+    # Wh per hour of the local day containing `now`, index = hour of day
+    def today_hourly(self, now=None):
+        now = self.clock() if now is None else now
+        midnight = datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0)
+        return self.hourly(midnight.timestamp(), 24, now)
+
+    # Wh per local day for `count` days starting at the day containing `start`
+    def daily(self, start, count, now=None):
+        day = datetime.fromtimestamp(start).replace(hour=0, minute=0, second=0, microsecond=0)
+        values = []
+        for _ in range(count):
+            next_day = day + timedelta(days=1)
+            hours = round((next_day.timestamp() - day.timestamp()) / HOUR)
+            values.append(sum(self.hourly(day.timestamp(), hours, now)))
+            day = next_day
+        return values
@@ -0,0 +1,92 @@
+import flet as ft
+
+# Height in pixels of the tallest bar, and of an empty one
+BAR_MAX_HEIGHT = 180
+BAR_MIN_HEIGHT = 5
+
+CURRENT_HOUR_BORDER = ft.border.all(3, "#3B82F6")
+
+
+def bar_color(wh):
+    if wh < 50:
+        return "#22C55E"   # GREEN
+    elif wh < 100:
+        return "#F5A623"   # YELLOW
+    elif wh < 150:
+        return "#FCD34D"   # LIGHT GOLD
+    else:
+        return "#EF4444"   # RED
+
+
+class EnergyChart:
+    # Bar chart of Wh per hour. The bar controls are created once; update()
+    # only changes the bars whose height, colour, tooltip or highlight differ
+    # from what is on screen, and keeps the scale maximum up to date without
+    # rescanning every bucket on each call.
+
+    def __init__(self, buckets=24):
+        self.bars = [
+            ft.Container(
+                width=30,
+                height=BAR_MIN_HEIGHT,
+                bgcolor=bar_color(0),
+                border_radius=3,
+                tooltip=f"Hour {i}: 0Wh",
+            )
+            for i in range(buckets)
+        ]
+        self.control = ft.Row(
+            self.bars,
+            alignment=ft.MainAxisAlignment.SPACE_EVENLY,
+            vertical_alignment=ft.CrossAxisAlignment.END,
+            height=200,
+        )
+        self._values = [0.0] * buckets
+        self._max = 0.0
+        self._highlighted = None
+
+    # values are Wh per bucket; returns the bar controls that changed
+    def update(self, values, highlighted=None):
+        # Compare at display precision so the open hour does not redraw for
+        # every fraction of a Wh
+        values = [round(value, 1) for value in values]
+        changed = [i for i, (old, new) in enumerate(zip(self._values, values)) if old != new]
+
+        old_max = self._max
+        new_max = old_max
+        rescan = False
+        for i in changed:
+            if values[i] > new_max:
+                new_max = values[i]
+            elif self._values[i] == old_max:
+                # The bucket holding the maximum went down
+                rescan = True
+        if rescan:
+            new_max = max(values)
+        for i in changed:
+            self._values[i] = values[i]
+        self._max = new_max
+
+        # A new scale moves every bar; otherwise only the changed ones
+        redraw = range(len(values)) if new_max != old_max else changed
+        scale = new_max if new_max > 0 else 1
+        dirty = {}
+        for i in redraw:
+            bar = self.bars[i]
+            height = max(values[i] / scale * BAR_MAX_HEIGHT, BAR_MIN_HEIGHT)
+            if bar.height != height:
+                bar.height = height
+                dirty[i] = bar
+        for i in changed:
+            bar = self.bars[i]
+            bar.bgcolor = bar_color(values[i])
+            bar.tooltip = f"Hour {i}: {values[i]:.0f}Wh"
+            dirty[i] = bar
+
+        if highlighted != self._highlighted:
+            for i, border in ((self._highlighted, None), (highlighted, CURRENT_HOUR_BORDER)):
+                if i is not None:
+                    self.bars[i].border = border
+                    dirty[i] = self.bars[i]
+            self._highlighted = highlighted
+        return list(dirty.values())
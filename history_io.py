@@ -0,0 +1,289 @@
+import argparse
+import csv
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from datetime import datetime
+
+from energy import HOUR
+from storage import HomeStore
+
+# Rows read, written and parsed per chunk
+CHUNK_ROWS = 10000
+
+# Columns of each kind of history with their array type code in the
+# columnar format; "s" marks a dictionary-encoded string column
+COLUMNS = {
+    "actions": (("timestamp", "d"), ("device", "s"), ("action", "s"), ("user", "s")),
+    "energy": (("hour_start", "q"), ("wh", "d")),
+}
+
+# File extension of each export format
+FORMATS = {"csv": ".csv", "columnar": ".shc"}
+
+# First bytes of a columnar file, followed by the length-prefixed kind
+COLUMNAR_MAGIC = b"SHC1"
+
+# zlib level for columnar blocks; 1 keeps export close to disk speed
+COLUMNAR_COMPRESSION = 1
+
+# Default database for the command line, the app's PERSISTENCE_PATH
+DEFAULT_DB = "smart_home.db"
+
+
+class TransferStats:
+    def __init__(self, kind, path, rows, seconds):
+        self.kind = kind
+        self.path = path
+        self.rows = rows
+        self.seconds = seconds
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self):
+        return f"{self.kind}: {self.rows:,} rows, {self.path}, {self.seconds:.2f}s ({self.rows_per_sec:,.0f} rows/s)"
+
+
+# Sources: generators of row chunks, oldest first
+
+def controller_actions(controller, chunk=CHUNK_ROWS):
+    first, stop = controller.history_bounds()
+    for start in range(first, stop, chunk):
+        records = controller.history(start, min(start + chunk, stop))
+        yield [(record.timestamp, record.device, record.action, record.user) for record in records]
+
+
+# Hours with energy use, including the hour in progress
+def controller_energy(controller, chunk=CHUNK_ROWS):
+    now = controller.clock()
+    first, stop = controller.energy.first_retained_hour(now), int(now // HOUR) + 1
+    for start in range(first, stop, chunk):
+        values = controller.energy.hourly(start * HOUR, min(chunk, stop - start), now)
+        rows = [((start + i) * HOUR, wh) for i, wh in enumerate(values) if wh]
+        if rows:
+            yield rows
+
+
+def store_actions(store, chunk=CHUNK_ROWS):
+    for start in range(0, store.action_count, chunk):
+        yield store.read_actions(start, start + chunk)
+
+
+def store_energy(store, chunk=CHUNK_ROWS):
+    for rows in store.read_energy(chunk):
+        yield [(hour * HOUR, wh) for hour, wh in rows]
+
+
+# CSV
+
+def write_csv(path, kind, chunks, progress=None):
+    rows = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow([name for name, _ in COLUMNS[kind]])
+        for chunk in chunks:
+            writer.writerows(chunk)
+            rows += len(chunk)
+            if progress is not None:
+                progress(rows)
+    return rows
+
+
+def read_csv(path, kind, chunk=CHUNK_ROWS):
+    parsers = [{"d": float, "q": int, "s": str}[code] for _, code in COLUMNS[kind]]
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader)
+        rows = []
+        for line, row in enumerate(reader, start=2):
+            try:
+                if len(row) != len(parsers):
+                    raise ValueError(f"expected {len(parsers)} columns, got {len(row)}")
+                rows.append(tuple(parse(value) for parse, value in zip(parsers, row)))
+            except ValueError as e:
+                raise ValueError(f"{path}:{line}: {e}") from None
+            if len(rows) == chunk:
+                yield rows
+                rows = []
+        if rows:
+            yield rows
+
+
+# Columnar: after the header, one block per chunk (row count, then every
+# column) and a zero row count at the end. Numbers are little-endian arrays;
+# strings are codes into a dictionary that each block extends with the
+# strings it introduces. Every column is zlib-compressed separately.
+
+def write_columnar(path, kind, chunks, progress=None):
+    columns = COLUMNS[kind]
+    dictionaries = [{} for _ in columns]
+    rows = 0
+    with open(path, "wb") as f:
+        name = kind.encode()
+        f.write(COLUMNAR_MAGIC + struct.pack("<B", len(name)) + name)
+        for chunk in chunks:
+            if not chunk:
+                continue
+            f.write(struct.pack("<I", len(chunk)))
+            for (_, code), strings, values in zip(columns, dictionaries, zip(*chunk)):
+                if code == "s":
+                    new = [value for value in dict.fromkeys(values) if value not in strings]
+                    for value in new:
+                        strings[value] = len(strings)
+                    _write_block(f, json.dumps(new).encode())
+                    values = array("I", [strings[value] for value in values])
+                else:
+                    values = array(code, values)
+                if sys.byteorder == "big":
+                    values.byteswap()
+                _write_block(f, values.tobytes())
+            rows += len(chunk)
+            if progress is not None:
+                progress(rows)
+        f.write(struct.pack("<I", 0))
+    return rows
+
+
+def read_columnar(path):
+    with open(path, "rb") as f:
+        columns = COLUMNS[_columnar_kind(f)]
+        dictionaries = [[] for _ in columns]
+        while True:
+            (count,) = struct.unpack("<I", _read_exact(f, 4))
+            if count == 0:
+                return
+            values = []
+            for (_, code), strings in zip(columns, dictionaries):
+                if code == "s":
+                    strings.extend(json.loads(_read_block(f)))
+                    values.append([strings[index] for index in _read_array(f, "I")])
+                else:
+                    values.append(_read_array(f, code).tolist())
+            yield list(zip(*values))
+
+
+def _write_block(f, data):
+    data = zlib.compress(data, COLUMNAR_COMPRESSION)
+    f.write(struct.pack("<I", len(data)))
+    f.write(data)
+
+
+def _read_block(f):
+    (size,) = struct.unpack("<I", _read_exact(f, 4))
+    return zlib.decompress(_read_exact(f, size))
+
+
+def _read_array(f, code):
+    values = array(code)
+    values.frombytes(_read_block(f))
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _read_exact(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError(f"{f.name}: truncated columnar file")
+    return data
+
+
+def _columnar_kind(f):
+    if f.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError(f"{f.name}: not a columnar history file")
+    (size,) = struct.unpack("<B", _read_exact(f, 1))
+    kind = _read_exact(f, size).decode()
+    if kind not in COLUMNS:
+        raise ValueError(f"{f.name}: unknown history kind {kind!r}")
+    return kind
+
+
+# Export and import
+
+def export_path(directory, kind, file_format, now=None):
+    stamp = datetime.fromtimestamp(time.time() if now is None else now).strftime("%Y%m%d-%H%M%S")
+    return os.path.join(directory, f"{kind}-{stamp}{FORMATS[file_format]}")
+
+
+# Stream chunks of `kind` rows into a file; progress(rows) is called per chunk
+def export_history(path, kind, chunks, file_format=None, progress=None):
+    file_format = file_format or _format_of(path)
+    write = write_csv if file_format == "csv" else write_columnar
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+    rows = write(path, kind, chunks, progress)
+    return TransferStats(kind, path, rows, time.perf_counter() - start)
+
+
+# (kind, chunks) of a CSV or columnar export
+def read_history(path):
+    if _format_of(path) == "columnar":
+        with open(path, "rb") as f:
+            kind = _columnar_kind(f)
+        return kind, read_columnar(path)
+    with open(path, newline="", encoding="utf-8") as f:
+        header = tuple(next(csv.reader(f), ()))
+    for kind, columns in COLUMNS.items():
+        if header == tuple(name for name, _ in columns):
+            return kind, read_csv(path, kind)
+    raise ValueError(f"{path}: unrecognised CSV header {list(header)}")
+
+
+# Import an export into a stopped store
+def import_history(store, path):
+    kind, chunks = read_history(path)
+    start = time.perf_counter()
+    if kind == "actions":
+        rows = store.import_actions(chunks)
+    else:
+        rows = store.import_energy([(int(hour_start // HOUR), wh) for hour_start, wh in chunk] for chunk in chunks)
+    return TransferStats(kind, path, rows, time.perf_counter() - start)
+
+
+def _format_of(path):
+    for file_format, extension in FORMATS.items():
+        if path.endswith(extension):
+            return file_format
+    raise ValueError(f"{path}: unknown export format (expected {', '.join(FORMATS.values())})")
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Export or import the smart home action log and energy history")
+    parser.add_argument("--db", default=DEFAULT_DB, help="SQLite database of the app")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write the history to files")
+    export.add_argument("--format", choices=FORMATS, default="csv")
+    export.add_argument("--kind", choices=[*COLUMNS, "all"], default="all")
+    export.add_argument("--out", default="exports", help="directory for the exported files")
+    load = commands.add_parser("import", help="add exported files to the database (app stopped)")
+    load.add_argument("files", nargs="+")
+    args = parser.parse_args(argv)
+
+    store = HomeStore(args.db)
+    try:
+        if args.command == "export":
+            sources = {"actions": store_actions, "energy": store_energy}
+            for kind in COLUMNS if args.kind == "all" else [args.kind]:
+                path = export_path(args.out, kind, args.format)
+                print(export_history(path, kind, sources[kind](store), args.format))
+        else:
+            for path in args.files:
+                print(import_history(store, path))
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
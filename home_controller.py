@@ -0,0 +1,392 @@
+import copy
+import threading
+import time
+from itertools import islice
+
+from action_log import ActionLog, ActionRecord, DEFAULT_CAPACITY
+from devices import DeviceRegistry, default_devices
+from energy import EnergyMeter
+from instrumentation import INSTRUMENTS
+
+# Minute buckets kept per device; per-device energy is read at hour resolution
+DEVICE_MINUTE_RETENTION = 60
+
+# Default hour buckets kept per device (16 bytes each). Per-device energy
+# only feeds the energy report's breakdown and is not persisted, so it
+# needs no more history than the report shows; the app passes its horizon.
+DEVICE_HOUR_RETENTION = 7 * 24
+
+# Device column of the grouped log entry written by apply_batch()
+BATCH_LOG_DEVICE = "scene"
+
+# Device column of the entries logged for state changes devices report
+TELEMETRY_LOG_DEVICE = "telemetry"
+
+
+class Change:
+    # What a command did, passed to every subscriber. device is None for
+    # entries that do not change exactly one device (system messages,
+    # batches); devices lists every device the command changed. entry is
+    # None for telemetry that changed nothing worth logging.
+    __slots__ = ("device", "entry", "power", "devices")
+
+    def __init__(self, device, entry, power, devices=None):
+        self.device = device
+        self.entry = entry
+        self.power = power
+        self.devices = devices if devices is not None else (device,) if device is not None else ()
+
+
+class PastState:
+    # Device states and modelled power at a past moment; replayed is the
+    # number of logged state changes applied on top of the nearest checkpoint
+    __slots__ = ("ts", "states", "power", "replayed")
+
+    def __init__(self, ts, states, power, replayed):
+        self.ts = ts
+        self.states = states
+        self.power = power
+        self.replayed = replayed
+
+
+class HomeController:
+    # UI-free core of the smart home: devices and their power, the action
+    # log, the energy meter and (optionally) persistence. Commands mutate the
+    # state and notify subscribers; the Flet app is just one subscriber.
+    # Subscribers are called after the controller lock is released, so they
+    # may issue commands of their own.
+
+    def __init__(self, devices=None, log_capacity=DEFAULT_CAPACITY, store=None, clock=time.time, user="User",
+                 device_hour_retention=DEVICE_HOUR_RETENTION):
+        self.registry = DeviceRegistry(default_devices() if devices is None else devices)
+        self.action_log = ActionLog(capacity=log_capacity)
+        self.energy = EnergyMeter(clock=clock)
+        # Per-device meters, created when a device first draws power
+        self.device_energy = {}
+        self.device_hour_retention = device_hour_retention
+        self.store = store
+        self.clock = clock
+        self.user = user
+        self.restored = False
+        # State of the devices before anything was logged
+        self._initial_states = {device.id: (device.on, device.value) for device in self.registry}
+        self._listeners = []
+        self._lock = threading.RLock()
+        for device in self.registry:
+            self._record_device_power(device.id)
+
+    # Subscriptions
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+        return lambda: self.unsubscribe(listener)
+
+    def unsubscribe(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _notify(self, change):
+        for listener in list(self._listeners):
+            listener(change)
+
+    # Commands
+
+    @INSTRUMENTS.timed("controller.toggle")
+    def toggle(self, device_id, user=None):
+        with self._lock:
+            device = self.registry.get(device_id)
+            change = self._apply(*self._check(device_id, not device.on, None), user)
+        self._notify(change)
+        return change
+
+    @INSTRUMENTS.timed("controller.set_on")
+    def set_on(self, device_id, on, user=None):
+        with self._lock:
+            change = self._apply(*self._check(device_id, on, None), user)
+        self._notify(change)
+        return change
+
+    @INSTRUMENTS.timed("controller.set_value")
+    def set_value(self, device_id, value, user=None):
+        with self._lock:
+            change = self._apply(*self._check(device_id, None, value), user)
+        self._notify(change)
+        return change
+
+    # Apply several device changes as one command: all of them or none are
+    # applied, under a single grouped log entry ("<label>: light1 Turn OFF,
+    # ..."), with one power recompute and one notification. changes are
+    # (device_id, on, value), None leaving on or value as it is.
+    @INSTRUMENTS.timed("controller.apply_batch")
+    def apply_batch(self, label, changes, user=None):
+        with self._lock:
+            resolved = self._resolve(changes)
+            self._writable()
+            parts = self._apply_changes(resolved)
+            action = f"{label}: {', '.join(parts) if parts else 'no changes'}"
+            devices = tuple(dict.fromkeys(device for device, _, _ in resolved))
+            entry = self._log(BATCH_LOG_DEVICE, action, user, states=self._states_of(devices))
+            change = Change(None, entry, self.power(), devices)
+        self._notify(change)
+        return change
+
+    # Apply what devices reported about themselves, as one command. changes
+    # are (device_id, on, value) states; only those that differ from the
+    # known state are applied and logged (one grouped entry, none if nothing
+    # changed). readings map device ids to a measured draw in watts, used in
+    # place of the modelled power until the device's state next changes.
+    @INSTRUMENTS.timed("controller.apply_telemetry")
+    def apply_telemetry(self, changes, readings, user=None):
+        with self._lock:
+            resolved = []
+            for device, on, value in self._resolve(changes):
+                on = None if on == device.on else on
+                value = None if value == device.value else value
+                if on is not None or value is not None:
+                    resolved.append((device, on, value))
+            self._writable()
+            parts = self._apply_changes(resolved)
+            for device_id, watts in readings.items():
+                self.registry.report_power(device_id, watts)
+                self._record_device_power(device_id)
+            if parts:
+                changed = tuple(dict.fromkeys(device for device, _, _ in resolved))
+                entry = self._log(TELEMETRY_LOG_DEVICE, f"Reported: {', '.join(parts)}", user,
+                                  states=self._states_of(changed))
+            else:
+                entry = None
+                self.record_power()
+            devices = tuple(dict.fromkeys([device for device, _, _ in resolved]
+                                          + [self.registry.get(device_id) for device_id in readings]))
+            change = Change(None, entry, self.power(), devices)
+        self._notify(change)
+        return change
+
+    # Look up, check and convert every change first, so a bad one fails
+    # before any device is touched
+    def _resolve(self, changes):
+        return [self._check(device_id, on, value) for device_id, on, value in changes]
+
+    # (device, on, value) with the value converted; ValueError (KeyError for
+    # an unknown device) if the device cannot take the change
+    def _check(self, device_id, on, value):
+        device = self.registry.get(device_id)
+        if on is not None:
+            if not device.toggle:
+                raise ValueError(f"{device_id}: cannot be switched on or off")
+            on = bool(on)
+        if value is not None:
+            if not device.has_value:
+                raise ValueError(f"{device_id}: has no value")
+            try:
+                value = device.value_type(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{device_id}: value must be a number, got {value!r}") from None
+            if not device.min_value <= value <= device.max_value:
+                raise ValueError(f"{device_id}: value {value} outside {device.min_value}..{device.max_value}")
+        return device, on, value
+
+    # Apply resolved changes; returns the action text of each
+    def _apply_changes(self, resolved):
+        parts = []
+        for device, on, value in resolved:
+            self.registry.update(device.id, on=on, value=value)
+            self._record_device_power(device.id)
+            if on is not None and device.toggle:
+                parts.append(f"{device.id} {device.toggle_action()}")
+            if value is not None:
+                parts.append(f"{device.id} {device.value_text()}")
+        return parts
+
+    def _states_of(self, devices):
+        return {device.id: (device.on, device.value) for device in devices}
+
+    # Log an entry that does not change any device
+    def log(self, device, action, user=None):
+        with self._lock:
+            self._writable()
+            change = Change(None, self._log(device, action, user), self.power())
+        self._notify(change)
+        return change
+
+    def _apply(self, device, on, value, user):
+        self._writable()
+        self.registry.update(device.id, on=on, value=value)
+        self._record_device_power(device.id)
+        action = device.value_text() if value is not None else device.toggle_action()
+        return Change(device, self._log(device.id, action, user), self.power())
+
+    # Fail before a command changes anything once the store cannot write
+    def _writable(self):
+        if self.store is not None:
+            self.store.check()
+
+    @INSTRUMENTS.timed("controller.add_action")
+    def _log(self, device, action, user, states=None):
+        timestamp = self.clock()
+        user = user or self.user
+        entry = self.action_log.record(self.action_log.append(timestamp, device, action, user, states or ()))
+        if self.store is not None:
+            state = self.device_state(device) if device in self.registry else None
+            if self.store.log_action(timestamp, device, action, user, state, states):
+                self.store.save_snapshot(timestamp, self.device_states())
+        self.record_power()
+        return entry
+
+    # Record the current power draw; the meter integrates it until the next change
+    def record_power(self):
+        self.energy.record(self.power())
+        if self.store is not None:
+            self.store.save_energy(self.energy.take_dirty_hours())
+
+    def _record_device_power(self, device_id):
+        watts = self.registry.device_power(device_id)
+        meter = self.device_energy.get(device_id)
+        if meter is None:
+            if not watts:
+                return
+            meter = self.device_energy[device_id] = EnergyMeter(
+                minute_retention=DEVICE_MINUTE_RETENTION, hour_retention=self.device_hour_retention, clock=self.clock
+            )
+        meter.record(watts)
+
+    # Queries
+
+    def power(self):
+        return self.registry.power()
+
+    def device(self, device_id):
+        return self.registry.get(device_id)
+
+    def devices(self):
+        return list(self.registry)
+
+    def device_state(self, device_id):
+        device = self.registry.get(device_id)
+        return (device.on, device.value)
+
+    def device_states(self):
+        return {device.id: (device.on, device.value) for device in self.registry}
+
+    def recent_actions(self, n, device=None):
+        if device is None:
+            return self.action_log.recent(n)
+        return self.action_log.recent_for_device(device, n)
+
+    # Up to limit logged actions matching the filters, newest first; see
+    # ActionLog.query for the filters. Pass before=<seq of the last result>
+    # to continue, or after=<seq of the first> for newer matches. Seqs are
+    # history positions, as for history(): with a store the search carries
+    # on past what the log retains into the stored actions.
+    def find_actions(self, limit, before=None, after=None, **filters):
+        with self._lock:
+            log = self.action_log
+            offset = 0 if self.store is None else self.store.action_count - log.next_seq
+            in_memory = log.first_seq + offset
+            records = []
+            found = log.query(
+                before=None if before is None else before - offset,
+                after=None if after is None else after - offset,
+                **filters,
+            )
+            for seq in islice(found, limit):
+                record = log.record(seq)
+                record.seq = seq + offset
+                records.append(record)
+        if self.store is not None and len(records) < limit:
+            low = 0 if after is None else after + 1
+            high = in_memory if before is None else min(before, in_memory)
+            if low < high:
+                rows = self.store.find_actions(limit - len(records), low, high, **filters)
+                records += [ActionRecord(*row) for row in rows]
+        return records
+
+    # Action prefixes the devices log, for filtering by action type
+    def action_types(self):
+        return list(dict.fromkeys(kind for device in self.registry for kind in device.action_types()))
+
+    # Positions of the full action history: first..stop-1, oldest first. With
+    # a store this is everything ever logged; otherwise what the log retains.
+    def history_bounds(self):
+        with self._lock:
+            if self.store is None:
+                return self.action_log.first_seq, self.action_log.next_seq
+            return 0, self.store.action_count
+
+    # History entries start..stop-1, oldest first. The newest ones come from
+    # the in-memory log, older ones are read from the store.
+    def history(self, start, stop):
+        with self._lock:
+            log = self.action_log
+            # The log holds the newest len(log) positions of the history
+            offset = 0 if self.store is None else self.store.action_count - log.next_seq
+            in_memory = log.first_seq + offset
+            start = max(start, 0 if self.store is not None else in_memory)
+            stop = min(stop, log.next_seq + offset)
+            records = []
+            for position in range(max(start, in_memory), stop):
+                record = log.record(position - offset)
+                record.seq = position
+                records.append(record)
+        if start < in_memory:
+            rows = self.store.read_actions(start, min(stop, in_memory))
+            records[:0] = [ActionRecord(start + i, *row) for i, row in enumerate(rows)]
+        return records
+
+    # Every device's state, and the power the models give for it, as of
+    # `ts`, from the store's checkpoints (None without a store). Telemetry
+    # power readings are not stored, so the power is the modelled draw.
+    @INSTRUMENTS.timed("controller.state_at")
+    def state_at(self, ts):
+        if self.store is None:
+            return None
+        with self._lock:
+            newest = self.action_log.recent(1)
+            if not newest or ts >= newest[0].timestamp:
+                # Nothing logged since ts: the present state is exact, including
+                # actions the store has not written yet
+                recorded, replayed = self.device_states(), 0
+        if newest and ts < newest[0].timestamp:
+            recorded, replayed = self.store.state_at(ts)
+        states = {}
+        power = 0.0
+        for device in self.registry:
+            on, value = recorded.get(device.id, self._initial_states[device.id])
+            past = copy.copy(device)
+            past.on = on
+            past.value = value
+            states[device.id] = (on, value)
+            power += past.power()
+        return PastState(ts, states, round(power, 1), replayed)
+
+    def today_hourly(self):
+        return self.energy.today_hourly()
+
+    # Persistence
+
+    # Load the last device state, recent actions and energy history from the store
+    def restore(self, recent=1000):
+        if self.store is None:
+            return False
+        with self._lock:
+            states, actions, hours = self.store.load(recent=recent, since_hour=self.energy.first_retained_hour())
+            for device_id, (on, value) in states.items():
+                if device_id in self.registry:
+                    self.registry.update(device_id, on=on, value=value)
+                    self._record_device_power(device_id)
+            for timestamp, device, action, user, changed in actions:
+                self.action_log.append(timestamp, device, action, user, changed)
+            self.energy.load_hours(hours)
+            self.restored = bool(states or actions)
+            self.store.start()
+            return self.restored
+
+    # Flush pending writes and snapshot the device state
+    def close(self):
+        with self._lock:
+            if self.store is not None and self.store.running:
+                try:
+                    self.store.save_energy(self.energy.take_dirty_hours())
+                    self.store.save_snapshot(self.clock(), self.device_states())
+                finally:
+                    self.store.close()
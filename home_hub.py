@@ -0,0 +1,49 @@
+import threading
+
+# page.pubsub topic the deltas are broadcast on
+TOPIC = "home"
+
+
+def make_delta(change):
+    # Compact description of a Change: which device cards to refresh and the
+    # new log entry. Sessions read device state from the shared controller,
+    # so the delta does not need to carry it.
+    return {"entry": change.entry, "devices": [device.id for device in change.devices]}
+
+
+class HomeHub:
+    # One controller shared by every Flet session of the process. A command
+    # from any session is applied once; the resulting delta is broadcast to
+    # all attached sessions over page.pubsub, so each session only updates
+    # the controls the delta names.
+
+    def __init__(self, controller):
+        self.controller = controller
+        self._pubsub = {}
+        self._lock = threading.Lock()
+        controller.subscribe(self._publish)
+
+    @property
+    def sessions(self):
+        return len(self._pubsub)
+
+    # Start delivering deltas to on_delta (called on the session's pubsub
+    # thread); returns a function that detaches the session
+    def attach(self, page, on_delta):
+        page.pubsub.subscribe_topic(TOPIC, lambda topic, delta: on_delta(delta))
+        with self._lock:
+            self._pubsub[id(page)] = page.pubsub
+        return lambda: self.detach(page)
+
+    def detach(self, page):
+        with self._lock:
+            pubsub = self._pubsub.pop(id(page), None)
+        if pubsub is not None:
+            pubsub.unsubscribe_topic(TOPIC)
+
+    def _publish(self, change):
+        with self._lock:
+            # All sessions share the app's pubsub hub, so any client can broadcast
+            pubsub = next(iter(self._pubsub.values()), None)
+        if pubsub is not None:
+            pubsub.send_all_on_topic(TOPIC, make_delta(change))
@@ -1,67 +1,255 @@
+import atexit
+import os
+import threading
+import time
 import flet as ft
-from datetime import datetime
+from datetime import datetime, timedelta
 
-def main(page: ft.Page):
+from automation import AutomationEngine, rule_from_dict, scene_from_dict
+from energy_chart import EnergyChart
+from history_io import controller_actions, controller_energy, export_history, export_path
+from home_controller import BATCH_LOG_DEVICE, HomeController
+from home_hub import HomeHub, make_delta
+from instrumentation import INSTRUMENTS
+from log_pager import LogPager, QueryPager
+from render_scheduler import RenderScheduler
+from storage import HomeStore
+from telemetry import TelemetryIngestor, TelemetryServer
+from view_manager import ViewManager
+from slider_input import SliderInput
+
+# Energy reports need numpy; without it the Statistics view says so
+try:
+    import analytics
+except ImportError:
+    analytics = None
+
+# How many actions are retained before the oldest are dropped
+ACTION_LOG_CAPACITY = 10000
+
+# SQLite file holding the action log, device state and energy history (None disables it)
+PERSISTENCE_PATH = "smart_home.db"
+
+# Newest actions loaded back into the action log at startup
+RESTORE_ACTIONS = 1000
+
+# Number of newest actions shown in the Statistics action log table
+ACTION_LOG_TABLE_ROWS = 10
+
+# Height in pixels of one row of the History view
+HISTORY_ROW_HEIGHT = 32
+
+# Row controls the History view keeps alive: a screenful plus overscan
+HISTORY_WINDOW_ROWS = 40
+
+# Rows kept above the first visible one, so small scrolls need no refill
+HISTORY_OVERSCAN_ROWS = 10
+
+# Milliseconds between scroll events sent by the History list
+HISTORY_SCROLL_INTERVAL_MS = 50
+
+# Seconds without typing in the History search field before the query runs
+HISTORY_SEARCH_DEBOUNCE = 0.3
+
+# Widths of the History view's Time, Device, Action and User columns
+HISTORY_COLUMN_WIDTHS = (160, 120, 220, 100)
+
+# Automations run by the shared controller (see automation.rule_from_dict);
+# none by default, since rules change devices on their own. For example:
+#   {"type": "time", "name": "Lock door at night", "at": "23:00", "device": "door1", "on": True}
+#   {"type": "condition", "name": "Fan off with thermostat", "watch": "thermostat", "when": "off",
+#    "device": "fan", "on": False}
+#   {"type": "power_cap", "name": "Cap power at 200W", "limit": 200, "shed": ["fan", "thermostat", "light1"]}
+AUTOMATION_RULES = []
+
+# Scenes offered on the overview (see automation.scene_from_dict); each
+# applies all its device changes as one batch
+SCENES = [
+    {"name": "Night mode", "icon": ft.Icons.BEDTIME, "devices": {
+        "light1": {"on": False}, "door1": {"on": True}, "thermostat": {"on": True, "value": 19}, "fan": {"value": 1},
+    }},
+    {"name": "Away", "icon": ft.Icons.DIRECTIONS_WALK, "devices": {
+        "light1": {"on": False}, "door1": {"on": True}, "thermostat": {"on": False}, "fan": {"on": False},
+    }},
+    {"name": "Welcome home", "icon": ft.Icons.HOME, "devices": {
+        "light1": {"on": True}, "door1": {"on": False}, "thermostat": {"on": True, "value": 21},
+    }},
+]
+
+# Local socket devices report their state and power readings on (JSON
+# lines, see telemetry.py), e.g. ("127.0.0.1", 8765); None disables
+# telemetry. Messages can change any device, including unlocking the door.
+TELEMETRY_ADDRESS = None
+
+# Shared secret a telemetry connection must send first ({"token": ...});
+# None lets every local process report, so set one whenever telemetry is on
+TELEMETRY_TOKEN = None
+
+# Most telemetry batches applied, and so dashboard refreshes caused, per second
+TELEMETRY_MAX_RATE = 10
+
+# Directory the Statistics view exports the history to
+EXPORT_DIR = "exports"
+
+# Price per kWh by local hour for the energy report (see analytics.Tariff):
+# cheaper at night, dearer in the evening peak
+ENERGY_TARIFF = {"default": 0.20, "periods": [(0, 7, 0.12), (17, 21, 0.32)]}
+
+# Currency symbol shown with energy costs
+ENERGY_CURRENCY = "€"
+
+# Periods listed by the energy report for each period length
+ENERGY_REPORT_PERIODS = {"day": 7, "week": 6, "month": 6}
+
+# Longest period of each length in days, for how much per-device energy to keep
+ENERGY_PERIOD_DAYS = {"day": 1, "week": 7, "month": 31}
+
+# How the energy report labels each period (strftime of its start)
+ENERGY_REPORT_LABELS = {"day": "%a %Y-%m-%d", "week": "Week of %Y-%m-%d", "month": "%B %Y"}
+
+# Whether hot-path instrumentation starts enabled; the Statistics view's
+# Diagnostics section switches it at runtime
+INSTRUMENTATION_ENABLED = False
+
+# Directory the Diagnostics section dumps instrumentation snapshots to
+DIAGNOSTICS_DIR = "diagnostics"
+
+# Upper bound on timeline reconstructions per second while its slider is dragged
+TIMELINE_PREVIEW_FPS = 20
+
+# Formats accepted by the History time filters; a time alone means today
+FILTER_TIME_FORMATS = ("%Y-%m-%d %H:%M", "%Y-%m-%d", "%H:%M")
+
+# Upper bound on UI syncs per second; None flushes at the end of every event
+RENDER_MAX_FPS = 60
+
+# Seconds without slider movement before a drag is committed and logged
+SLIDER_DEBOUNCE = {
+    "thermostat": 0.5,
+    "fan": 0.3,
+}
+
+# Used for slider devices that have no entry in SLIDER_DEBOUNCE
+SLIDER_DEFAULT_DEBOUNCE = 0.4
+
+# Upper bound on live label refreshes per second while a slider is dragged
+SLIDER_PREVIEW_FPS = 30
+
+# Device cards per row on the overview
+DEVICE_CARDS_PER_ROW = 2
+
+# How each device kind is drawn on the overview
+DEVICE_CARD_STYLES = {
+    "light": {
+        "icon": ft.Icons.LIGHTBULB,
+        "icon_color": "#2563EB",
+        "status": ("Status: ON", "Status: OFF"),
+    },
+    "door": {
+        "icon": ft.Icons.DOOR_BACK_DOOR,
+        "status": ("Door: LOCKED", "Door: UNLOCKED"),
+    },
+    "thermostat": {
+        "icon": ft.Icons.THERMOSTAT,
+        "value_label": "Set point: {value:.1f} °C",
+        "slider_label": "{value}°C",
+    },
+    "fan": {
+        "icon": ft.Icons.AIR,
+        "value_label": "Fan speed: {value}",
+        "slider_label": "{value}",
+    },
+}
+
+# Headless core with the configured persistence, restored from disk
+def create_controller():
+    store = HomeStore(PERSISTENCE_PATH) if PERSISTENCE_PATH else None
+    # Per-device energy is kept for as far back as the energy report reaches
+    report_days = max(count * ENERGY_PERIOD_DAYS[period] for period, count in ENERGY_REPORT_PERIODS.items())
+    controller = HomeController(log_capacity=ACTION_LOG_CAPACITY, store=store,
+                                device_hour_retention=(report_days + 1) * 24)
+    if controller.restore(recent=RESTORE_ACTIONS):
+        controller.log("system", "Restored previous state")
+    else:
+        controller.log("system", "Initialized - All devices OFF")
+    # Flush pending writes and snapshot the device state on exit
+    atexit.register(controller.close)
+    automation = AutomationEngine(controller)
+    for spec in AUTOMATION_RULES:
+        automation.add(rule_from_dict(spec))
+    automation.start()
+    # atexit runs in reverse: the socket stops first, then telemetry (after
+    # applying what is queued), automation and finally the controller
+    atexit.register(automation.stop)
+    if TELEMETRY_ADDRESS is not None:
+        telemetry = TelemetryIngestor(controller, max_rate=TELEMETRY_MAX_RATE)
+        try:
+            server = TelemetryServer(telemetry, *TELEMETRY_ADDRESS, token=TELEMETRY_TOKEN)
+        except OSError as e:
+            controller.log("system", f"Telemetry socket unavailable: {e}")
+        else:
+            telemetry.start()
+            atexit.register(telemetry.stop)
+            server.start()
+            atexit.register(server.stop)
+    return controller
+
+# Epoch seconds for a History time filter. A date alone as the end of a
+# range includes that whole day.
+def parse_filter_time(text, end=False):
+    for time_format in FILTER_TIME_FORMATS:
+        try:
+            parsed = datetime.strptime(text.strip(), time_format)
+        except ValueError:
+            continue
+        if time_format == "%H:%M":
+            parsed = datetime.combine(datetime.now().date(), parsed.time())
+        elif time_format == "%Y-%m-%d" and end:
+            parsed += timedelta(days=1)
+        return parsed.timestamp()
+    raise ValueError(f"Unrecognised time: {text!r}")
+
+# In web mode main() runs once per browser session; all sessions share one hub
+_shared_hub = None
+_shared_hub_lock = threading.Lock()
+
+def shared_hub():
+    global _shared_hub
+    with _shared_hub_lock:
+        if _shared_hub is None:
+            _shared_hub = HomeHub(create_controller())
+        return _shared_hub
+
+def main(page: ft.Page, controller=None):
+    startup_started = time.perf_counter()
+    if INSTRUMENTATION_ENABLED:
+        INSTRUMENTS.enable()
     page.title = "Smart Home Controller"
     page.window_width = 900
     page.window_height = 700
     page.padding = 0
     page.bgcolor = "#F3F4F6"  # UPDATED: Light dashboard background
-
-    # Device states
-    light_on = ft.Ref[bool]()
-    light_on.current = False
-    
-    door_locked = ft.Ref[bool]()
-    door_locked.current = False
-    
-    temperature = ft.Ref[float]()
-    temperature.current = 22.0
     
-    thermostat_on = ft.Ref[bool]()
-    thermostat_on.current = False
+    # All UI changes go through the scheduler: one page.update() per event
+    scheduler = RenderScheduler(page, max_fps=RENDER_MAX_FPS)
     
-    fan_speed = ft.Ref[int]()
-    fan_speed.current = 0
-    
-    # Action log list
-    action_log = []
+    # Views are built on first navigation and cached
+    views = ViewManager(page, scheduler)
+
+    # All state lives in the controller; this UI applies the deltas of its
+    # changes. Without an explicit controller the session joins the shared hub.
+    hub = None
+    if controller is None:
+        hub = shared_hub()
+        controller = hub.controller
     
-    # Power consumption history (stores power for each hour)
-    power_history = [0] * 24
+    # Size gauges for the Diagnostics section
+    INSTRUMENTS.gauge("log.entries", lambda: len(controller.action_log))
+    INSTRUMENTS.gauge("log.bytes", lambda: controller.action_log.nbytes)
     
-    # Calculate current power consumption
+    # Current power consumption (kept up to date by the registry)
     def calculate_power():
-        power = 0
-        if light_on.current:
-            power += 60
-        if door_locked.current:
-            power += 5
-        if thermostat_on.current and temperature.current is not None:
-            temp_diff = abs(temperature.current - 20)
-            power += 50 + (temp_diff * 10)
-        if fan_speed.current is not None:
-            power += fan_speed.current * 30
-        return round(power, 1)
-    
-    # Update power history
-    def update_power_history():
-        current_hour = datetime.now().hour
-        current_power = calculate_power()
-        power_history[current_hour] = current_power
-    
-    # Function to add action to log
-    def add_action(device, action):
-        now = datetime.now()
-        time_str = now.strftime("%H:%M:%S")
-        action_log.insert(0, {
-            "time": time_str,
-            "device": device,
-            "action": action,
-            "user": "User"
-        })
-        update_power_history()
-        update_action_log_table()
+        return controller.power()
     
     # Create action log table
     action_log_table = ft.DataTable(
@@ -76,70 +264,63 @@ def main(page: ft.Page):
         data_row_color={"hovered": "#E5E7EB"},   # LIGHT GREY
     )
     
-    def update_action_log_table():
-        action_log_table.rows.clear()
-        for log in action_log[:10]:
-            action_log_table.rows.append(
-                ft.DataRow(
-                    cells=[
-                        ft.DataCell(ft.Text(log["time"], color="#111827")),   # DARK TEXT
-                        ft.DataCell(ft.Text(log["device"], color="#111827")),
-                        ft.DataCell(ft.Text(log["action"], color="#111827")),
-                        ft.DataCell(ft.Text(log["user"], color="#111827")),
-                    ]
-                )
-            )
-        page.update()
-    
-    # Light status text
-    light_status = ft.Text("Status: OFF", size=14, color="#111827")
-    light_button = ft.ElevatedButton(
-        "OFF", 
-        bgcolor="#EF4444",     # RED (OFF)
-        color=ft.Colors.WHITE,
-        width=80
-    )
+    # Set when actions were logged while the table was not on screen
+    log_table_stale = ft.Ref[bool]()
+    log_table_stale.current = False
     
-    # Door status text
-    door_status = ft.Text("Door: UNLOCKED", size=14, color="#111827")
-    door_button = ft.ElevatedButton(
-        "OFF", 
-        bgcolor="#EF4444",   # RED
-        color=ft.Colors.WHITE,
-        width=80
-    )
+    def make_log_row(log):
+        return ft.DataRow(
+            cells=[
+                ft.DataCell(ft.Text(log.time, color="#111827")),   # DARK TEXT
+                ft.DataCell(ft.Text(log.device, color="#111827")),
+                ft.DataCell(ft.Text(log.action, color="#111827")),
+                ft.DataCell(ft.Text(log.user, color="#111827")),
+            ]
+        )
     
-    # Temperature display
-    temp_display = ft.Text(f"Set point: {temperature.current:.1f} °C", size=14, color="#111827")
-    temp_slider = ft.Slider(
-        min=15, 
-        max=30, 
-        value=22, 
-        divisions=30, 
-        label="{value}°C",
-        active_color="#3B82F6",    # BLUE
-        inactive_color="#E5E7EB"   # LIGHT GREY
-    )
+    def fill_log_row(row, log):
+        time_cell, device_cell, action_cell, user_cell = row.cells
+        time_cell.content.value = log.time
+        device_cell.content.value = log.device
+        action_cell.content.value = log.action
+        user_cell.content.value = log.user
     
-    # Thermostat button
-    thermostat_button = ft.ElevatedButton(
-        "OFF", 
-        bgcolor="#EF4444",  # RED
-        color=ft.Colors.WHITE,
-        width=80
-    )
+    # Timestamp of the newest entry in the table
+    newest_shown = ft.Ref[float]()
+    newest_shown.current = 0.0
     
-    # Fan speed display
-    fan_display = ft.Text(f"Fan speed: {fan_speed.current}", size=14, color="#111827")
-    fan_slider = ft.Slider(
-        min=0, 
-        max=3, 
-        value=0, 
-        divisions=3, 
-        label="{value}",
-        active_color="#3B82F6",
-        inactive_color="#E5E7EB"
-    )
+    # Bring every row in line with the log, reusing the existing row controls
+    def sync_action_log_table():
+        recent = controller.recent_actions(ACTION_LOG_TABLE_ROWS)
+        rows = action_log_table.rows
+        del rows[len(recent):]
+        for i, log in enumerate(recent):
+            if i < len(rows):
+                fill_log_row(rows[i], log)
+            else:
+                rows.append(make_log_row(log))
+        newest_shown.current = recent[0].timestamp if recent else 0.0
+        log_table_stale.current = False
+    
+    # Show a new entry: recycle the oldest row and move it to the top
+    @INSTRUMENTS.timed("ui.update_action_log_table")
+    def update_action_log_table(log):
+        if views.current != "statistics":
+            log_table_stale.current = True
+            return
+        if log_table_stale.current or log.timestamp < newest_shown.current:
+            # Stale, or an entry delivered out of order: redraw from the log
+            sync_action_log_table()
+        else:
+            rows = action_log_table.rows
+            if len(rows) >= ACTION_LOG_TABLE_ROWS:
+                row = rows.pop()
+                fill_log_row(row, log)
+            else:
+                row = make_log_row(log)
+            rows.insert(0, row)
+            newest_shown.current = log.timestamp
+        scheduler.mark_dirty(action_log_table)
     
     # Current power display
     current_power_display = ft.Text(
@@ -149,84 +330,181 @@ def main(page: ft.Page):
         color="#2563EB"   # BLUE
     )
     
-    # Toggle light function
-    def toggle_light(e):
-        light_on.current = not light_on.current
-        if light_on.current:
-            light_status.value = "Status: ON"
-            light_button.text = "ON"
-            light_button.bgcolor = "#22C55E"  # GREEN
-            add_action("light1", "Turn ON")
-        else:
-            light_status.value = "Status: OFF"
-            light_button.text = "OFF"
-            light_button.bgcolor = "#EF4444"  # RED
-            add_action("light1", "Turn OFF")
-        current_power_display.value = f"Current Power: {calculate_power():.0f}W"
-        page.update()
-    
-    # Toggle door function
-    def toggle_door(e):
-        door_locked.current = not door_locked.current
-        if door_locked.current:
-            door_status.value = "Door: LOCKED"
-            door_button.text = "ON"
-            door_button.bgcolor = "#22C55E"
-            add_action("door1", "Lock")
-        else:
-            door_status.value = "Door: UNLOCKED"
-            door_button.text = "OFF"
-            door_button.bgcolor = "#EF4444"
-            add_action("door1", "Unlock")
-        current_power_display.value = f"Current Power: {calculate_power():.0f}W"
-        page.update()
-    
-    # Change temperature function
-    def change_temperature(e):
-        temperature.current = e.control.value
-        temp_display.value = f"Set point: {temperature.current:.1f} °C"
-        add_action("thermostat", f"Set to {temperature.current:.1f}°C")
-        current_power_display.value = f"Current Power: {calculate_power():.0f}W"
-        page.update()
-    
-    # Toggle thermostat function
-    def toggle_thermostat(e):
-        thermostat_on.current = not thermostat_on.current
-        if thermostat_on.current:
-            thermostat_button.text = "ON"
-            thermostat_button.bgcolor = "#22C55E"
-            add_action("thermostat", "Turn ON")
-        else:
-            thermostat_button.text = "OFF"
-            thermostat_button.bgcolor = "#EF4444"
-            add_action("thermostat", "Turn OFF")
-        current_power_display.value = f"Current Power: {calculate_power():.0f}W"
-        page.update()
-    
-    # Change fan speed function
-    def change_fan_speed(e):
-        fan_speed.current = int(e.control.value)
-        fan_display.value = f"Fan speed: {fan_speed.current}"
-        add_action("fan", f"Speed set to {fan_speed.current}")
-        current_power_display.value = f"Current Power: {calculate_power():.0f}W"
-        page.update()
+    # Controls of each device card, by device id
+    device_controls = {}
     
-    # Show device details
-    def show_light_details(e):
-        page.controls.clear()
-        
-        light_actions = [log for log in action_log if log["device"] == "light1"]
-        
-        actions_column = ft.Column()
-        if light_actions:
-            for log in light_actions[:5]:
-                actions_column.controls.append(
-                    ft.Text(f"{log['time']} - {log['action']} ({log['user']})", size=14, color="#111827")
-                )
+    def status_text(device, value=None, on=None):
+        style = DEVICE_CARD_STYLES[device.kind]
+        if device.has_value:
+            value = device.value if value is None else device.value_type(value)
+            return style["value_label"].format(value=value)
+        on_text, off_text = style["status"]
+        return on_text if (device.on if on is None else on) else off_text
+    
+    # Refreshers only touch (and mark dirty) controls whose value changed
+    def refresh_power_display():
+        power_text = f"Current Power: {calculate_power():.0f}W"
+        if current_power_display.value != power_text:
+            current_power_display.value = power_text
+            scheduler.mark_dirty(current_power_display)
+    
+    def refresh_device_card(device):
+        controls = device_controls[device.id]
+        status = controls["status"]
+        if status.value != status_text(device):
+            status.value = status_text(device)
+            scheduler.mark_dirty(status)
+        button = controls.get("button")
+        if button is not None and button.text != ("ON" if device.on else "OFF"):
+            button.text = "ON" if device.on else "OFF"
+            button.bgcolor = "#22C55E" if device.on else "#EF4444"   # GREEN / RED
+            scheduler.mark_dirty(button)
+        slider = controls.get("slider")
+        if slider is not None:
+            controls["input"].sync(device.value)
+            if slider.value != device.value:
+                slider.value = device.value
+                scheduler.mark_dirty(slider)
+    
+    # Apply a change delta to this session's UI. Cards are drawn from the
+    # controller's current state, so deltas delivered out of order still
+    # leave the newest state on screen.
+    @INSTRUMENTS.timed("ui.apply_delta")
+    @scheduler.event
+    def apply_delta(delta):
+        for device_id in delta["devices"]:
+            if device_id in device_controls:
+                refresh_device_card(controller.device(device_id))
+        refresh_power_display()
+        # Telemetry that changed no device state logs nothing
+        if delta["entry"] is not None:
+            update_action_log_table(delta["entry"])
+            if views.current == "history":
+                reload_history_view()
+    
+    if hub is not None:
+        detach = hub.attach(page, apply_delta)
+    else:
+        detach = controller.subscribe(lambda change: apply_delta(make_delta(change)))
+    
+    # Apply a scene: every device change in one batch, so one log entry,
+    # one delta and one render
+    @INSTRUMENTS.timed("ui.activate_scene")
+    @scheduler.event
+    def activate_scene(scene):
+        scene.run(controller)
+    
+    scene_buttons = [
+        ft.ElevatedButton(
+            spec["name"],
+            icon=spec.get("icon"),
+            bgcolor="#FFFFFF",
+            color="#2563EB",
+            on_click=lambda e, scene=scene_from_dict(spec): activate_scene(scene)
+        )
+        for spec in SCENES
+    ]
+    
+    # Toggle a device on/off (or locked/unlocked)
+    @INSTRUMENTS.timed("ui.toggle_device")
+    @scheduler.event
+    def toggle_device(device):
+        controller.toggle(device.id)
+    
+    # Live preview while a slider is dragged (label only)
+    @scheduler.event
+    def preview_device_value(device, value):
+        status = device_controls[device.id]["status"]
+        status.value = status_text(device, value)
+        scheduler.mark_dirty(status)
+    
+    # Set a slider device's value (committed value)
+    @INSTRUMENTS.timed("ui.set_device_value")
+    @scheduler.event
+    def set_device_value(device, value):
+        controller.set_value(device.id, value)
+    
+    def build_device_card(device):
+        style = DEVICE_CARD_STYLES[device.kind]
+        status = ft.Text(status_text(device), size=14, color="#111827")
+        controls = {"status": status}
+        column = [
+            ft.Row([
+                ft.Icon(style["icon"], color=style.get("icon_color", "#3B82F6"), size=28),
+                ft.Text(device.name, weight=ft.FontWeight.BOLD, color="#111827", size=15),
+            ]),
+            status,
+            ft.Text(device.hint, size=12, color="#6B7280"),
+        ]
+        if device.has_value:
+            slider = ft.Slider(
+                min=device.min_value, 
+                max=device.max_value, 
+                value=device.value, 
+                divisions=device.divisions, 
+                label=style["slider_label"],
+                active_color="#3B82F6",    # BLUE
+                inactive_color="#E5E7EB"   # LIGHT GREY
+            )
+            # Preview while dragging and commit once on release or after a pause
+            controls["input"] = SliderInput(
+                slider,
+                on_preview=lambda value: preview_device_value(device, value),
+                on_commit=lambda value: set_device_value(device, value),
+                debounce=SLIDER_DEBOUNCE.get(device.kind, SLIDER_DEFAULT_DEBOUNCE),
+                preview_fps=SLIDER_PREVIEW_FPS,
+            )
+            controls["slider"] = slider
+            column.append(slider)
+        details_button = ft.TextButton(
+            "Details",
+            on_click=lambda e: show_device_details(device),
+            style=ft.ButtonStyle(color="#3B82F6")
+        )
+        if device.toggle:
+            button = ft.ElevatedButton(
+                "ON" if device.on else "OFF", 
+                bgcolor="#22C55E" if device.on else "#EF4444",
+                color=ft.Colors.WHITE,
+                width=80,
+                on_click=lambda e: toggle_device(device)
+            )
+            controls["button"] = button
+            column.append(ft.Row([details_button, button], alignment=ft.MainAxisAlignment.SPACE_BETWEEN))
         else:
-            actions_column.controls.append(ft.Text("No recent actions", color="#6B7280"))
-        
-        details_view = ft.Container(
+            column.append(details_button)
+        device_controls[device.id] = controls
+        return ft.Container(
+            content=ft.Column(column),
+            bgcolor="#FFFFFF",
+            padding=15,
+            border_radius=10,
+            border=ft.border.all(1, "#E5E7EB"),
+            expand=True,
+        )
+    
+    def build_device_rows(devices):
+        cards = [build_device_card(device) for device in devices]
+        return [
+            ft.Row(cards[i:i + DEVICE_CARDS_PER_ROW], spacing=10)
+            for i in range(0, len(cards), DEVICE_CARDS_PER_ROW)
+        ]
+    
+    def device_state_text(device):
+        if device.toggle:
+            return "ON" if device.on else "OFF"
+        return str(device.value)
+    
+    # Details view fields, filled in for the device being shown
+    details_title = ft.Text(size=28, weight=ft.FontWeight.BOLD, color="#2563EB")
+    details_heading = ft.Text(size=22, weight=ft.FontWeight.BOLD, color="#3B82F6")
+    details_id = ft.Text(size=14, color="#111827")
+    details_type = ft.Text(size=14, color="#111827")
+    details_state = ft.Text(size=14, color="#2563EB")
+    details_actions = ft.Column()
+    
+    def build_details_view():
+        return ft.Container(
             content=ft.Column([
                 ft.Row([
                     ft.IconButton(
@@ -236,17 +514,24 @@ def main(page: ft.Page):
                     ),
                     ft.Text("Smart Home Controller", size=16, color="#111827")
                 ], spacing=10),
-                ft.Text("Living Room Light Details", size=28, weight=ft.FontWeight.BOLD, color="#2563EB"),
+                details_title,
                 ft.Container(
                     content=ft.Column([
-                        ft.Text("Living Room Light details", size=22, weight=ft.FontWeight.BOLD, color="#3B82F6"),
+                        details_heading,
                         ft.Divider(color="#E5E7EB"),
-                        ft.Text(f"ID: light1", size=14, color="#111827"),
-                        ft.Text(f"Type: light", size=14, color="#111827"),
-                        ft.Text(f"State: {'ON' if light_on.current else 'OFF'}", size=14, color="#2563EB"),
+                        details_id,
+                        details_type,
+                        details_state,
                         ft.Divider(height=20, color="#E5E7EB"),
-                        ft.Text("Recent actions", size=18, weight=ft.FontWeight.BOLD, color="#3B82F6"),
-                        actions_column,
+                        ft.Row([
+                            ft.Text("Recent actions", size=18, weight=ft.FontWeight.BOLD, color="#3B82F6"),
+                            ft.TextButton(
+                                "View all",
+                                on_click=lambda e: show_device_history(details_id.data),
+                                style=ft.ButtonStyle(color="#3B82F6")
+                            ),
+                        ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
+                        details_actions,
                         ft.Container(height=20),
                         ft.ElevatedButton(
                             "Back to overview",
@@ -265,311 +550,790 @@ def main(page: ft.Page):
             bgcolor="#F3F4F6",
             expand=True,
         )
-        page.add(details_view)
-        page.update()
     
-    # Assign button click handlers
-    light_button.on_click = toggle_light
-    door_button.on_click = toggle_door
-    thermostat_button.on_click = toggle_thermostat
-    temp_slider.on_change = change_temperature
-    fan_slider.on_change = change_fan_speed
+    def refresh_details_view(device):
+        details_title.value = f"{device.name} Details"
+        details_heading.value = f"{device.name} details"
+        details_id.value = f"ID: {device.id}"
+        details_id.data = device.id
+        details_type.value = f"Type: {device.kind}"
+        details_state.value = f"State: {device_state_text(device)}"
+        
+        # Reuse the action rows; one row says there is nothing to show
+        device_actions = controller.recent_actions(5, device=device.id)
+        lines = [f"{log.time} - {log.action} ({log.user})" for log in device_actions]
+        rows = details_actions.controls
+        del rows[max(len(lines), 1):]
+        while len(rows) < max(len(lines), 1):
+            rows.append(ft.Text(size=14))
+        if lines:
+            for row, line in zip(rows, lines):
+                row.value = line
+                row.color = "#111827"
+        else:
+            rows[0].value = "No recent actions"
+            rows[0].color = "#6B7280"
+        scheduler.mark_dirty(details_title, details_heading, details_id, details_type, details_state, details_actions)
+    
+    # Show device details
+    @scheduler.event
+    def show_device_details(device):
+        views.show("details", device)
     
     # Navigation functions
+    @scheduler.event
     def show_overview(e):
-        page.controls.clear()
-        page.add(overview_view)
-        page.update()
+        views.show("overview")
     
+    @INSTRUMENTS.timed("ui.show_statistics")
+    @scheduler.event
     def show_statistics(e):
+        views.show("statistics")
+    
+    @INSTRUMENTS.timed("ui.show_history")
+    @scheduler.event
+    def show_history(e):
+        views.show("history")
+    
+    # History filtered to one device, from its details page
+    @scheduler.event
+    def show_device_history(device_id):
+        clear_history_filters()
+        history_device.value = device_id
+        scheduler.mark_dirty(history_device)
+        apply_history_filters()
+        views.show("history")
+    
+    def refresh_statistics_view():
         update_chart_view()
-        page.controls.clear()
-        page.add(statistics_view)
-        page.update()
+        update_energy_report()
+        update_diagnostics()
+        if log_table_stale.current:
+            sync_action_log_table()
+            scheduler.mark_dirty(action_log_table)
     
-    # Chart bars container
-    chart_bars = ft.Row([], alignment=ft.MainAxisAlignment.SPACE_EVENLY, vertical_alignment=ft.CrossAxisAlignment.END, height=200)
+    # Export of the full action log and energy history, streamed in chunks
+    # on a background thread so the UI stays responsive
+    export_status = ft.Text("", size=12, color="#6B7280")
+    export_buttons = [
+        ft.ElevatedButton(
+            label,
+            bgcolor="#3B82F6",
+            color=ft.Colors.WHITE,
+            on_click=lambda e, file_format=file_format: start_export(file_format)
+        )
+        for label, file_format in (("Export CSV", "csv"), ("Export columnar", "columnar"))
+    ]
     
-    # Function to update chart
-    def update_chart_view():
-        chart_bars.controls.clear()
-        max_power = max(power_history) if max(power_history) > 0 else 1
-        current_hour = datetime.now().hour
-        
-        for hour_idx, hour_power in enumerate(power_history):
-            height = (hour_power / max_power) * 180 if max_power > 0 else 5
-            
-            if hour_power == 0:
-                color = "#22C55E"  # GREEN
-            elif hour_power < 50:
-                color = "#22C55E"
-            elif hour_power < 100:
-                color = "#F5A623"   # YELLOW
-            elif hour_power < 150:
-                color = "#FCD34D"   # LIGHT GOLD
-            else:
-                color = "#EF4444"   # RED
-            
-            border = ft.border.all(3, "#3B82F6") if hour_idx == current_hour else None
-            
-            chart_bars.controls.append(
-                ft.Container(
-                    width=30,
-                    height=max(height, 5),
-                    bgcolor=color,
-                    border_radius=3,
-                    border=border,
-                    tooltip=f"Hour {hour_idx}: {hour_power:.0f}W"
+    @scheduler.event
+    def set_export_status(text, running=None):
+        export_status.value = text
+        scheduler.mark_dirty(export_status)
+        if running is not None:
+            for button in export_buttons:
+                button.disabled = running
+            scheduler.mark_dirty(*export_buttons)
+    
+    def run_export(file_format):
+        done = []
+        try:
+            for kind, chunks in (("actions", controller_actions(controller)), ("energy", controller_energy(controller))):
+                path = export_path(EXPORT_DIR, kind, file_format)
+                stats = export_history(
+                    path, kind, chunks, file_format,
+                    progress=lambda rows, kind=kind: set_export_status(f"Exporting {kind}: {rows:,} rows")
                 )
-            )
+                done.append(str(stats))
+            set_export_status("\n".join(done), running=False)
+        except OSError as e:
+            set_export_status(f"Export failed: {e}", running=False)
+    
+    def start_export(file_format):
+        set_export_status("Exporting…", running=True)
+        threading.Thread(target=run_export, args=(file_format,), name="history-export", daemon=True).start()
+    
+    # Energy report: kWh and cost per day, week or month, the peak hours and
+    # each device's share. Closed periods are cached, so a refresh only
+    # recomputes the period in progress.
+    energy_analytics = analytics.EnergyAnalytics(controller, analytics.Tariff.from_dict(ENERGY_TARIFF)) if analytics else None
+    energy_period = ft.Ref[str]()
+    energy_period.current = "day"
+    energy_report_rows = ft.Column(spacing=4)
+    energy_peak_display = ft.Text(size=14, color="#111827")
+    energy_shares_display = ft.Text(size=14, color="#111827")
+    energy_period_buttons = {
+        period: ft.TextButton(label, on_click=lambda e, period=period: show_energy_period(period))
+        for label, period in (("Daily", "day"), ("Weekly", "week"), ("Monthly", "month"))
+    }
+    
+    @scheduler.event
+    def show_energy_period(period):
+        energy_period.current = period
+        update_energy_report()
+    
+    @INSTRUMENTS.timed("ui.update_energy_report")
+    def update_energy_report():
+        if energy_analytics is None:
+            return
+        period = energy_period.current
+        for name, button in energy_period_buttons.items():
+            # data marks the highlighted button
+            if button.data != (name == period):
+                button.data = name == period
+                button.style = ft.ButtonStyle(color="#FFFFFF" if button.data else "#3B82F6",
+                                              bgcolor="#3B82F6" if button.data else None)
+                scheduler.mark_dirty(button)
+        reports = energy_analytics.report(period, ENERGY_REPORT_PERIODS[period])
+        lines = [
+            f"{datetime.fromtimestamp(report.start).strftime(ENERGY_REPORT_LABELS[period])}"
+            f"{'' if report.closed else ' (so far)'}:  {report.kwh:.2f} kWh  ·  {ENERGY_CURRENCY}{report.cost:.2f}"
+            for report in reversed(reports)
+        ]
+        rows = energy_report_rows.controls
+        changed = len(rows) != len(lines)
+        del rows[len(lines):]
+        while len(rows) < len(lines):
+            rows.append(ft.Text(size=14, color="#111827"))
+        for row, line in zip(rows, lines):
+            if row.value != line:
+                row.value = line
+                changed = True
+        if changed:
+            scheduler.mark_dirty(energy_report_rows)
+        peaks = analytics.peak_hours(reports)
+        peak_text = "Peak hours: " + (", ".join(f"{hour:02d}:00" for hour in peaks) if peaks else "none yet")
+        names = {device.id: device.name for device in controller.devices()}
+        shares = analytics.device_shares(reports)
+        shares_text = "By device: " + (
+            ", ".join(f"{names.get(device_id, device_id)} {share:.0%}" for device_id, share in shares) if shares else "no use yet"
+        )
+        for display, text in ((energy_peak_display, peak_text), (energy_shares_display, shares_text)):
+            if display.value != text:
+                display.value = text
+                scheduler.mark_dirty(display)
+    
+    # Diagnostics: latency percentiles of the hot paths, render counters and
+    # size gauges from the shared instrumentation, read on demand
+    diagnostics_switch = ft.Switch(
+        label="Instrumentation",
+        value=INSTRUMENTS.enabled,
+        active_color="#3B82F6",
+        on_change=lambda e: set_instrumentation(e.control.value),
+    )
+    diagnostics_rows = ft.Column(spacing=2)
+    diagnostics_status = ft.Text("", size=12, color="#6B7280")
+    
+    @scheduler.event
+    def set_instrumentation(enabled):
+        INSTRUMENTS.enable(bool(enabled))
+        update_diagnostics()
+    
+    @scheduler.event
+    def refresh_diagnostics(e):
+        update_diagnostics()
+    
+    @scheduler.event
+    def reset_diagnostics(e):
+        INSTRUMENTS.reset()
+        update_diagnostics()
+    
+    @scheduler.event
+    def dump_diagnostics(e):
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(DIAGNOSTICS_DIR, f"diagnostics-{stamp}.json")
+        try:
+            diagnostics_status.value = f"Written to {INSTRUMENTS.dump(path)}"
+        except OSError as error:
+            diagnostics_status.value = f"Dump failed: {error}"
+        scheduler.mark_dirty(diagnostics_status)
+    
+    def diagnostics_lines():
+        snapshot = INSTRUMENTS.snapshot()
+        lines = []
+        for name, summary in snapshot["histograms"].items():
+            lines.append(f"{name:<30} n={summary['count']:<9,} p50 {summary['p50_ms']:8.3f}  "
+                         f"p95 {summary['p95_ms']:8.3f}  p99 {summary['p99_ms']:8.3f} ms")
+        for name, value in snapshot["counters"].items():
+            lines.append(f"{name:<30} {value:,}")
+        for name, value in snapshot["gauges"].items():
+            if isinstance(value, int) and name.endswith("bytes"):
+                value = f"{value / 1e6:,.1f} MB"
+            elif isinstance(value, int):
+                value = f"{value:,}"
+            lines.append(f"{name:<30} {value}")
+        if not snapshot["histograms"]:
+            lines.insert(0, "No timings yet" if INSTRUMENTS.enabled else "Instrumentation is off")
+        return lines
+    
+    def update_diagnostics():
+        if diagnostics_switch.value != INSTRUMENTS.enabled:
+            diagnostics_switch.value = INSTRUMENTS.enabled
+            scheduler.mark_dirty(diagnostics_switch)
+        lines = diagnostics_lines()
+        rows = diagnostics_rows.controls
+        changed = len(rows) != len(lines)
+        del rows[len(lines):]
+        while len(rows) < len(lines):
+            rows.append(ft.Text(size=12, color="#111827", font_family="monospace", no_wrap=True))
+        for row, line in zip(rows, lines):
+            if row.value != line:
+                row.value = line
+                changed = True
+        if changed:
+            scheduler.mark_dirty(diagnostics_rows)
+    
+    # Energy used so far today
+    energy_total_display = ft.Text("Today: 0 Wh", size=14, color="#6B7280")
+    
+    # Hourly energy chart; its bar controls are reused between renders
+    energy_chart = EnergyChart()
+    
+    # Function to update chart (only bars whose value changed are touched)
+    @INSTRUMENTS.timed("ui.update_chart_view")
+    def update_chart_view():
+        energy_history = controller.today_hourly()
+        total_text = f"Today: {sum(energy_history):.0f} Wh"
+        if energy_total_display.value != total_text:
+            energy_total_display.value = total_text
+            scheduler.mark_dirty(energy_total_display)
+        scheduler.mark_dirty(*energy_chart.update(energy_history, highlighted=datetime.fromtimestamp(controller.clock()).hour))
+    
+    # Header with navigation; the active view's button is highlighted
+    def build_header(active):
+        return ft.Container(
+            content=ft.Row([
+                ft.Icon(ft.Icons.HOME, color="#3B82F6", size=32),
+                ft.Text("Smart Home Controller", size=26, weight=ft.FontWeight.BOLD, color="#2563EB"),
+                ft.Container(expand=True),
+                ft.TextButton(
+                    "Overview", 
+                    on_click=show_overview, 
+                    style=ft.ButtonStyle(color="#3B82F6" if active == "overview" else "#6B7280")
+                ),
+                ft.TextButton(
+                    "Statistics", 
+                    on_click=show_statistics, 
+                    style=ft.ButtonStyle(color="#3B82F6" if active == "statistics" else "#6B7280")
+                ),
+                ft.TextButton(
+                    "History", 
+                    on_click=show_history, 
+                    style=ft.ButtonStyle(color="#3B82F6" if active == "history" else "#6B7280")
+                ),
+            ], alignment=ft.MainAxisAlignment.START),
+            bgcolor="#FFFFFF",
+            padding=15,
+            border_radius=ft.border_radius.only(top_left=10, top_right=10),
+            border=ft.border.all(1, "#E5E7EB"),
+        )
     
     # Overview View
-    overview_view = ft.Container(
-        content=ft.Column([
-            # Header
-            ft.Container(
-                content=ft.Row([
-                    ft.Icon(ft.Icons.HOME, color="#3B82F6", size=32),
-                    ft.Text("Smart Home Controller", size=26, weight=ft.FontWeight.BOLD, color="#2563EB"),
-                    ft.Container(expand=True),
-                    ft.TextButton(
-                        "Overview", 
-                        on_click=show_overview, 
-                        style=ft.ButtonStyle(color="#3B82F6")
-                    ),
-                    ft.TextButton(
-                        "Statistics", 
-                        on_click=show_statistics, 
-                        style=ft.ButtonStyle(color="#6B7280")
-                    ),
-                ], alignment=ft.MainAxisAlignment.START),
-                bgcolor="#FFFFFF",
-                padding=15,
-                border_radius=ft.border_radius.only(top_left=10, top_right=10),
-                border=ft.border.all(1, "#E5E7EB"),
-            ),
-            
-            ft.Container(
-                content=ft.Column([
-                    # Current Power Display
-                    ft.Container(
-                        content=ft.Row([
-                            ft.Icon(ft.Icons.BOLT, color="#2563EB", size=32),
-                            current_power_display,
-                        ]),
-                        bgcolor="#FFFFFF",
-                        padding=15,
-                        border_radius=10,
-                        border=ft.border.all(1, "#E5E7EB"),
-                    ),
-                    
-                    ft.Container(height=10),
-                    
-                    # On/Off Devices
-                    ft.Text("On/Off Devices", size=20, weight=ft.FontWeight.BOLD, color="#111827"),
-                    ft.Row([
-                        # Living Room Light
+    def build_overview_view():
+        return ft.Container(
+            content=ft.Column([
+                # Header
+                build_header("overview"),
+                
+                ft.Container(
+                    content=ft.Column([
+                        # Current Power Display
                         ft.Container(
-                            content=ft.Column([
-                                ft.Row([
-                                    ft.Icon(ft.Icons.LIGHTBULB, color="#2563EB", size=28),
-                                    ft.Text("Living Room Light", weight=ft.FontWeight.BOLD, color="#111827", size=15),
-                                ]),
-                                light_status,
-                                ft.Text("60W when ON", size=12, color="#6B7280"),
-                                ft.Row([
-                                    ft.TextButton("Details", on_click=show_light_details, style=ft.ButtonStyle(color="#3B82F6")),
-                                    light_button,
-                                ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
+                            content=ft.Row([
+                                ft.Icon(ft.Icons.BOLT, color="#2563EB", size=32),
+                                current_power_display,
                             ]),
                             bgcolor="#FFFFFF",
                             padding=15,
                             border_radius=10,
                             border=ft.border.all(1, "#E5E7EB"),
-                            expand=True,
                         ),
                         
-                        # Front Door
+                        ft.Container(height=10),
+                        
+                        # Scenes
+                        ft.Text("Scenes", size=20, weight=ft.FontWeight.BOLD, color="#111827"),
+                        ft.Row(scene_buttons, spacing=10, wrap=True),
+                        
+                        ft.Container(height=10),
+                        
+                        # On/Off Devices
+                        ft.Text("On/Off Devices", size=20, weight=ft.FontWeight.BOLD, color="#111827"),
+                        *build_device_rows(device for device in controller.devices() if not device.has_value),
+                        
+                        ft.Container(height=10),
+                        
+                        # Slider Controlled Devices
+                        ft.Text("Slider Controlled Devices", size=20, weight=ft.FontWeight.BOLD, color="#111827"),
+                        *build_device_rows(device for device in controller.devices() if device.has_value),
+                    ], scroll=ft.ScrollMode.AUTO),
+                    padding=20,
+                    expand=True,
+                ),
+            ]),
+            bgcolor="#F3F4F6",
+            expand=True,
+        )
+    
+    # Statistics View
+    def build_statistics_view():
+        return ft.Container(
+            content=ft.Column([
+                # Header
+                build_header("statistics"),
+                
+                ft.Container(
+                    content=ft.Column([
+                        # Energy Consumption Chart
+                        ft.Text("Energy Consumption (24 hours)", size=20, weight=ft.FontWeight.BOLD, color="#111827"),
+                        energy_total_display,
                         ft.Container(
                             content=ft.Column([
+                                energy_chart.control,
                                 ft.Row([
-                                    ft.Icon(ft.Icons.DOOR_BACK_DOOR, color="#3B82F6", size=28),
-                                    ft.Text("Front Door", weight=ft.FontWeight.BOLD, color="#111827", size=15),
-                                ]),
-                                door_status,
-                                ft.Text("5W when locked", size=12, color="#6B7280"),
+                                    # Labels run 1h..23h then 0h
+                                    *[ft.Text(f"{hour % 24}h", size=10, color="#6B7280") for hour in range(1, 25)],
+                                ], spacing=5, alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
                                 ft.Row([
-                                    ft.TextButton("Details", style=ft.ButtonStyle(color="#3B82F6")),
-                                    door_button,
-                                ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
+                                    ft.Container(width=15, height=15, bgcolor="#22C55E", border_radius=3),
+                                    ft.Text("Low (<50Wh)", size=10, color="#111827"),
+                                    ft.Container(width=15, height=15, bgcolor="#F5A623", border_radius=3),
+                                    ft.Text("Medium (50–100Wh)", size=10, color="#111827"),
+                                    ft.Container(width=15, height=15, bgcolor="#FCD34D", border_radius=3),
+                                    ft.Text("High (100–150Wh)", size=10, color="#111827"),
+                                    ft.Container(width=15, height=15, bgcolor="#EF4444", border_radius=3),
+                                    ft.Text("Very High (>150Wh)", size=10, color="#111827"),
+                                    ft.Container(width=20, height=15, border=ft.border.all(3, "#3B82F6"), border_radius=3),
+                                    ft.Text("Current Hour", size=10, color="#111827"),
+                                ], spacing=10, alignment=ft.MainAxisAlignment.CENTER, wrap=True),
                             ]),
                             bgcolor="#FFFFFF",
-                            padding=15,
+                            border=ft.border.all(2, "#3B82F6"),
                             border_radius=10,
-                            border=ft.border.all(1, "#E5E7EB"),
-                            expand=True,
+                            padding=15,
                         ),
-                    ], spacing=10),
-                    
-                    ft.Container(height=10),
-                    
-                    # Slider Controlled Devices
-                    ft.Text("Slider Controlled Devices", size=20, weight=ft.FontWeight.BOLD, color="#111827"),
-                    ft.Row([
-                        # Thermostat
+                        
+                        ft.Container(height=20),
+                        
+                        # Energy Report
+                        ft.Text("Energy Report", size=20, weight=ft.FontWeight.BOLD, color="#111827"),
                         ft.Container(
                             content=ft.Column([
-                                ft.Row([
-                                    ft.Icon(ft.Icons.THERMOSTAT, color="#3B82F6", size=28),
-                                    ft.Text("Thermostat", weight=ft.FontWeight.BOLD, color="#111827", size=15),
-                                ]),
-                                temp_display,
-                                ft.Text("Base 50W + 10W per °C diff", size=12, color="#6B7280"),
-                                temp_slider,
-                                ft.Row([
-                                    ft.TextButton("Details", style=ft.ButtonStyle(color="#3B82F6")),
-                                    thermostat_button,
-                                ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
-                            ]),
+                                ft.Row(list(energy_period_buttons.values()), spacing=5),
+                                energy_report_rows,
+                                ft.Divider(color="#E5E7EB"),
+                                energy_peak_display,
+                                energy_shares_display,
+                            ]) if energy_analytics is not None else ft.Text(
+                                "Install numpy for energy reports", size=14, color="#6B7280"
+                            ),
                             bgcolor="#FFFFFF",
+                            border=ft.border.all(1, "#E5E7EB"),
+                            border_radius=10,
                             padding=15,
+                        ),
+                        
+                        ft.Container(height=20),
+                        
+                        # Action Log
+                        ft.Text("Action Log", size=20, weight=ft.FontWeight.BOLD, color="#111827"),
+                        ft.Container(
+                            content=ft.Column([action_log_table], scroll=ft.ScrollMode.AUTO, height=250),
+                            bgcolor="#FFFFFF",
+                            border=ft.border.all(2, "#3B82F6"),
                             border_radius=10,
-                            border=ft.border.all(1, "#E5E7EB"),
-                            expand=True,
+                            padding=10,
                         ),
                         
-                        # Ceiling Fan
+                        ft.Container(height=20),
+                        
+                        # Diagnostics
+                        ft.Text("Diagnostics", size=20, weight=ft.FontWeight.BOLD, color="#111827"),
                         ft.Container(
                             content=ft.Column([
                                 ft.Row([
-                                    ft.Icon(ft.Icons.AIR, color="#3B82F6", size=28),
-                                    ft.Text("Ceiling Fan", weight=ft.FontWeight.BOLD, color="#111827", size=15),
-                                ]),
-                                fan_display,
-                                ft.Text("30W per speed level", size=12, color="#6B7280"),
-                                fan_slider,
-                                ft.TextButton("Details", style=ft.ButtonStyle(color="#3B82F6")),
+                                    diagnostics_switch,
+                                    ft.TextButton("Refresh", on_click=refresh_diagnostics,
+                                                  style=ft.ButtonStyle(color="#3B82F6")),
+                                    ft.TextButton("Reset", on_click=reset_diagnostics,
+                                                  style=ft.ButtonStyle(color="#3B82F6")),
+                                    ft.TextButton(f"Dump to {DIAGNOSTICS_DIR}/", on_click=dump_diagnostics,
+                                                  style=ft.ButtonStyle(color="#3B82F6")),
+                                ], spacing=10, wrap=True),
+                                diagnostics_rows,
+                                diagnostics_status,
                             ]),
                             bgcolor="#FFFFFF",
-                            padding=15,
+                            border=ft.border.all(1, "#E5E7EB"),
                             border_radius=10,
+                            padding=15,
+                        ),
+                        
+                        ft.Container(height=20),
+                        
+                        # Export
+                        ft.Text("Export", size=20, weight=ft.FontWeight.BOLD, color="#111827"),
+                        ft.Container(
+                            content=ft.Column([
+                                ft.Text(f"Action log and hourly energy, written to {EXPORT_DIR}/", size=14, color="#111827"),
+                                ft.Row(export_buttons, spacing=10),
+                                export_status,
+                            ]),
+                            bgcolor="#FFFFFF",
                             border=ft.border.all(1, "#E5E7EB"),
-                            expand=True,
+                            border_radius=10,
+                            padding=15,
                         ),
-                    ], spacing=10),
-                ], scroll=ft.ScrollMode.AUTO),
-                padding=20,
-                expand=True,
-            ),
-        ]),
-        bgcolor="#F3F4F6",
-        expand=True,
+                    ], scroll=ft.ScrollMode.AUTO, spacing=10),
+                    padding=20,
+                    expand=True,
+                ),
+            ]),
+            bgcolor="#F3F4F6",
+            expand=True,
+        )
+    
+    # Full action history. Only HISTORY_WINDOW_ROWS row controls exist; two
+    # spacers give the list the height of the whole history, and the rows
+    # are refilled from the pager as it scrolls.
+    # Filtered queries run against the indexed in-memory log instead.
+    full_history = LogPager(controller.history_bounds, controller.history)
+    history = ft.Ref[object]()
+    history.current = full_history
+    history_first = ft.Ref[int]()
+    history_first.current = 0
+    history_count_display = ft.Text(size=14, color="#6B7280")
+    
+    # Filter bar
+    history_device = ft.Dropdown(
+        label="Device",
+        value="all",
+        width=180,
+        options=[ft.dropdown.Option("all", "All devices")]
+                + [ft.dropdown.Option(device.id, device.name) for device in controller.devices()]
+                + [ft.dropdown.Option(BATCH_LOG_DEVICE, "Scenes"), ft.dropdown.Option("system", "System")],
+        on_change=lambda e: apply_history_filters(),
+    )
+    history_action = ft.Dropdown(
+        label="Action",
+        value="all",
+        width=180,
+        options=[ft.dropdown.Option("all", "All actions")]
+                + [ft.dropdown.Option(kind) for kind in controller.action_types()],
+        on_change=lambda e: apply_history_filters(),
     )
+    history_from = ft.TextField(label="From", hint_text="YYYY-MM-DD HH:MM", width=170,
+                                on_submit=lambda e: apply_history_filters(),
+                                on_blur=lambda e: apply_history_filters())
+    history_to = ft.TextField(label="To", hint_text="YYYY-MM-DD HH:MM", width=170,
+                              on_submit=lambda e: apply_history_filters(),
+                              on_blur=lambda e: apply_history_filters())
+    history_search = ft.TextField(label="Search", prefix_icon=ft.Icons.SEARCH, expand=True,
+                                  on_change=lambda e: search_history_later(),
+                                  on_submit=lambda e: search_history_now())
+    # Typing re-runs the query only once the user pauses
+    history_search_timer = ft.Ref[threading.Timer]()
     
-    # Statistics View
-    statistics_view = ft.Container(
-        content=ft.Column([
-            # Header
-            ft.Container(
-                content=ft.Row([
-                    ft.Icon(ft.Icons.HOME, color="#3B82F6", size=32),
-                    ft.Text("Smart Home Controller", size=26, weight=ft.FontWeight.BOLD, color="#2563EB"),
-                    ft.Container(expand=True),
-                    ft.TextButton(
-                        "Overview", 
-                        on_click=show_overview, 
-                        style=ft.ButtonStyle(color="#6B7280")
-                    ),
-                    ft.TextButton(
-                        "Statistics", 
-                        on_click=show_statistics, 
-                        style=ft.ButtonStyle(color="#3B82F6")
-                    ),
-                ], alignment=ft.MainAxisAlignment.START),
-                bgcolor="#FFFFFF",
-                padding=15,
-                border_radius=ft.border_radius.only(top_left=10, top_right=10),
-                border=ft.border.all(1, "#E5E7EB"),
-            ),
-            
-            ft.Container(
-                content=ft.Column([
-                    # Power Consumption Chart
-                    ft.Text("Power Consumption (24 hours)", size=20, weight=ft.FontWeight.BOLD, color="#111827"),
-                    ft.Container(
-                        content=ft.Column([
-                            chart_bars,
-                            ft.Row([
-                                ft.Text("1h", size=10, color="#6B7280"),
-                                ft.Text("2h", size=10, color="#6B7280"),
-                                ft.Text("3h", size=10, color="#6B7280"),
-                                ft.Text("4h", size=10, color="#6B7280"),
-                                ft.Text("5h", size=10, color="#6B7280"),
-                                ft.Text("6h", size=10, color="#6B7280"),
-                                ft.Text("7h", size=10, color="#6B7280"),
-                                ft.Text("8h", size=10, color="#6B7280"),
-                                ft.Text("9h", size=10, color="#6B7280"),
-                                ft.Text("10h", size=10, color="#6B7280"),
-                                ft.Text("11h", size=10, color="#6B7280"),
-                                ft.Text("12h", size=10, color="#6B7280"),
-                                ft.Text("13h", size=10, color="#6B7280"),
-                                ft.Text("14h", size=10, color="#6B7280"),
-                                ft.Text("15h", size=10, color="#6B7280"),
-                                ft.Text("16h", size=10, color="#6B7280"),
-                                ft.Text("17h", size=10, color="#6B7280"),
-                                ft.Text("18h", size=10, color="#6B7280"),
-                                ft.Text("19h", size=10, color="#6B7280"),
-                                ft.Text("20h", size=10, color="#6B7280"),
-                                ft.Text("21h", size=10, color="#6B7280"),
-                                ft.Text("22h", size=10, color="#6B7280"),
-                                ft.Text("23h", size=10, color="#6B7280"),
-                                ft.Text("0h", size=10, color="#6B7280"),
-                            ], spacing=5, alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
-                            ft.Row([
-                                ft.Container(width=15, height=15, bgcolor="#22C55E", border_radius=3),
-                                ft.Text("Low (<50W)", size=10, color="#111827"),
-                                ft.Container(width=15, height=15, bgcolor="#F5A623", border_radius=3),
-                                ft.Text("Medium (50–100W)", size=10, color="#111827"),
-                                ft.Container(width=15, height=15, bgcolor="#FCD34D", border_radius=3),
-                                ft.Text("High (100–150W)", size=10, color="#111827"),
-                                ft.Container(width=15, height=15, bgcolor="#EF4444", border_radius=3),
-                                ft.Text("Very High (>150W)", size=10, color="#111827"),
-                                ft.Container(width=20, height=15, border=ft.border.all(3, "#3B82F6"), border_radius=3),
-                                ft.Text("Current Hour", size=10, color="#111827"),
-                            ], spacing=10, alignment=ft.MainAxisAlignment.CENTER, wrap=True),
-                        ]),
-                        bgcolor="#FFFFFF",
-                        border=ft.border.all(2, "#3B82F6"),
-                        border_radius=10,
-                        padding=15,
-                    ),
-                    
-                    ft.Container(height=20),
-                    
-                    # Action Log
-                    ft.Text("Action Log", size=20, weight=ft.FontWeight.BOLD, color="#111827"),
-                    ft.Container(
-                        content=ft.Column([action_log_table], scroll=ft.ScrollMode.AUTO, height=250),
-                        bgcolor="#FFFFFF",
-                        border=ft.border.all(2, "#3B82F6"),
-                        border_radius=10,
-                        padding=10,
-                    ),
-                ], scroll=ft.ScrollMode.AUTO, spacing=10),
-                padding=20,
-                expand=True,
-            ),
-        ]),
-        bgcolor="#F3F4F6",
-        expand=True,
+    def search_history_later():
+        if history_search_timer.current is not None:
+            history_search_timer.current.cancel()
+        history_search_timer.current = threading.Timer(HISTORY_SEARCH_DEBOUNCE, apply_history_filters)
+        history_search_timer.current.daemon = True
+        history_search_timer.current.start()
+    
+    def search_history_now():
+        if history_search_timer.current is not None:
+            history_search_timer.current.cancel()
+        apply_history_filters()
+    
+    def read_history_filters():
+        filters = {}
+        if history_device.value not in (None, "all"):
+            filters["device"] = history_device.value
+        if history_action.value not in (None, "all"):
+            filters["action"] = history_action.value
+        for field, key in ((history_from, "start"), (history_to, "end")):
+            error = None
+            if (field.value or "").strip():
+                try:
+                    filters[key] = parse_filter_time(field.value, end=key == "end")
+                except ValueError:
+                    error = "Use YYYY-MM-DD HH:MM or HH:MM"
+            if (field.error_text or None) != error:
+                field.error_text = error
+                scheduler.mark_dirty(field)
+        if (history_search.value or "").strip():
+            filters["text"] = history_search.value
+        return filters
+    
+    @INSTRUMENTS.timed("ui.apply_history_filters")
+    @scheduler.event
+    def apply_history_filters():
+        filters = read_history_filters()
+        if filters:
+            history.current = QueryPager(lambda limit, **cursor: controller.find_actions(limit, **filters, **cursor),
+                                         stop=lambda: controller.history_bounds()[1])
+        else:
+            history.current = full_history
+        history_first.current = 0
+        refresh_history_view()
+    
+    def clear_history_filters():
+        history_device.value = "all"
+        history_action.value = "all"
+        history_from.value = history_to.value = history_search.value = ""
+        scheduler.mark_dirty(history_device, history_action, history_from, history_to, history_search)
+    
+    @scheduler.event
+    def reset_history_filters(e):
+        clear_history_filters()
+        apply_history_filters()
+    
+    # Timeline scrubber: every device's state at a past moment, rebuilt from
+    # the store's nearest checkpoint plus the few actions logged after it.
+    # timeline_at is None while the timeline follows the present.
+    timeline_at = ft.Ref[float]()
+    timeline_start = ft.Ref[float]()
+    timeline_slider = ft.Slider(min=0, max=1, value=1, expand=True,
+                                active_color="#3B82F6", inactive_color="#E5E7EB")
+    timeline_time = ft.Text(size=14, weight=ft.FontWeight.BOLD, color="#111827")
+    timeline_states = ft.Text(size=13, color="#6B7280")
+    
+    def set_timeline_text(time_text, states_text):
+        if timeline_time.value != time_text or timeline_states.value != states_text:
+            timeline_time.value = time_text
+            timeline_states.value = states_text
+            scheduler.mark_dirty(timeline_time, timeline_states)
+    
+    def past_device_text(device, on, value):
+        text = f"{device.name}: {status_text(device, value, on)}"
+        if device.has_value and device.toggle:
+            text += " (ON)" if on else " (OFF)"
+        return text
+    
+    def show_timeline_state(ts):
+        past = controller.state_at(ts)
+        if past is None:
+            set_timeline_text("Timeline unavailable", "Enable persistence (PERSISTENCE_PATH) to look back in time")
+            return
+        label = "Now" if timeline_at.current is None else datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+        states = [past_device_text(device, *past.states[device.id]) for device in controller.devices()]
+        set_timeline_text(f"{label} · {past.power:.0f}W", " · ".join(states))
+    
+    # Stretch the slider from the first logged action to now; called whenever
+    # the History view is shown or reloaded
+    def refresh_timeline():
+        now = controller.clock()
+        if timeline_start.current is None:
+            first = controller.history(0, 1)
+            if first:
+                timeline_start.current = first[0].timestamp
+        start = timeline_start.current if timeline_start.current is not None else now
+        end = max(now, start + 1)
+        value = end if timeline_at.current is None else min(max(timeline_at.current, start), end)
+        disabled = controller.store is None
+        if (timeline_slider.min, timeline_slider.max, timeline_slider.value, timeline_slider.disabled) != (start, end, value, disabled):
+            timeline_slider.min = start
+            timeline_slider.max = end
+            timeline_slider.value = value
+            timeline_slider.disabled = disabled
+            scheduler.mark_dirty(timeline_slider)
+        # A past moment's state never changes; only the present needs redrawing
+        if timeline_at.current is None or timeline_time.value is None:
+            show_timeline_state(value)
+    
+    @INSTRUMENTS.timed("ui.scrub_timeline")
+    @scheduler.event
+    def scrub_timeline(ts):
+        # Dragging to the right end goes back to following the present
+        timeline_at.current = None if ts >= timeline_slider.max else ts
+        show_timeline_state(ts)
+    
+    @scheduler.event
+    def timeline_to_now(e):
+        timeline_at.current = None
+        refresh_timeline()
+    
+    SliderInput(
+        timeline_slider,
+        on_preview=scrub_timeline,
+        on_commit=scrub_timeline,
+        debounce=0.2,
+        preview_fps=TIMELINE_PREVIEW_FPS,
     )
     
-    # Initialize
-    add_action("system", "Initialized - All devices OFF")
-    update_power_history()
+    history_top = ft.Container(height=0)
+    history_bottom = ft.Container(height=0)
+    history_rows = []
+    
+    def make_history_row():
+        return ft.Container(
+            content=ft.Row(
+                [ft.Text(size=13, color="#111827", width=width, no_wrap=True) for width in HISTORY_COLUMN_WIDTHS],
+                spacing=10,
+            ),
+            height=HISTORY_ROW_HEIGHT,
+            border=ft.border.only(bottom=ft.BorderSide(1, "#E5E7EB")),
+        )
+    
+    # A filtered query that has to search the store runs on a worker thread;
+    # the view shows the matches loaded so far until it is done. Holds the
+    # pager being loaded, None when idle.
+    history_loading = ft.Ref[object]()
+    
+    def load_history_matches(pager, first):
+        try:
+            pager.newest(first, HISTORY_WINDOW_ROWS)
+        finally:
+            history_matches_loaded(pager)
+    
+    @scheduler.event
+    def history_matches_loaded(pager):
+        if history_loading.current is pager:
+            history_loading.current = None
+        if history.current is pager:
+            refresh_history_view()
+    
+    @INSTRUMENTS.timed("ui.refresh_history_view")
+    def refresh_history_view():
+        pager = history.current
+        first = min(history_first.current, max(len(pager) - HISTORY_WINDOW_ROWS, 0))
+        history_first.current = first
+        if pager is full_history:
+            entries = pager.newest(first, HISTORY_WINDOW_ROWS)
+        else:
+            if pager.needs_fetch(first, HISTORY_WINDOW_ROWS) and history_loading.current is not pager:
+                history_loading.current = pager
+                threading.Thread(target=load_history_matches, args=(pager, first),
+                                 name="history-query", daemon=True).start()
+            entries = pager.loaded(first, HISTORY_WINDOW_ROWS)
+        # Query results grow as they are read
+        count = len(pager)
+        if pager is full_history:
+            count_text = f"{count:,} actions"
+        elif history_loading.current is pager:
+            count_text = f"{count:,}+ matches, searching…"
+        else:
+            more = "" if pager.exhausted else "+"
+            count_text = f"{count:,}{more} matches"
+        if history_count_display.value != count_text:
+            history_count_display.value = count_text
+            scheduler.mark_dirty(history_count_display)
+        for row, entry in zip(history_rows, entries):
+            values = (f"{entry.date} {entry.time}", entry.device, entry.action, entry.user)
+            for cell, value in zip(row.content.controls, values):
+                if cell.value != value:
+                    cell.value = value
+                    scheduler.mark_dirty(cell)
+            if not row.visible:
+                row.visible = True
+                scheduler.mark_dirty(row)
+        for row in history_rows[len(entries):]:
+            if row.visible:
+                row.visible = False
+                scheduler.mark_dirty(row)
+        top = first * HISTORY_ROW_HEIGHT
+        bottom = (count - first - len(entries)) * HISTORY_ROW_HEIGHT
+        if history_top.height != top or history_bottom.height != bottom:
+            history_top.height = top
+            history_bottom.height = bottom
+            scheduler.mark_dirty(history_top, history_bottom)
+    
+    # Pick up new actions (and new matches of a filter), then redraw
+    def reload_history_view():
+        if history.current is not full_history:
+            history.current.refresh()
+        refresh_history_view()
+        refresh_timeline()
+    
+    @INSTRUMENTS.timed("ui.scroll_history")
+    @scheduler.event
+    def scroll_history(e):
+        first = max(int(e.pixels // HISTORY_ROW_HEIGHT) - HISTORY_OVERSCAN_ROWS, 0)
+        if first != history_first.current:
+            history_first.current = first
+            refresh_history_view()
+    
+    def build_history_view():
+        history_rows[:] = [make_history_row() for _ in range(HISTORY_WINDOW_ROWS)]
+        return ft.Container(
+            content=ft.Column([
+                # Header
+                build_header("history"),
+                
+                ft.Container(
+                    content=ft.Column([
+                        ft.Container(
+                            content=ft.Column([
+                                ft.Row([
+                                    ft.Text("Timeline", size=16, weight=ft.FontWeight.BOLD, color="#111827"),
+                                    timeline_slider,
+                                    ft.TextButton("Now", on_click=timeline_to_now, style=ft.ButtonStyle(color="#3B82F6")),
+                                ]),
+                                timeline_time,
+                                timeline_states,
+                            ], spacing=4),
+                            bgcolor="#FFFFFF",
+                            border=ft.border.all(1, "#E5E7EB"),
+                            border_radius=10,
+                            padding=10,
+                        ),
+                        ft.Text("Action History", size=20, weight=ft.FontWeight.BOLD, color="#111827"),
+                        ft.Row([
+                            history_device,
+                            history_action,
+                            history_from,
+                            history_to,
+                            history_search,
+                            ft.TextButton("Clear", on_click=reset_history_filters, style=ft.ButtonStyle(color="#3B82F6")),
+                        ], spacing=10),
+                        history_count_display,
+                        ft.Container(
+                            content=ft.Column([
+                                ft.Row(
+                                    [ft.Text(title, width=width, weight=ft.FontWeight.BOLD, color="#3B82F6")
+                                     for title, width in zip(("Time", "Device", "Action", "User"), HISTORY_COLUMN_WIDTHS)],
+                                    spacing=10,
+                                ),
+                                ft.ListView(
+                                    [history_top, *history_rows, history_bottom],
+                                    spacing=0,
+                                    expand=True,
+                                    on_scroll=scroll_history,
+                                    on_scroll_interval=HISTORY_SCROLL_INTERVAL_MS,
+                                ),
+                            ], expand=True),
+                            bgcolor="#FFFFFF",
+                            border=ft.border.all(2, "#3B82F6"),
+                            border_radius=10,
+                            padding=10,
+                            expand=True,
+                        ),
+                    ], spacing=10, expand=True),
+                    padding=20,
+                    expand=True,
+                ),
+            ]),
+            bgcolor="#F3F4F6",
+            expand=True,
+        )
+    
+    views.register("overview", build_overview_view)
+    views.register("statistics", build_statistics_view, refresh_statistics_view)
+    views.register("details", build_details_view, refresh_details_view)
+    views.register("history", build_history_view, reload_history_view)
+    
+    # Stop receiving changes once the session ends. Not on disconnect: flet
+    # reports transient websocket drops that way and the session then
+    # reconnects, still showing the controls this session keeps updating.
+    page.on_close = lambda e: detach()
     
     # Show overview by default
-    page.add(overview_view)
+    with scheduler.batch():
+        views.show("overview")
+    views.first_frame_ms = (time.perf_counter() - startup_started) * 1000
+    # Returned for the UI benchmarks, which report the view timings
+    return views
 
 # Run the app
-ft.app(target=main)
+if __name__ == "__main__":
+    ft.app(target=main)
@@ -0,0 +1,165 @@
+import json
+import math
+import os
+import threading
+import time
+from array import array
+from functools import wraps
+
+# Histogram buckets per doubling of latency (about 19% wide each)
+BUCKETS_PER_OCTAVE = 4
+
+# Latencies are recorded in nanoseconds; 2^40 ns is about 18 minutes
+HISTOGRAM_OCTAVES = 40
+
+# Percentiles shown and dumped for every histogram
+PERCENTILES = (50, 95, 99)
+
+
+class Histogram:
+    # Latency histogram with logarithmic buckets: recording is an index
+    # computation and an increment, memory is fixed, and percentiles are
+    # read from the cumulative counts (accurate to one bucket). Updates from
+    # several threads are not locked, so counts are approximate under
+    # contention, which is fine for diagnostics.
+
+    def __init__(self):
+        self.counts = array("q", [0]) * (HISTOGRAM_OCTAVES * BUCKETS_PER_OCTAVE)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, nanoseconds):
+        index = int(math.log2(nanoseconds) * BUCKETS_PER_OCTAVE) if nanoseconds > 1 else 0
+        self.counts[min(index, len(self.counts) - 1)] += 1
+        self.count += 1
+        self.total += nanoseconds
+        if nanoseconds > self.max:
+            self.max = nanoseconds
+
+    # Upper bound (ns) of the bucket holding the q-th percentile
+    def percentile(self, q):
+        if not self.count:
+            return 0
+        rank = math.ceil(self.count * q / 100)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(2 ** ((index + 1) / BUCKETS_PER_OCTAVE), self.max)
+        return self.max
+
+    # Summary in milliseconds
+    def summary(self):
+        summary = {"count": self.count, "mean_ms": self.total / self.count / 1e6 if self.count else 0.0}
+        for q in PERCENTILES:
+            summary[f"p{q}_ms"] = self.percentile(q) / 1e6
+        summary["max_ms"] = self.max / 1e6
+        return summary
+
+
+class Instruments:
+    # Process-wide latency histograms, counters and gauges. Everything is
+    # switchable at runtime: while disabled, a timed function costs one
+    # attribute check on top of the call and counters are not touched.
+    # Gauges are functions evaluated only when a snapshot is taken.
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def disable(self):
+        self.enabled = False
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def record(self, name, nanoseconds):
+        if self.enabled:
+            self.histogram(name).record(nanoseconds)
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    # Register fn() as a gauge; registering the same name again replaces it
+    def gauge(self, name, fn):
+        self.gauges[name] = fn
+
+    def remove_gauge(self, name):
+        self.gauges.pop(name, None)
+
+    # Decorator recording each call's latency in the `name` histogram
+    def timed(self, name):
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter_ns()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.histogram(name).record(time.perf_counter_ns() - start)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+
+    def snapshot(self):
+        gauges = {}
+        for name, fn in list(self.gauges.items()):
+            try:
+                gauges[name] = fn()
+            except Exception as e:
+                gauges[name] = f"error: {e}"
+        return {
+            "enabled": self.enabled,
+            "time": time.time(),
+            "histograms": {name: histogram.summary() for name, histogram in sorted(self.histograms.items())},
+            "counters": dict(sorted(self.counters.items())),
+            "gauges": gauges,
+        }
+
+    # Write a snapshot as JSON; returns the path
+    def dump(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        return path
+
+
+# Resident memory of this process in bytes, None where it cannot be read
+def process_memory():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Peak rather than current size; kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+# Shared by the controller, the render scheduler and the UI
+INSTRUMENTS = Instruments()
+INSTRUMENTS.gauge("process.memory_bytes", process_memory)
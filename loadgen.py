@@ -0,0 +1,319 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from automation import Command, Scene
+from devices import door_lock, fan, light, thermostat
+from energy import HOUR
+from home_controller import HomeController
+from instrumentation import INSTRUMENTS, Histogram, process_memory
+from storage import HomeStore
+
+# Relative activity by local hour of day: quiet at night, a morning peak
+# and a longer evening one
+DAILY_ACTIVITY = (
+    0.05, 0.02, 0.02, 0.02, 0.02, 0.05, 0.4, 1.0, 0.9, 0.4, 0.3, 0.3,
+    0.4, 0.4, 0.3, 0.3, 0.5, 0.8, 1.0, 1.0, 0.9, 0.7, 0.5, 0.2,
+)
+
+# Share of each kind of event
+EVENT_MIX = {"toggle": 0.6, "slider": 0.3, "scene": 0.1}
+
+# Scene most likely at each local hour (Away in the morning, Welcome home
+# in the evening, Night mode late); other hours pick one at random
+SCENE_HOURS = {6: "Away", 7: "Away", 8: "Away", 17: "Welcome home", 18: "Welcome home",
+               19: "Welcome home", 22: "Night mode", 23: "Night mode", 0: "Night mode"}
+
+# Device kinds of a generated household, repeated until the count is reached
+HOUSEHOLD_MIX = ("light", "light", "light", "door", "thermostat", "fan")
+
+# Simulated start: a local midnight, so runs with the same seed match
+SIMULATION_START = datetime(2025, 1, 6).timestamp()
+
+
+class SimulatedClock:
+    # Stands in for time.time in the controller and its meters: the time only
+    # moves when the load generator advances it, so a simulated month runs
+    # as fast as the controller can process its events
+
+    def __init__(self, start=SIMULATION_START):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance_to(self, ts):
+        self.now = max(self.now, ts)
+
+
+# `count` devices in the HOUSEHOLD_MIX proportions, with ids light1, light2, ...
+def household(count):
+    factories = {"light": light, "door": door_lock, "thermostat": thermostat, "fan": fan}
+    names = {"light": "Light", "door": "Door", "thermostat": "Thermostat", "fan": "Fan"}
+    numbers = {}
+    devices = []
+    for i in range(count):
+        kind = HOUSEHOLD_MIX[i % len(HOUSEHOLD_MIX)]
+        numbers[kind] = numbers.get(kind, 0) + 1
+        devices.append(factories[kind](f"{kind}{numbers[kind]}", f"{names[kind]} {numbers[kind]}"))
+    return devices
+
+
+# The three everyday scenes over every device of a household
+def household_scenes(devices):
+    def scene(name, lights, doors, set_point, fans):
+        commands = []
+        for device in devices:
+            if device.kind == "light":
+                commands.append(Command(device.id, on=lights))
+            elif device.kind == "door":
+                commands.append(Command(device.id, on=doors))
+            elif device.kind == "thermostat":
+                commands.append(Command(device.id, on=set_point is not None, value=set_point))
+            elif device.kind == "fan" and fans is not None:
+                commands.append(Command(device.id, value=fans))
+        return Scene(name, commands)
+
+    return {
+        "Night mode": scene("Night mode", False, True, 19, 1),
+        "Away": scene("Away", False, True, None, 0),
+        "Welcome home": scene("Welcome home", True, False, 21, None),
+    }
+
+
+class LoadSample:
+    # One point of the growth curves, taken every sample interval of simulated time
+    __slots__ = ("ts", "events", "wall", "events_per_sec", "memory", "log_entries", "log_bytes")
+
+    def __init__(self, ts, events, wall, events_per_sec, memory, log_entries, log_bytes):
+        self.ts = ts
+        self.events = events
+        self.wall = wall
+        self.events_per_sec = events_per_sec
+        self.memory = memory
+        self.log_entries = log_entries
+        self.log_bytes = log_bytes
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class LoadReport:
+    # Throughput, per-kind latency and the growth curves of one run
+
+    def __init__(self, seed, devices, users, rate, start, end, events, wall, latency, samples, final_power):
+        self.seed = seed
+        self.devices = devices
+        self.users = users
+        self.rate = rate
+        self.start = start
+        self.end = end
+        self.events = events
+        self.wall = wall
+        self.latency = latency
+        self.samples = samples
+        self.final_power = final_power
+
+    @property
+    def events_per_sec(self):
+        return self.events / self.wall if self.wall else 0.0
+
+    # Simulated seconds per wall-clock second
+    @property
+    def speedup(self):
+        return (self.end - self.start) / self.wall if self.wall else 0.0
+
+    @property
+    def memory_growth(self):
+        memory = [sample.memory for sample in self.samples if sample.memory is not None]
+        return memory[-1] - memory[0] if len(memory) > 1 else 0
+
+    def as_dict(self):
+        return {
+            "seed": self.seed,
+            "devices": self.devices,
+            "users": self.users,
+            "rate_per_hour": self.rate,
+            "simulated_days": (self.end - self.start) / 86400,
+            "events": self.events,
+            "wall_seconds": self.wall,
+            "events_per_sec": self.events_per_sec,
+            "speedup": self.speedup,
+            "memory_growth_bytes": self.memory_growth,
+            "final_power": self.final_power,
+            "latency": {kind: histogram.summary() for kind, histogram in sorted(self.latency.items())},
+            "samples": [sample.as_dict() for sample in self.samples],
+        }
+
+
+class LoadGenerator:
+    # Seeded stream of household events (toggles, slider drags, scenes by
+    # several users) replayed against a controller on a simulated clock.
+    #
+    # Events arrive as a Poisson process whose rate follows DAILY_ACTIVITY;
+    # `rate` is the mean number of events per simulated hour over a day. The
+    # same seed, device count and settings give the same events, timestamps
+    # and final state. Only the controller call is timed; choosing the next
+    # event is not.
+
+    def __init__(self, controller, clock, seed=0, rate=60, users=2, mix=EVENT_MIX):
+        self.controller = controller
+        self.clock = clock
+        self.seed = seed
+        self.rate = rate
+        self.users = [f"User {n}" for n in range(1, users + 1)]
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        devices = controller.devices()
+        self.switches = [device for device in devices if device.toggle]
+        self.sliders = [device for device in devices if device.has_value]
+        self.scenes = household_scenes(devices)
+        self.events = 0
+        self.latency = {kind: Histogram() for kind in self.kinds}
+        self._random = random.Random(seed)
+        self._peak = max(DAILY_ACTIVITY)
+        self._peak_rate = rate * self._peak / (sum(DAILY_ACTIVITY) / len(DAILY_ACTIVITY))
+
+    # Time of the next event after ts: candidates at the peak rate, kept
+    # with probability activity / peak (thinning)
+    def next_time(self, ts):
+        while True:
+            ts += self._random.expovariate(self._peak_rate / HOUR)
+            if self._random.random() * self._peak < DAILY_ACTIVITY[datetime.fromtimestamp(ts).hour]:
+                return ts
+
+    # The controller call of the next event, as (kind, function)
+    def next_event(self, ts):
+        kind = self._random.choices(self.kinds, self.weights)[0]
+        user = self._random.choice(self.users)
+        if kind == "toggle" and self.switches:
+            device = self._random.choice(self.switches)
+            return kind, lambda: self.controller.toggle(device.id, user=user)
+        if kind == "slider" and self.sliders:
+            # A drag only reaches the controller as its committed value
+            device = self._random.choice(self.sliders)
+            value = device.min_value + (device.max_value - device.min_value) * \
+                self._random.randint(0, device.divisions) / device.divisions
+            return kind, lambda: self.controller.set_value(device.id, value, user=user)
+        name = SCENE_HOURS.get(datetime.fromtimestamp(ts).hour) or self._random.choice(sorted(self.scenes))
+        return "scene", lambda: self.scenes[name].run(self.controller, user=user)
+
+    # Generate events for `seconds` of simulated time, sampling the growth
+    # curves every `sample_every` simulated seconds; on_sample(sample) is
+    # called with each sample as it is taken
+    def run(self, seconds, sample_every=86400, on_sample=None):
+        start = self.clock()
+        end = start + seconds
+        samples = []
+        next_sample = start
+        window_events, window_wall = 0, 0.0
+        wall_start = time.perf_counter()
+        ts = self.next_time(start)
+        while True:
+            while next_sample <= min(ts, end):
+                wall = time.perf_counter() - wall_start
+                rate = (self.events - window_events) / (wall - window_wall) if wall > window_wall else 0.0
+                log = self.controller.action_log
+                sample = LoadSample(next_sample, self.events, wall, rate, process_memory(), len(log), log.nbytes)
+                samples.append(sample)
+                if on_sample is not None:
+                    on_sample(sample)
+                window_events, window_wall = self.events, wall
+                next_sample += sample_every
+            if ts > end:
+                break
+            self.clock.advance_to(ts)
+            kind, call = self.next_event(ts)
+            started = time.perf_counter_ns()
+            call()
+            self.latency[kind].record(time.perf_counter_ns() - started)
+            self.events += 1
+            ts = self.next_time(ts)
+        self.clock.advance_to(end)
+        self.controller.record_power()
+        wall = time.perf_counter() - wall_start
+        return LoadReport(self.seed, len(self.controller.registry), len(self.users), self.rate, start, end,
+                          self.events, wall, self.latency, samples, self.controller.power())
+
+
+def _megabytes(size):
+    return "-" if size is None else f"{size / 2 ** 20:,.1f}"
+
+
+def print_sample(sample):
+    print(f"{datetime.fromtimestamp(sample.ts):%Y-%m-%d %H:%M}  {sample.events:>10,}  {sample.wall:>8.1f}s"
+          f"  {sample.events_per_sec:>10,.0f}/s  {_megabytes(sample.memory):>9} MB  {sample.log_entries:>9,}"
+          f"  {_megabytes(sample.log_bytes):>8} MB")
+
+
+def print_report(report):
+    summary = report.as_dict()
+    print(f"{summary['events']:,} events over {summary['simulated_days']:.1f} simulated days"
+          f" in {summary['wall_seconds']:.1f}s: {summary['events_per_sec']:,.0f} events/s,"
+          f" {summary['speedup']:,.0f}x real time")
+    print(f"memory growth {_megabytes(summary['memory_growth_bytes'])} MB, final power {report.final_power}W")
+    for kind, latency in summary["latency"].items():
+        if latency["count"]:
+            print(f"  {kind:<8} n={latency['count']:,}  p50={latency['p50_ms']:.3f}ms"
+                  f"  p95={latency['p95_ms']:.3f}ms  p99={latency['p99_ms']:.3f}ms  max={latency['max_ms']:.3f}ms")
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a simulated household against the controller faster than real time")
+    parser.add_argument("--devices", type=int, default=24, help="devices in the household")
+    parser.add_argument("--users", type=int, default=2)
+    parser.add_argument("--rate", type=float, default=60, help="mean events per simulated hour")
+    parser.add_argument("--days", type=float, default=30, help="simulated days to run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-capacity", type=int, default=10000, help="actions kept in memory")
+    parser.add_argument("--store", nargs="?", const="", help="persist to this SQLite file (a temporary one if omitted)")
+    parser.add_argument("--sample-hours", type=float, default=24, help="simulated hours between samples")
+    parser.add_argument("--instrument", action="store_true", help="also collect the controller's own timings")
+    parser.add_argument("--json", help="write the report (and instrumentation) to this file")
+    args = parser.parse_args(argv)
+
+    clock = SimulatedClock()
+    temporary = None
+    store = None
+    if args.store is not None:
+        path = args.store
+        if not path:
+            temporary = tempfile.TemporaryDirectory()
+            path = os.path.join(temporary.name, "loadgen.db")
+        store = HomeStore(path)
+        store.start()
+    controller = HomeController(household(args.devices), log_capacity=args.log_capacity, store=store, clock=clock)
+    if args.instrument:
+        INSTRUMENTS.reset()
+        INSTRUMENTS.enable()
+    generator = LoadGenerator(controller, clock, seed=args.seed, rate=args.rate, users=args.users)
+
+    print(f"{'simulated':<16}  {'events':>10}  {'wall':>9}  {'throughput':>12}  {'memory':>12}  {'log':>9}  {'log size':>11}")
+    try:
+        report = generator.run(args.days * 86400, sample_every=args.sample_hours * HOUR, on_sample=print_sample)
+        started = time.perf_counter()
+        controller.close()
+        close_seconds = time.perf_counter() - started
+    finally:
+        if temporary is not None:
+            temporary.cleanup()
+    print_report(report)
+    if store is not None:
+        print(f"store flushed in {close_seconds:.2f}s after the run")
+    if args.json:
+        result = report.as_dict()
+        if args.instrument:
+            result["instrumentation"] = INSTRUMENTS.snapshot()
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"report written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
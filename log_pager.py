@@ -0,0 +1,153 @@
+import threading
+from collections import OrderedDict
+
+# Entries fetched from the history per read
+PAGE_SIZE = 200
+
+# Full pages kept in memory; the history is append-only, so they never go stale
+CACHED_PAGES = 16
+
+
+class LogPager:
+    # Windowed, newest-first access to a history that may be far larger than
+    # memory. bounds() returns (first, stop) positions and fetch(start, stop)
+    # returns the entries in that range, oldest first. The history is read in
+    # fixed pages aligned to PAGE_SIZE; complete pages are cached (LRU), the
+    # newest partial page is re-read since it is still growing. Pages are
+    # cached by the position they start at: once a ring drops the start of a
+    # page, what is left of it is a different (partial, uncached) page.
+
+    def __init__(self, bounds, fetch, page_size=PAGE_SIZE, cached_pages=CACHED_PAGES):
+        self.bounds = bounds
+        self.fetch = fetch
+        self.page_size = page_size
+        self.cached_pages = cached_pages
+        self.fetches = 0
+        self._pages = OrderedDict()
+
+    def __len__(self):
+        first, stop = self.bounds()
+        return stop - first
+
+    # Up to n entries starting at the index-th newest (0 is the newest entry)
+    def newest(self, index, n):
+        first, stop = self.bounds()
+        high = stop - index
+        low = max(high - n, first)
+        if high <= low:
+            return []
+        entries = []
+        for number in range(low // self.page_size, (high - 1) // self.page_size + 1):
+            # The oldest page may be cut short by entries the history dropped
+            page_start = max(number * self.page_size, first)
+            page = self._page(page_start, min((number + 1) * self.page_size, stop))
+            entries.extend(page[max(low - page_start, 0):high - page_start])
+        entries.reverse()
+        return entries
+
+    def _page(self, page_start, page_stop):
+        page = self._pages.get(page_start)
+        if page is not None:
+            self._pages.move_to_end(page_start)
+            return page
+        page = self.fetch(page_start, page_stop)
+        self.fetches += 1
+        if len(page) == self.page_size:
+            self._pages[page_start] = page
+            if len(self._pages) > self.cached_pages:
+                self._pages.popitem(last=False)
+        return page
+
+    def clear(self):
+        self._pages.clear()
+
+
+class QueryPager:
+    # Newest-first results of a filtered query, read in chunks as the view
+    # scrolls. fetch(limit, before=None, after=None) returns up to limit
+    # matches, newest first, older than `before` or newer than `after`
+    # (sequence numbers). The total is only known once the query is exhausted.
+    # stop() is the sequence number the next logged entry gets; with it a
+    # query that found nothing only searches entries logged since.
+    #
+    # Fetches may run on a worker thread while the view reads what is loaded:
+    # they run outside the lock and their results are dropped if the entries
+    # changed meanwhile.
+
+    def __init__(self, fetch, chunk=PAGE_SIZE, stop=None):
+        self.fetch = fetch
+        self.chunk = chunk
+        self.stop = stop
+        self.fetches = 0
+        self.entries = []
+        self.exhausted = False
+        self._lock = threading.Lock()
+        # Bumped whenever entries is replaced rather than extended
+        self._generation = 0
+        # Every entry before this sequence number has been searched
+        self._searched = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Whether showing n entries from index (and one chunk past them) needs a fetch
+    def needs_fetch(self, index, n):
+        with self._lock:
+            return not self.exhausted and len(self.entries) < index + n + self.chunk
+
+    # Up to n entries starting at index, from what is already loaded
+    def loaded(self, index, n):
+        with self._lock:
+            return self.entries[index:index + n]
+
+    def newest(self, index, n):
+        # Read one chunk ahead, so there is room to scroll past the window
+        while self.needs_fetch(index, n):
+            with self._lock:
+                generation = self._generation
+                before = self.entries[-1].seq if self.entries else None
+                searched = self.stop() if self.stop is not None and before is None else None
+            found = self.fetch(self.chunk, before=before)
+            with self._lock:
+                self.fetches += 1
+                # Another reader got here first, or refresh replaced the entries
+                tail = self.entries[-1].seq if self.entries else None
+                if generation != self._generation or tail != before:
+                    continue
+                self.entries.extend(found)
+                self.exhausted = len(found) < self.chunk
+                if searched is not None:
+                    self._searched = searched
+        return self.loaded(index, n)
+
+    # Pick up matches logged since the query ran. After a burst of more than
+    # a chunk the query starts over instead.
+    def refresh(self):
+        with self._lock:
+            if self.entries:
+                after = self.entries[0].seq
+            elif self.exhausted and self._searched is not None:
+                after = -1
+            else:
+                # Not run yet, or nothing to go on but running it again
+                self.exhausted = False
+                return
+            # Nothing logged before the query ran can be a new match
+            if self._searched is not None:
+                after = max(after, self._searched - 1)
+            generation = self._generation
+            searched = self.stop() if self.stop is not None else None
+        newer = self.fetch(self.chunk, after=after)
+        with self._lock:
+            self.fetches += 1
+            if generation != self._generation:
+                return
+            if len(newer) == self.chunk:
+                self.entries = []
+                self.exhausted = False
+                self._generation += 1
+                self._searched = None
+                return
+            self.entries[:0] = newer
+            if searched is not None:
+                self._searched = searched
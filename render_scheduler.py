@@ -0,0 +1,95 @@
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from instrumentation import INSTRUMENTS
+
+
+class RenderScheduler:
+    # Collects the UI changes made while an event is handled and pushes them
+    # to the client with a single page.update() when the outermost event ends.
+    # With max_fps set, flushes closer together than one frame are deferred
+    # to a timer so bursts of events share one round-trip.
+
+    def __init__(self, page, max_fps=None, clock=time.monotonic):
+        self.page = page
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.clock = clock
+        # Number of page.update() calls made, and controls marked dirty for them
+        self.flush_count = 0
+        self.controls_flushed = 0
+        self._dirty = {}
+        self._pending = False
+        self._depth = 0
+        self._last_flush = None
+        self._timer = None
+        self._lock = threading.RLock()
+
+    def mark_dirty(self, *controls):
+        with self._lock:
+            for control in controls:
+                self._dirty[id(control)] = control
+            self._pending = True
+
+    @contextmanager
+    def batch(self):
+        with self._lock:
+            self._depth += 1
+            try:
+                yield self
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.request_flush()
+
+    # Decorator for event handlers: everything the handler (and anything it
+    # calls) marks dirty goes out in one flush
+    def event(self, handler):
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            with self.batch():
+                return handler(*args, **kwargs)
+        return wrapper
+
+    def request_flush(self):
+        with self._lock:
+            if not self._pending or self._depth:
+                return
+            if self.min_interval and self._last_flush is not None:
+                wait = self._last_flush + self.min_interval - self.clock()
+                if wait > 0:
+                    if self._timer is None:
+                        self._timer = threading.Timer(wait, self._flush_from_timer)
+                        self._timer.daemon = True
+                        self._timer.start()
+                    return
+            self.flush()
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+            if self._depth:
+                # An event is running; it will flush when it finishes
+                return
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            self.controls_flushed += len(self._dirty)
+            INSTRUMENTS.count("render.page_updates")
+            INSTRUMENTS.count("render.controls_touched", len(self._dirty))
+            self._dirty.clear()
+            self._pending = False
+            self._last_flush = self.clock()
+            self.flush_count += 1
+            self._update()
+
+    @INSTRUMENTS.timed("render.page_update")
+    def _update(self):
+        self.page.update()
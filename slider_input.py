@@ -0,0 +1,81 @@
+import threading
+import time
+
+
+class SliderInput:
+    # Two-stage input pipeline for a slider:
+    #   on_preview(value) - live value while dragging, at most preview_fps times a second
+    #   on_commit(value)  - final value, once on release or after `debounce`
+    #                       seconds without movement
+    # A commit is skipped when the value did not change since the last one.
+
+    def __init__(self, slider, on_preview, on_commit, debounce=0.5, preview_fps=30, clock=time.monotonic):
+        self.on_preview = on_preview
+        self.on_commit = on_commit
+        self.debounce = debounce
+        self.preview_interval = 1.0 / preview_fps if preview_fps else 0.0
+        self.clock = clock
+        self._value = slider.value
+        self._committed = slider.value
+        self._last_preview = None
+        self._preview_timer = None
+        self._commit_timer = None
+        self._lock = threading.Lock()
+        slider.on_change = self._changed
+        slider.on_change_end = self._released
+
+    def _changed(self, e):
+        with self._lock:
+            self._value = e.control.value
+            if self._commit_timer is not None:
+                self._commit_timer.cancel()
+            self._commit_timer = self._start_timer(self.debounce, self._commit_latest)
+            now = self.clock()
+            if self._last_preview is not None and now - self._last_preview < self.preview_interval:
+                # Throttled: make sure the latest value is still previewed at the end of the frame
+                if self._preview_timer is None:
+                    wait = self._last_preview + self.preview_interval - now
+                    self._preview_timer = self._start_timer(wait, self._preview_latest)
+                return
+            self._last_preview = now
+            value = self._value
+        self.on_preview(value)
+
+    def _released(self, e):
+        with self._lock:
+            self._value = e.control.value
+        self._commit_latest()
+
+    def _preview_latest(self):
+        with self._lock:
+            self._preview_timer = None
+            self._last_preview = self.clock()
+            value = self._value
+        self.on_preview(value)
+
+    def _commit_latest(self):
+        with self._lock:
+            if self._commit_timer is not None:
+                self._commit_timer.cancel()
+                self._commit_timer = None
+            value = self._value
+            if value == self._committed:
+                return
+            self._committed = value
+        self.on_commit(value)
+
+    # The value was changed elsewhere (another session, a scene, an
+    # automation, telemetry): take it as the committed value, so dragging
+    # back to the previous one commits again. A drag in progress keeps its
+    # own latest value.
+    def sync(self, value):
+        with self._lock:
+            self._committed = value
+            if self._commit_timer is None:
+                self._value = value
+
+    def _start_timer(self, delay, callback):
+        timer = threading.Timer(delay, callback)
+        timer.daemon = True
+        timer.start()
+        return timer
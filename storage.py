@@ -0,0 +1,585 @@
+import heapq
+import json
+import math
+import queue
+import sqlite3
+import threading
+import time
+
+# Most writes are grouped into one transaction, up to this many per commit
+WRITE_BATCH_SIZE = 500
+
+# Seconds the writer waits for more writes before committing a batch
+WRITE_BATCH_DELAY = 0.2
+
+# Times a batch is retried while the database is busy (another process, e.g.
+# an import, holding the write lock beyond the connection timeout), and the
+# seconds between tries
+WRITE_RETRIES = 5
+WRITE_RETRY_DELAY = 1.0
+
+# Largest SQLite rowid, the open upper end of an id range
+MAX_ID = 2 ** 63 - 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS actions (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    device TEXT NOT NULL,
+    action TEXT NOT NULL,
+    user TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    on_state INTEGER,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS actions_ts ON actions (ts);
+CREATE INDEX IF NOT EXISTS actions_device ON actions (device, id);
+CREATE INDEX IF NOT EXISTS actions_device_kind ON actions (device, kind, id);
+CREATE INDEX IF NOT EXISTS actions_kind ON actions (kind, id);
+CREATE INDEX IF NOT EXISTS actions_user ON actions (user, id);
+CREATE TABLE IF NOT EXISTS snapshot (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    last_action_id INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    devices TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS energy_hours (
+    hour INTEGER PRIMARY KEY,
+    wh REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    last_action_id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    devices TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS checkpoints_ts ON checkpoints (ts);
+CREATE TABLE IF NOT EXISTS action_states (
+    action_id INTEGER NOT NULL,
+    device TEXT NOT NULL,
+    on_state INTEGER,
+    value REAL,
+    PRIMARY KEY (action_id, device)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS action_states_device ON action_states (device, action_id);
+"""
+
+# Every state change of the actions with ids in (?, ?] logged at or before ?, in id order, as
+# (id, ts, device, on, value): single-device actions carry their state in
+# the actions row, grouped ones (scenes, telemetry) in action_states
+STATE_CHANGES = """
+SELECT id, ts, device, on_state, value FROM actions
+WHERE id > ?1 AND id <= ?2 AND ts <= ?3 AND (on_state IS NOT NULL OR value IS NOT NULL)
+UNION ALL
+SELECT s.action_id, a.ts, s.device, s.on_state, s.value FROM action_states s JOIN actions a ON a.id = s.action_id
+WHERE s.action_id > ?1 AND s.action_id <= ?2 AND a.ts <= ?3
+ORDER BY 1
+"""
+
+_STOP = object()
+
+
+# Type of an action, stored and indexed with it: the label of a grouped or
+# system entry ("Night mode: light1 Turn OFF, ..." -> "Night mode"),
+# otherwise the text before its first digit ("Set to 21.5°C" -> "Set to").
+# Always a prefix of the action.
+def action_kind(action):
+    label, separator, _ = action.partition(": ")
+    if separator:
+        return label
+    for i, char in enumerate(action):
+        if char.isdigit():
+            return action[:i].rstrip()
+    return action
+
+
+# `text` with LIKE wildcards escaped
+def _like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def connect(path, check_same_thread=True):
+    conn = sqlite3.connect(path, check_same_thread=check_same_thread)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class HomeStore:
+    # Persists the action log, device state snapshots and hourly energy to
+    # SQLite. Writes are queued and committed in batches by a background
+    # thread, so UI handlers never wait on disk.
+    #
+    # Startup cost does not depend on how much history there is: load() reads
+    # the snapshot, the actions logged after it (at most snapshot_every), the
+    # newest `recent` actions and the retained energy hours, all by index.
+    #
+    # Every snapshot_every-th action also gets a checkpoint of all device
+    # states, so the state at any past time is a checkpoint lookup plus at
+    # most snapshot_every actions.
+    #
+    # A batch the writer cannot commit stops it: the error is kept in
+    # last_error, and from then on every write (and close()) raises instead
+    # of queueing rows that would never reach the database.
+
+    def __init__(self, path, snapshot_every=500):
+        self.path = path
+        self.snapshot_every = snapshot_every
+        self.rows_written = 0
+        self.commits = 0
+        # Failed commit attempts, and the error that stopped the writer
+        self.write_errors = 0
+        self.last_error = None
+        self._queue = queue.Queue()
+        self._writer = None
+        self._reader = None
+        self._reader_lock = threading.Lock()
+        # See _distinct_values(); None until first needed
+        self._values = None
+        self._values_lock = threading.Lock()
+        # Create the schema before anything reads or writes
+        conn = connect(path)
+        try:
+            # Ids are assigned in order and never deleted, so action n has id n + 1
+            self._action_count = conn.execute("SELECT COALESCE(MAX(id), 0) FROM actions").fetchone()[0]
+        finally:
+            conn.close()
+
+    # (device states, the newest `recent` actions oldest first as (ts,
+    # device, action, user, devices a grouped action changed), hours of
+    # energy from since_hour on)
+    def load(self, recent=1000, since_hour=None):
+        conn = connect(self.path)
+        try:
+            states = {}
+            last_action_id = 0
+            row = conn.execute("SELECT last_action_id, devices FROM snapshot WHERE id = 1").fetchone()
+            if row is not None:
+                last_action_id, devices = row
+                states = {device_id: tuple(state) for device_id, state in json.loads(devices).items()}
+            # Replay the short tail of state changes logged after the snapshot
+            for _, _, device_id, on_state, value in conn.execute(STATE_CHANGES, (last_action_id, self._action_count, math.inf)):
+                states[device_id] = (bool(on_state), value)
+            rows = conn.execute(
+                "SELECT id, ts, device, action, user FROM actions ORDER BY id DESC LIMIT ?",
+                (recent,),
+            ).fetchall()
+            rows.reverse()
+            changed = {}
+            if rows:
+                for action_id, device_id in conn.execute(
+                    "SELECT action_id, device FROM action_states WHERE action_id >= ? ORDER BY action_id", (rows[0][0],)
+                ):
+                    changed.setdefault(action_id, []).append(device_id)
+            actions = [(ts, device, action, user, changed.get(action_id, ())) for action_id, ts, device, action, user in rows]
+            hours = conn.execute(
+                "SELECT hour, wh FROM energy_hours WHERE hour >= ? ORDER BY hour",
+                (since_hour or 0,),
+            ).fetchall()
+            return states, actions, hours
+        finally:
+            conn.close()
+
+    # Actions logged so far, including those still queued for the writer
+    @property
+    def action_count(self):
+        return self._action_count
+
+    # Actions start..stop-1 (oldest is 0) as (ts, device, action, user),
+    # oldest first. Only committed rows are returned.
+    def read_actions(self, start, stop):
+        return self._read(
+            "SELECT ts, device, action, user FROM actions WHERE id > ? AND id <= ? ORDER BY id",
+            (start, stop),
+        )
+
+    # Up to limit actions matching the filters as (position, ts, device,
+    # action, user), newest first, among positions low..high-1. The filters
+    # are those of ActionLog.query: a device (or a grouped action that
+    # changed it), an action prefix, a start..end time range and text terms
+    # each found in the device, action or user (ASCII case-insensitive).
+    #
+    # The time range becomes an id range on the ts index. The rest is read
+    # through "arms": one index range per device, action kind, user or
+    # changed device the filters allow, each in id order, merged newest
+    # first, so only about `limit` rows per arm are read. Every filter is
+    # still checked per row. Text alone drives through the values its most
+    # selective term names, so a term found in one of those only matches by
+    # them, not elsewhere in the action text (a term found in no device,
+    # user or kind is searched for in the action text, by a scan). Only
+    # committed rows.
+    def find_actions(self, limit, low=0, high=None, device=None, action=None, start=None, end=None, text=None):
+        low += 1
+        high = math.inf if high is None else high + 1
+        if start is not None:
+            row = self._read("SELECT id FROM actions WHERE ts >= ? ORDER BY ts, id LIMIT 1", (start,))
+            low = max(low, row[0][0] if row else math.inf)
+        if end is not None:
+            row = self._read("SELECT id FROM actions WHERE ts >= ? ORDER BY ts, id LIMIT 1", (end,))
+            high = min(high, row[0][0] if row else math.inf)
+        if low >= high:
+            return []
+        values = self._distinct_values()
+        checks = []
+        parameters = []
+        arms = None
+        kinds = None
+        if device is not None:
+            checks.append("(a.device = ? OR EXISTS (SELECT 1 FROM action_states c WHERE c.action_id = a.id AND c.device = ?))")
+            parameters += [device, device]
+        if action is not None:
+            # A kind is a prefix of its actions, so an action starting with
+            # the prefix has a kind that starts it or is started by it
+            prefix = action.lower()
+            kinds = [kind for kind in values["kind"] if kind.lower().startswith(prefix) or prefix.startswith(kind.lower())]
+            if not kinds:
+                return []
+            checks.append("a.action LIKE ? ESCAPE '\\'")
+            parameters.append(_like(action) + "%")
+        if device is not None:
+            arms = [("actions_device", "a.device = ?", (device,)), ("action_states_device", "s.device = ?", (device,))]
+            if kinds is not None:
+                arms[:1] = [("actions_device_kind", "a.device = ? AND a.kind = ?", (device, kind)) for kind in kinds]
+        elif kinds is not None:
+            arms = [("actions_kind", "a.kind = ?", (kind,)) for kind in kinds]
+        for term in (text or "").lower().split():
+            checks.append("(a.device LIKE ? ESCAPE '\\' OR a.action LIKE ? ESCAPE '\\' OR a.user LIKE ? ESCAPE '\\')")
+            parameters += ["%" + _like(term) + "%"] * 3
+            devices = [value for value in values["device"] if term in value.lower()]
+            term_arms = [("actions_device", "a.device = ?", (value,)) for value in devices]
+            term_arms += [("action_states_device", "s.device = ?", (value,)) for value in devices]
+            term_arms += [("actions_user", "a.user = ?", (value,)) for value in values["user"] if term in value.lower()]
+            term_arms += [("actions_kind", "a.kind = ?", (value,)) for value in values["kind"] if term in value.lower()]
+            if term_arms and (arms is None or len(term_arms) < len(arms)):
+                arms = term_arms
+        if arms is None:
+            arms = [(None, None, ())]
+        check = "".join(" AND " + clause for clause in checks)
+        found = []
+        for index, condition, arm_parameters in arms:
+            if index == "action_states_device":
+                sql = (
+                    "SELECT a.id - 1, a.ts, a.device, a.action, a.user FROM action_states s INDEXED BY action_states_device "
+                    f"JOIN actions a ON a.id = s.action_id WHERE {condition} AND s.action_id >= ? AND s.action_id < ?{check} "
+                    "ORDER BY s.action_id DESC LIMIT ?"
+                )
+            else:
+                indexed = f" INDEXED BY {index}" if index else ""
+                where = f"{condition} AND " if condition else ""
+                sql = (
+                    f"SELECT a.id - 1, a.ts, a.device, a.action, a.user FROM actions a{indexed} "
+                    f"WHERE {where}a.id >= ? AND a.id < ?{check} ORDER BY a.id DESC LIMIT ?"
+                )
+            found.append(self._read(sql, (*arm_parameters, low, min(high, MAX_ID), *parameters, limit)))
+        rows = []
+        for row in heapq.merge(*found, key=lambda row: row[0], reverse=True):
+            # A row can be reached through several arms
+            if rows and rows[-1][0] == row[0]:
+                continue
+            rows.append(row)
+            if len(rows) == limit:
+                break
+        return rows
+
+    # Distinct devices (including those only changed by grouped actions),
+    # users and action kinds stored, for matching filters against them.
+    # Read once by index seeks, then kept up to date by log_action.
+    def _distinct_values(self):
+        with self._values_lock:
+            if self._values is None:
+                values = {"device": set(), "user": set(), "kind": set()}
+                for key, table, column in (("device", "actions", "device"), ("device", "action_states", "device"),
+                                           ("user", "actions", "user"), ("kind", "actions", "kind")):
+                    value = ""
+                    while True:
+                        value = self._read(f"SELECT MIN({column}) FROM {table} WHERE {column} > ?", (value,))[0][0]
+                        if value is None:
+                            break
+                        values[key].add(value)
+                self._values = values
+            return {key: list(found) for key, found in self._values.items()}
+
+    # Hourly energy as lists of (hour, Wh), oldest first, `chunk` rows at a time
+    def read_energy(self, chunk):
+        after = -1
+        while True:
+            rows = self._read("SELECT hour, wh FROM energy_hours WHERE hour > ? ORDER BY hour LIMIT ?", (after, chunk))
+            if not rows:
+                return
+            yield rows
+            after = rows[-1][0]
+
+    # Device states as of `ts` as ({device_id: (on, value)}, state changes
+    # replayed): the newest checkpoint at or before ts, then the changes
+    # logged after it up to ts, which end before the next checkpoint. Both
+    # checkpoints are index lookups, so the cost does not depend on how much
+    # history there is. Devices with no recorded state before ts are absent.
+    def state_at(self, ts):
+        row = self._read(
+            "SELECT last_action_id, devices FROM checkpoints WHERE ts <= ? "
+            "ORDER BY ts DESC, last_action_id DESC LIMIT 1",
+            (ts,),
+        )
+        last_action_id, devices = row[0] if row else (0, "{}")
+        states = {device_id: tuple(state) for device_id, state in json.loads(devices).items()}
+        following = self._read("SELECT last_action_id FROM checkpoints WHERE ts > ? ORDER BY ts LIMIT 1", (ts,))
+        stop = following[0][0] if following else self._action_count
+        tail = self._read(STATE_CHANGES, (last_action_id, stop, ts))
+        for _, _, device_id, on_state, value in tail:
+            states[device_id] = (bool(on_state), value)
+        return states, len(tail)
+
+    # Replace the checkpoints after action `after` with ones rebuilt from the
+    # per-action states, one every snapshot_every actions, in a single pass
+    def _rebuild_checkpoints(self, conn, after=0):
+        conn.execute("DELETE FROM checkpoints WHERE last_action_id > ?", (after,))
+        row = conn.execute("SELECT devices FROM checkpoints WHERE last_action_id = ?", (after,)).fetchone()
+        states = {} if row is None else {device_id: tuple(state) for device_id, state in json.loads(row[0]).items()}
+        count = conn.execute("SELECT COALESCE(MAX(id), 0) FROM actions").fetchone()[0]
+        every = self.snapshot_every
+        checkpoints = iter(range((after // every + 1) * every, count + 1, every))
+        checkpoint = next(checkpoints, None)
+
+        # Write every checkpoint before action `before`, with the states so far
+        def write_until(before):
+            nonlocal checkpoint
+            while checkpoint is not None and checkpoint < before:
+                ts = conn.execute("SELECT ts FROM actions WHERE id = ?", (checkpoint,)).fetchone()[0]
+                conn.execute(
+                    "INSERT INTO checkpoints (last_action_id, ts, devices) VALUES (?, ?, ?)",
+                    (checkpoint, ts, json.dumps(states)),
+                )
+                checkpoint = next(checkpoints, None)
+
+        for action_id, _, device_id, on_state, value in conn.execute(STATE_CHANGES, (after, count, math.inf)):
+            write_until(action_id)
+            states[device_id] = (bool(on_state), value)
+        write_until(count + 1)
+
+    def _last_checkpoint(self, conn):
+        return conn.execute("SELECT COALESCE(MAX(last_action_id), 0) FROM checkpoints").fetchone()[0]
+
+    def _read(self, sql, parameters):
+        with self._reader_lock:
+            if self._reader is None:
+                # Shared by the UI threads; the lock serialises its use
+                self._reader = connect(self.path, check_same_thread=False)
+            return self._reader.execute(sql, parameters).fetchall()
+
+    # Add past actions from chunks of (ts, device, action, user); returns how
+    # many were new. Rows already stored (same time, device, action and
+    # user) are skipped, so importing a file twice, or an export of this
+    # same database, adds nothing. Ids stay in time order: rows older than
+    # the newest stored action are merged in and the table is renumbered.
+    # Only while the writer is stopped.
+    def import_actions(self, chunks):
+        if self.running:
+            raise RuntimeError("import while the store is running")
+        states = self.load(recent=0)[0]
+        conn = connect(self.path)
+        try:
+            with conn:
+                conn.execute("CREATE TEMP TABLE imported (ts REAL, device TEXT, action TEXT, user TEXT, kind TEXT)")
+                rows = 0
+                for chunk in chunks:
+                    conn.executemany(
+                        "INSERT INTO imported VALUES (?, ?, ?, ?, ?)",
+                        [(ts, device, action, user, action_kind(action)) for ts, device, action, user in chunk],
+                    )
+                    rows += len(chunk)
+                rows -= conn.execute(
+                    "DELETE FROM imported WHERE EXISTS (SELECT 1 FROM actions a WHERE a.ts = imported.ts "
+                    "AND a.device = imported.device AND a.action = imported.action AND a.user = imported.user)"
+                ).rowcount
+                newest = conn.execute("SELECT MAX(ts) FROM actions").fetchone()[0]
+                oldest = conn.execute("SELECT MIN(ts) FROM imported").fetchone()[0]
+                if newest is None or oldest is None or oldest >= newest:
+                    conn.execute(
+                        "INSERT INTO actions (ts, device, action, user, kind) "
+                        "SELECT ts, device, action, user, kind FROM imported ORDER BY ts, rowid"
+                    )
+                    # Imported rows carry no state; they only move the checkpoint ids on
+                    self._rebuild_checkpoints(conn, after=self._last_checkpoint(conn))
+                else:
+                    conn.execute(
+                        "CREATE TEMP TABLE merged AS SELECT ROW_NUMBER() OVER (ORDER BY ts, source, position) AS id, * FROM ("
+                        "SELECT ts, 0 AS source, id AS position, device, action, user, kind, on_state, value FROM actions "
+                        "UNION ALL SELECT ts, 1, rowid, device, action, user, kind, NULL, NULL FROM imported)"
+                    )
+                    conn.execute("DELETE FROM actions")
+                    conn.execute(
+                        "INSERT INTO actions (id, ts, device, action, user, kind, on_state, value) "
+                        "SELECT id, ts, device, action, user, kind, on_state, value FROM merged"
+                    )
+                    # Grouped states follow their actions to the new ids
+                    conn.execute(
+                        "CREATE TEMP TABLE moved AS SELECT m.id AS action_id, s.device, s.on_state, s.value "
+                        "FROM action_states s JOIN merged m ON m.source = 0 AND m.position = s.action_id"
+                    )
+                    conn.execute("DELETE FROM action_states")
+                    conn.execute("INSERT INTO action_states SELECT * FROM moved")
+                    conn.execute("DROP TABLE moved")
+                    conn.execute("DROP TABLE merged")
+                    self._rebuild_checkpoints(conn)
+                    # The old snapshot points at renumbered ids; store the
+                    # current state as of the newest action instead
+                    conn.execute(
+                        "INSERT OR REPLACE INTO snapshot (id, last_action_id, ts, devices) "
+                        "VALUES (1, (SELECT MAX(id) FROM actions), (SELECT MAX(ts) FROM actions), ?)",
+                        (json.dumps(states),),
+                    )
+                conn.execute("DROP TABLE imported")
+                self._action_count = conn.execute("SELECT COALESCE(MAX(id), 0) FROM actions").fetchone()[0]
+            with self._values_lock:
+                self._values = None
+            return rows
+        finally:
+            conn.close()
+
+    # Add hourly energy from chunks of (hour, Wh), replacing stored hours.
+    # Only while the writer is stopped.
+    def import_energy(self, chunks):
+        if self.running:
+            raise RuntimeError("import while the store is running")
+        conn = connect(self.path)
+        try:
+            rows = 0
+            with conn:
+                for chunk in chunks:
+                    conn.executemany("INSERT OR REPLACE INTO energy_hours (hour, wh) VALUES (?, ?)", chunk)
+                    rows += len(chunk)
+            return rows
+        finally:
+            conn.close()
+
+    @property
+    def running(self):
+        return self._writer is not None
+
+    def start(self):
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name="home-store-writer", daemon=True)
+            self._writer.start()
+
+    # state is the device's (on, value) after the action, or None; states
+    # maps each device a grouped action changed to its (on, value) after it.
+    # Returns True every snapshot_every actions: time for save_snapshot(),
+    # which then also becomes a checkpoint.
+    def log_action(self, ts, device, action, user, state=None, states=None):
+        self.check()
+        on_state, value = (None, None) if state is None else (int(state[0]), state[1])
+        grouped = [(device_id, int(on), value) for device_id, (on, value) in (states or {}).items()]
+        kind = action_kind(action)
+        self._queue.put(("action", ((ts, device, action, user, kind, on_state, value), grouped)))
+        with self._values_lock:
+            if self._values is not None:
+                self._values["device"].update([device], states or ())
+                self._values["user"].add(user)
+                self._values["kind"].add(kind)
+        self._action_count += 1
+        return self._action_count % self.snapshot_every == 0
+
+    # states maps device id -> (on, value)
+    def save_snapshot(self, ts, states):
+        self.check()
+        self._queue.put(("snapshot", (ts, json.dumps(states))))
+
+    def save_energy(self, hours):
+        self.check()
+        if hours:
+            self._queue.put(("energy", hours))
+
+    # Raise if the writer has stopped on an error
+    def check(self):
+        if self.last_error is not None:
+            raise RuntimeError(f"{self.path}: writes failed: {self.last_error}") from self.last_error
+
+    # Stop the writer after everything queued so far has been committed;
+    # raises if some of it could not be
+    def close(self):
+        if self._writer is not None:
+            self._queue.put(_STOP)
+            self._writer.join()
+            self._writer = None
+        with self._reader_lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+        self.check()
+
+    def _write_loop(self):
+        conn = connect(self.path)
+        try:
+            while True:
+                batch = [self._queue.get()]
+                # Group commit: collect whatever else arrives shortly after
+                while len(batch) < WRITE_BATCH_SIZE and batch[-1] is not _STOP:
+                    try:
+                        batch.append(self._queue.get(timeout=WRITE_BATCH_DELAY))
+                    except queue.Empty:
+                        break
+                stop = batch[-1] is _STOP
+                if stop:
+                    batch.pop()
+                try:
+                    self._commit(conn, batch)
+                except sqlite3.Error as error:
+                    self.last_error = error
+                    return
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    # Write a batch, retrying while the database is busy or locked. A failed
+    # transaction is rolled back, so the whole batch is simply written again.
+    def _commit(self, conn, batch):
+        for attempt in range(WRITE_RETRIES + 1):
+            try:
+                self._write_batch(conn, batch)
+                return
+            except sqlite3.OperationalError as error:
+                self.write_errors += 1
+                busy = "locked" in str(error) or "busy" in str(error)
+                if not busy or attempt == WRITE_RETRIES:
+                    raise
+                time.sleep(WRITE_RETRY_DELAY)
+            except sqlite3.Error:
+                self.write_errors += 1
+                raise
+
+    def _write_batch(self, conn, batch):
+        if not batch:
+            return
+        with conn:
+            for kind, payload in batch:
+                if kind == "action":
+                    row, grouped = payload
+                    action_id = conn.execute(
+                        "INSERT INTO actions (ts, device, action, user, kind, on_state, value) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        row,
+                    ).lastrowid
+                    if grouped:
+                        conn.executemany(
+                            "INSERT INTO action_states (action_id, device, on_state, value) VALUES (?, ?, ?, ?)",
+                            [(action_id, *state) for state in grouped],
+                        )
+                elif kind == "snapshot":
+                    ts, devices = payload
+                    # Everything queued before the snapshot is already inserted
+                    last_action_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM actions").fetchone()[0]
+                    conn.execute(
+                        "INSERT OR REPLACE INTO snapshot (id, last_action_id, ts, devices) VALUES (1, ?, ?, ?)",
+                        (last_action_id, ts, devices),
+                    )
+                    # Snapshots on the snapshot_every cadence double as
+                    # checkpoints; the one written at close usually does not
+                    if last_action_id and last_action_id % self.snapshot_every == 0:
+                        conn.execute(
+                            "INSERT OR IGNORE INTO checkpoints (last_action_id, ts, devices) VALUES (?, ?, ?)",
+                            (last_action_id, ts, devices),
+                        )
+                elif kind == "energy":
+                    conn.executemany("INSERT OR REPLACE INTO energy_hours (hour, wh) VALUES (?, ?)", payload)
+        self.rows_written += len(batch)
+        self.commits += 1
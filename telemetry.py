@@ -0,0 +1,335 @@
+import argparse
+import hmac
+import json
+import queue
+import random
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+# Messages waiting to be applied; producers block (or are refused) when full
+TELEMETRY_QUEUE_SIZE = 10000
+
+# Most messages applied in one batch
+TELEMETRY_BATCH_SIZE = 5000
+
+# Most batches applied per second, so subscribers (the dashboard) see at
+# most this many changes per second however fast telemetry arrives
+TELEMETRY_MAX_RATE = 10
+
+# Recorded as the user of state changes that devices report
+TELEMETRY_USER = "Device"
+
+# Default address of the local telemetry socket
+TELEMETRY_HOST = "127.0.0.1"
+TELEMETRY_PORT = 8765
+
+_STOP = object()
+
+
+# Check a message against the device it names; returns (device_id, on,
+# value, watts), None for fields the message does not carry. A message
+# reports state ("on", "value"), a power reading ("watts"), or both, e.g.
+#   {"device": "thermostat", "on": true, "value": 21.5}
+#   {"device": "fan", "watts": 58.2}
+def validate(message, registry):
+    if not isinstance(message, dict):
+        raise ValueError(f"expected an object, got {type(message).__name__}")
+    device_id = message.get("device")
+    if device_id not in registry:
+        raise ValueError(f"unknown device: {device_id!r}")
+    device = registry.get(device_id)
+    on, value, watts = message.get("on"), message.get("value"), message.get("watts")
+    if on is None and value is None and watts is None:
+        raise ValueError(f"{device_id}: nothing to report")
+    if on is not None and not isinstance(on, bool):
+        raise ValueError(f"{device_id}: on must be true or false")
+    if on is not None and not device.toggle:
+        raise ValueError(f"{device_id}: cannot be switched on or off")
+    if value is not None:
+        if not device.has_value:
+            raise ValueError(f"{device_id}: has no value")
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{device_id}: value must be a number")
+        if not device.min_value <= value <= device.max_value:
+            raise ValueError(f"{device_id}: value {value} outside {device.min_value}..{device.max_value}")
+    if watts is not None and (isinstance(watts, bool) or not isinstance(watts, (int, float)) or watts < 0):
+        raise ValueError(f"{device_id}: watts must be a non-negative number")
+    return device_id, on, value, watts
+
+
+class TelemetryIngestor:
+    # Applies device messages to a controller in batches on a worker thread.
+    #
+    # The queue is bounded: submit() blocks while it is full (backpressure on
+    # the producer), offer() refuses and counts the message as dropped. The
+    # worker applies at most max_rate batches per second; messages arriving
+    # in between wait in the queue and are coalesced per device (the latest
+    # state and reading win), so one batch is one controller command and one
+    # notification, and the controller lock is held only for the changes.
+
+    def __init__(self, controller, max_queue=TELEMETRY_QUEUE_SIZE, max_batch=TELEMETRY_BATCH_SIZE,
+                 max_rate=TELEMETRY_MAX_RATE, user=TELEMETRY_USER):
+        self.controller = controller
+        self.max_batch = max_batch
+        self.min_interval = 1.0 / max_rate if max_rate else 0.0
+        self.user = user
+        self.received = 0
+        self.applied = 0
+        self.batches = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.last_error = None
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    @property
+    def backlog(self):
+        return self._queue.qsize()
+
+    # Queue a message, waiting while the queue is full (queue.Full after
+    # `timeout` seconds)
+    def submit(self, message, timeout=None):
+        self._queue.put(message, timeout=timeout)
+        self.received += 1
+
+    # Queue a message if there is room; False (and counted as dropped) if not
+    def offer(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.received += 1
+        return True
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+            self._thread.start()
+
+    # Stop after everything queued so far has been applied
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        next_batch = 0.0
+        while True:
+            message = self._queue.get()
+            if message is _STOP:
+                return
+            # Let a burst pile up until the next batch is due
+            wait = next_batch - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            batch = [message]
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    message = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if message is _STOP:
+                    stop = True
+                    break
+                batch.append(message)
+            next_batch = time.monotonic() + self.min_interval
+            # A batch that fails (e.g. the store stopped) is lost, the worker
+            # is not; every message of it counts as rejected once
+            rejected = self.rejected
+            try:
+                self.apply(batch)
+            except Exception as e:
+                self.rejected = rejected + len(batch)
+                self.last_error = f"batch failed: {e}"
+            if stop:
+                return
+
+    # Validate, coalesce and apply a batch of messages as one command
+    def apply(self, messages):
+        registry = self.controller.registry
+        states = {}
+        readings = {}
+        for message in messages:
+            try:
+                device_id, on, value, watts = validate(message, registry)
+            except ValueError as e:
+                self.rejected += 1
+                self.last_error = str(e)
+                continue
+            if on is not None or value is not None:
+                state = states.setdefault(device_id, [None, None])
+                if on is not None:
+                    state[0] = on
+                if value is not None:
+                    state[1] = value
+            if watts is not None:
+                readings[device_id] = watts
+        if states or readings:
+            changes = [(device_id, on, value) for device_id, (on, value) in states.items()]
+            self.controller.apply_telemetry(changes, readings, user=self.user)
+            self.batches += 1
+        self.applied += len(messages)
+
+
+class _LineHandler(socketserver.StreamRequestHandler):
+    # One JSON message per line. submit() blocks while the queue is full, so
+    # the handler stops reading and TCP flow control slows the sender. With
+    # a token the first line must be {"token": ...}; otherwise the
+    # connection is closed without reading anything else.
+    def handle(self):
+        ingestor = self.server.ingestor
+        if self.server.token is not None and not self._authorized(self.rfile.readline()):
+            ingestor.rejected += 1
+            ingestor.last_error = "connection without a valid token"
+            return
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError as e:
+                ingestor.rejected += 1
+                ingestor.last_error = f"bad JSON: {e}"
+                continue
+            ingestor.submit(message)
+
+    def _authorized(self, line):
+        try:
+            token = json.loads(line).get("token")
+        except (ValueError, AttributeError):
+            return False
+        return isinstance(token, str) and hmac.compare_digest(token.encode(), self.server.token.encode())
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class TelemetryServer:
+    # Local TCP socket feeding an ingestor with newline-delimited JSON
+    # messages. Anything that can connect can change devices (unlock a
+    # door), so pass a shared token unless every local process is trusted.
+
+    def __init__(self, ingestor, host=TELEMETRY_HOST, port=TELEMETRY_PORT, token=None):
+        self._server = _Server((host, port), _LineHandler)
+        self._server.ingestor = ingestor
+        self._server.token = token
+        self._thread = None
+
+    # (host, port) actually bound; port 0 picks a free one
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever, name="telemetry-socket", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+
+class TelemetryPublisher:
+    # Stand-in for real devices: a seeded stream of plausible state changes
+    # and power readings for the given devices
+
+    def __init__(self, devices, seed=0, state_share=0.2):
+        self.devices = list(devices)
+        self.state_share = state_share
+        self._random = random.Random(seed)
+
+    def message(self):
+        device = self._random.choice(self.devices)
+        if self._random.random() >= self.state_share:
+            return {"device": device.id, "watts": round(self._random.uniform(0, 120), 1)}
+        if device.has_value:
+            steps = self._random.randint(0, device.divisions)
+            value = device.min_value + (device.max_value - device.min_value) * steps / device.divisions
+            message = {"device": device.id, "value": device.value_type(value)}
+            if device.toggle:
+                message["on"] = True
+            return message
+        return {"device": device.id, "on": self._random.random() < 0.5}
+
+    def messages(self, count):
+        for _ in range(count):
+            yield self.message()
+
+    # Send `rate` messages per second for `seconds` to send(message), in
+    # ticks of 10 ms; returns the number sent
+    def publish(self, send, rate, seconds):
+        sent = 0
+        start = time.monotonic()
+        while True:
+            elapsed = time.monotonic() - start
+            if elapsed >= seconds:
+                return sent
+            due = min(int(elapsed * rate), int(seconds * rate))
+            for message in self.messages(due - sent):
+                send(message)
+            sent = due
+            time.sleep(0.01)
+
+
+# Connect to a telemetry socket; returns send(message) and close()
+def connect(host=TELEMETRY_HOST, port=TELEMETRY_PORT, token=None):
+    sock = socket.create_connection((host, port))
+    stream = sock.makefile("w", encoding="utf-8")
+    if token is not None:
+        stream.write(json.dumps({"token": token}) + "\n")
+
+    def send(message):
+        stream.write(json.dumps(message) + "\n")
+
+    def close():
+        stream.close()
+        sock.close()
+
+    return send, close
+
+
+def cli(argv=None):
+    from devices import default_devices
+
+    parser = argparse.ArgumentParser(description="Publish simulated device telemetry to the app's socket")
+    parser.add_argument("--host", default=TELEMETRY_HOST)
+    parser.add_argument("--port", type=int, default=TELEMETRY_PORT)
+    parser.add_argument("--rate", type=float, default=1000, help="messages per second")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--token", help="shared token the app was configured with")
+    args = parser.parse_args(argv)
+
+    try:
+        send, close = connect(args.host, args.port, args.token)
+    except OSError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    try:
+        start = time.perf_counter()
+        sent = TelemetryPublisher(default_devices(), seed=args.seed).publish(send, args.rate, args.seconds)
+        elapsed = time.perf_counter() - start
+    finally:
+        close()
+    print(f"sent {sent:,} messages in {elapsed:.1f}s ({sent / elapsed:,.0f}/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,42 @@
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+# The app's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from home_controller import HomeController  # noqa: E402
+from loadgen import SimulatedClock  # noqa: E402
+from storage import HomeStore  # noqa: E402
+
+# 01:00 local time, so a few hours of test activity stay within one day
+START = datetime(2024, 1, 10, 1).timestamp()
+
+
+@pytest.fixture
+def clock():
+    return SimulatedClock(START)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "home.db")
+
+
+# A controller persisting to a started store at db_path; closed afterwards
+@pytest.fixture
+def stored_controller(db_path, clock):
+    store = HomeStore(db_path, snapshot_every=10)
+    controller = HomeController(store=store, clock=clock)
+    controller.restore()
+    yield controller
+    controller.close()
+
+
+# Reopen db_path the way the app does at startup
+def reopen(db_path, clock, **kwargs):
+    controller = HomeController(store=HomeStore(db_path, snapshot_every=10), clock=clock, **kwargs)
+    controller.restore()
+    return controller
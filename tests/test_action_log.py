@@ -0,0 +1,99 @@
+import pytest
+
+from action_log import ActionLog
+
+
+def fill(log, count, start=1000.0):
+    for i in range(count):
+        log.append(start + i, f"light{i % 3}", "Turn ON" if i % 2 else "Turn OFF", "User" if i % 5 else "Automation")
+
+
+def test_eviction_keeps_newest():
+    log = ActionLog(capacity=10)
+    fill(log, 25)
+    assert len(log) == 10
+    assert (log.first_seq, log.next_seq) == (15, 25)
+    assert [record.seq for record in log.recent(3)] == [24, 23, 22]
+    assert log.record(15).timestamp == 1015.0
+
+
+def test_recent_for_device():
+    log = ActionLog(capacity=10)
+    fill(log, 25)
+    records = log.recent_for_device("light1", 10)
+    assert [record.seq for record in records] == [22, 19, 16]
+    assert all(record.device == "light1" for record in records)
+
+
+def test_capacity_must_be_positive():
+    with pytest.raises(ValueError):
+        ActionLog(capacity=0)
+
+
+def test_evicted_strings_are_dropped():
+    log = ActionLog(capacity=4)
+    for i in range(100):
+        log.append(float(i), "light1", f"one-off {i}", "User")
+    assert set(log.actions()) == {f"one-off {i}" for i in range(96, 100)}
+
+
+def brute(log, device=None, action=None, start=None, end=None, text=None):
+    seqs = []
+    for seq in range(log.next_seq - 1, log.first_seq - 1, -1):
+        record = log.record(seq)
+        fields = (record.device.lower(), record.action.lower(), record.user.lower())
+        if device is not None and record.device != device:
+            continue
+        if action is not None and not record.action.lower().startswith(action.lower()):
+            continue
+        if start is not None and record.timestamp < start:
+            continue
+        if end is not None and record.timestamp >= end:
+            continue
+        if not all(any(term in field for field in fields) for term in (text or "").lower().split()):
+            continue
+        seqs.append(seq)
+    return seqs
+
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"device": "light1"},
+    {"device": "missing"},
+    {"action": "turn on"},
+    {"device": "light2", "action": "Turn OFF"},
+    {"start": 1130, "end": 1170},
+    {"text": "auto"},
+    {"text": "light0 on"},
+    {"device": "light0", "text": "automation", "start": 1100},
+])
+def test_query_matches_scan(filters):
+    log = ActionLog(capacity=100)
+    fill(log, 250)
+    assert list(log.query(**filters)) == brute(log, **filters)
+
+
+def test_query_cursors():
+    log = ActionLog(capacity=100)
+    fill(log, 250)
+    matches = brute(log, device="light1")
+    assert list(log.query(device="light1", before=matches[4])) == matches[5:]
+    assert list(log.query(device="light1", after=matches[4])) == matches[:4]
+
+
+def test_grouped_entries_are_indexed_under_changed_devices():
+    log = ActionLog(capacity=5)
+    log.append(1.0, "light1", "Turn ON", "User")
+    log.append(2.0, "Scene", "Night: light1 Turn OFF, fan Speed set to 1", "User", changed=("light1", "fan"))
+    log.append(3.0, "fan", "Speed set to 2", "User")
+    assert [r.seq for r in log.recent_for_device("light1", 5)] == [1, 0]
+    assert [r.seq for r in log.recent_for_device("fan", 5)] == [2, 1]
+    assert list(log.query(device="fan", action="night")) == [1]
+    assert list(log.query(device="fan", text="user", start=1.5)) == [2, 1]
+    # Evicting the grouped entry drops it, and its strings, from every index
+    for i in range(4):
+        log.append(4.0 + i, "light2", "Turn ON", "User")
+    assert [r.seq for r in log.recent_for_device("fan", 5)] == [2]
+    assert log.recent_for_device("light1", 5) == []
+    assert list(log.query(device="light1")) == []
+    assert "light1" not in log.devices()
@@ -0,0 +1,56 @@
+from datetime import datetime
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from analytics import EnergyAnalytics, Tariff, device_shares, period_boundaries  # noqa: E402
+from energy import HOUR  # noqa: E402
+from home_controller import HomeController  # noqa: E402
+
+
+def test_day_totals(clock):
+    controller = HomeController(clock=clock)
+    start = clock()
+    idle = controller.power()
+    clock.advance_to(start + HOUR)
+    controller.toggle("light1")
+    light = controller.power() - idle
+    clock.advance_to(start + 3 * HOUR)
+
+    analytics = EnergyAnalytics(controller, Tariff(0.5, [(2, 3, 1.0)]))
+    report, = analytics.report("day", 1)
+    kwh = (idle * 3 + light * 2) / 1000
+    assert report.kwh == pytest.approx(kwh)
+    assert sum(report.device_kwh.values()) == pytest.approx(kwh)
+    assert report.device_kwh["light1"] == pytest.approx(light * 2 / 1000)
+    # 02:00-03:00 costs 1.0 per kWh, the other two hours 0.5
+    hour = (idle + light) / 1000
+    assert report.cost == pytest.approx(idle / 1000 * 0.5 + hour * 1.0 + hour * 0.5)
+    assert sum(report.hour_profile) == pytest.approx(kwh * 1000)
+    assert sum(share for _, share in device_shares([report])) == pytest.approx(1)
+
+
+def test_closed_periods_are_cached(clock):
+    controller = HomeController(clock=clock)
+    controller.toggle("light1")
+    analytics = EnergyAnalytics(controller, Tariff(0.3))
+    clock.advance_to(clock() + 3 * 24 * HOUR)
+    controller.toggle("light1")
+    first = analytics.report("day", 3)
+    computed = analytics.computed
+    second = analytics.report("day", 3)
+    assert [report.kwh for report in second] == [report.kwh for report in first]
+    # Only the open period is computed again
+    assert analytics.computed == computed + 1
+
+
+@pytest.mark.parametrize("period, expected", [
+    ("day", [datetime(2024, 3, 1), datetime(2024, 3, 2), datetime(2024, 3, 3)]),
+    ("week", [datetime(2024, 2, 19), datetime(2024, 2, 26), datetime(2024, 3, 4)]),
+    ("month", [datetime(2024, 1, 1), datetime(2024, 2, 1), datetime(2024, 3, 1), datetime(2024, 4, 1)]),
+])
+def test_period_boundaries(period, expected):
+    ts = datetime(2024, 3, 2, 15).timestamp()
+    boundaries = period_boundaries(ts, period, len(expected) - 1)
+    assert list(boundaries) == [moment.timestamp() for moment in expected]
@@ -0,0 +1,117 @@
+import time
+from datetime import datetime
+
+import pytest
+
+from automation import AutomationEngine, TimeRule, rule_from_dict
+from home_controller import HomeController
+from loadgen import SimulatedClock
+
+
+@pytest.fixture
+def engine(clock):
+    engine = AutomationEngine(HomeController(clock=clock))
+    yield engine
+    engine.stop()
+
+
+# Wait for the rules to react to everything done so far, including the
+# changes made by the rules themselves
+def settle(engine):
+    engine.drain()
+    engine.drain()
+
+
+def test_condition_rules_fire_on_the_edge(engine):
+    controller = engine.controller
+    rule = engine.add(rule_from_dict({"type": "condition", "name": "Fan off", "watch": "thermostat", "when": "off",
+                                      "device": "fan", "on": False}))
+    engine.start()
+    controller.set_value("fan", 2)
+    controller.toggle("thermostat")
+    settle(engine)
+    assert engine.fired == 0
+    controller.toggle("thermostat")
+    settle(engine)
+    assert controller.device("fan").value == 0
+    assert controller.action_log.recent(1)[0].user == "Automation: Fan off"
+    # Still off: another change to the thermostat does not fire it again
+    controller.set_value("fan", 2)
+    controller.set_value("thermostat", 25)
+    settle(engine)
+    assert (engine.fired, controller.device("fan").value) == (1, 2)
+    controller.toggle("thermostat")
+    settle(engine)
+    controller.toggle("thermostat")
+    settle(engine)
+    assert (engine.fired, controller.device("fan").value) == (2, 0)
+    engine.remove(rule)
+    controller.set_value("fan", 2)
+    controller.toggle("thermostat")
+    settle(engine)
+    controller.toggle("thermostat")
+    settle(engine)
+    assert engine.fired == 2
+
+
+def test_time_rules_run_when_due():
+    # Just before 23:00, so the timer is due almost at once
+    clock = SimulatedClock(datetime(2024, 1, 10, 22, 59, 59, 950000).timestamp())
+    engine = AutomationEngine(HomeController(clock=clock))
+    controller = engine.controller
+    try:
+        for name, at, device in (("Lock", "23:00", "door1"), ("Light", "23:00", "light1"),
+                                 ("Heat", "23:00", "thermostat"), ("Fan", "07:00", "fan")):
+            engine.add(rule_from_dict({"type": "time", "name": name, "at": at, "device": device, "on": True}))
+        engine.start()
+        engine.remove(next(rule for rule in engine.rules() if rule.name == "Heat"))
+        engine.drain()
+        clock.advance_to(datetime(2024, 1, 10, 23).timestamp())
+        deadline = time.monotonic() + 5
+        while engine.fired < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        engine.drain()
+        # Both rules due at 23:00 ran; the removed one and the 07:00 one did not
+        assert engine.fired == 2
+        assert controller.device("door1").on and controller.device("light1").on
+        assert not controller.device("thermostat").on
+        assert controller.device("fan").value == 0
+    finally:
+        engine.stop()
+
+
+def test_time_rule_next_run():
+    rule = TimeRule("Lock", "23:00", None)
+    assert rule.next_run(datetime(2024, 1, 10, 22).timestamp()) == datetime(2024, 1, 10, 23).timestamp()
+    assert rule.next_run(datetime(2024, 1, 10, 23).timestamp()) == datetime(2024, 1, 11, 23).timestamp()
+
+
+def test_power_cap_sheds_in_order(engine):
+    controller = engine.controller
+    engine.add(rule_from_dict({"type": "power_cap", "name": "Cap", "limit": 100, "shed": ["fan", "light1"]}))
+    engine.start()
+    controller.toggle("light1")
+    settle(engine)
+    assert engine.fired == 0
+    controller.set_value("fan", 3)
+    settle(engine)
+    assert engine.fired == 1
+    assert controller.device("fan").value == 0 and controller.device("light1").on
+    assert controller.power() <= 100
+
+
+def test_power_cap_without_shed_list_switches_off_the_cause(engine):
+    controller = engine.controller
+    engine.add(rule_from_dict({"type": "power_cap", "name": "Cap", "limit": 100}))
+    engine.start()
+    controller.set_value("fan", 3)
+    settle(engine)
+    controller.toggle("light1")
+    settle(engine)
+    assert not controller.device("light1").on
+    assert controller.device("fan").value == 3
+
+
+def test_unknown_rule_type():
+    with pytest.raises(ValueError):
+        rule_from_dict({"type": "weekly", "name": "x", "device": "light1"})
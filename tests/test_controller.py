@@ -0,0 +1,88 @@
+import pytest
+
+from home_controller import HomeController
+
+
+def test_commands_change_state_power_and_log(clock):
+    controller = HomeController(clock=clock)
+    idle = controller.power()
+    controller.toggle("light1")
+    assert controller.device("light1").on
+    assert controller.power() == idle + 60
+    controller.set_value("fan", 2)
+    assert controller.device_states()["fan"] == (False, 2)
+    assert controller.power() == idle + 60 + 60
+    actions = [(record.device, record.action) for record in controller.recent_actions(5)]
+    assert actions == [("fan", "Speed set to 2"), ("light1", "Turn ON")]
+
+
+def test_subscribers_get_one_change_per_command(clock):
+    controller = HomeController(clock=clock)
+    changes = []
+    unsubscribe = controller.subscribe(changes.append)
+    controller.toggle("light1")
+    controller.set_value("thermostat", 24)
+    assert [change.device.id for change in changes] == ["light1", "thermostat"]
+    assert changes[-1].power == controller.power()
+    unsubscribe()
+    controller.toggle("light1")
+    assert len(changes) == 2
+
+
+def test_single_commands_validate(clock):
+    controller = HomeController(clock=clock)
+    with pytest.raises(ValueError):
+        controller.toggle("fan")
+    with pytest.raises(ValueError):
+        controller.set_value("thermostat", 99)
+    assert len(controller.action_log) == 0
+
+
+def test_batch_applies_every_change(clock):
+    controller = HomeController(clock=clock)
+    changes = []
+    controller.subscribe(changes.append)
+    controller.apply_batch("Evening", [("light1", True, None), ("thermostat", None, 24), ("fan", None, 2)])
+    states = controller.device_states()
+    assert states["light1"][0] is True
+    assert states["thermostat"][1] == 24
+    assert states["fan"][1] == 2
+    assert len(changes) == 1
+    assert len(controller.action_log) == 1
+    assert controller.recent_actions(1)[0].action.startswith("Evening: ")
+
+
+@pytest.mark.parametrize("bad", [
+    ("missing", True, None),
+    ("fan", True, None),
+    ("light1", None, 10),
+    ("thermostat", None, "warm"),
+    ("thermostat", None, 99),
+])
+def test_batch_is_all_or_nothing(clock, bad):
+    controller = HomeController(clock=clock)
+    before = controller.device_states()
+    power = controller.power()
+    changes = []
+    controller.subscribe(changes.append)
+    with pytest.raises((KeyError, ValueError)):
+        controller.apply_batch("Broken", [("light1", True, None), ("thermostat", None, 24), bad])
+    assert controller.device_states() == before
+    assert controller.power() == power
+    assert len(controller.action_log) == 0
+    assert changes == []
+
+
+def test_grouped_entries_show_under_each_device(clock):
+    controller = HomeController(clock=clock)
+    controller.toggle("light1")
+    controller.apply_batch("Night mode", [("light1", False, None), ("fan", None, 2)])
+    controller.apply_telemetry([("door1", True, None)], {})
+    assert [r.action for r in controller.recent_actions(5, device="light1")] == [
+        "Night mode: light1 Turn OFF, fan Speed set to 2", "Turn ON"]
+    assert [r.action for r in controller.recent_actions(5, device="door1")] == ["Reported: door1 Lock"]
+    assert [r.action for r in controller.find_actions(10, device="fan")] == [
+        "Night mode: light1 Turn OFF, fan Speed set to 2"]
+    assert [r.action for r in controller.find_actions(10, device="light1", action="night")] == [
+        "Night mode: light1 Turn OFF, fan Speed set to 2"]
+    assert controller.find_actions(10, device="door1", action="Night") == []
@@ -0,0 +1,55 @@
+import pytest
+
+from energy import HOUR, MINUTE, EnergyMeter
+
+# An epoch hour boundary
+T0 = 1_700_000_000 // HOUR * HOUR
+
+
+def test_integrates_across_minute_and_hour_boundaries():
+    meter = EnergyMeter(minute_retention=600, hour_retention=48)
+    # 120 W from 00:59:30 to 01:01:15, past one hour and two minute boundaries
+    meter.record(120, T0 - 30)
+    meter.record(0, T0 + MINUTE + 15)
+    assert meter.minutely(T0 - MINUTE, 3, now=T0 + HOUR) == pytest.approx([1.0, 2.0, 0.5])
+    assert meter.hourly(T0 - HOUR, 2, now=T0 + HOUR) == pytest.approx([1.0, 2.5])
+
+
+def test_queries_include_energy_since_the_last_change():
+    meter = EnergyMeter(minute_retention=600, hour_retention=48)
+    meter.record(600, T0)
+    assert meter.hourly(T0, 2, now=T0 + 90 * MINUTE) == pytest.approx([600, 300])
+    # Nothing was settled into the buckets yet
+    assert meter.hour_buckets.get(T0 // HOUR) == 0
+    assert meter.settled_until == T0
+
+
+def test_power_changes_split_the_bucket():
+    meter = EnergyMeter(minute_retention=600, hour_retention=48)
+    meter.record(100, T0)
+    meter.record(400, T0 + 15 * MINUTE)
+    meter.record(0, T0 + 30 * MINUTE)
+    assert meter.hourly(T0, 1) == pytest.approx([25 + 100])
+
+
+def test_old_buckets_are_reused():
+    meter = EnergyMeter(minute_retention=60, hour_retention=3)
+    meter.record(60, T0)
+    meter.record(0, T0 + HOUR)
+    meter.record(60, T0 + 3 * HOUR)
+    meter.record(0, T0 + 4 * HOUR)
+    # The first hour's slot now holds the fourth hour
+    assert meter.hourly(T0, 4, now=T0 + 4 * HOUR) == pytest.approx([0, 0, 0, 60])
+    assert meter.first_retained_hour(T0 + 4 * HOUR) == T0 // HOUR + 2
+
+
+def test_dirty_hours_round_trip():
+    meter = EnergyMeter(minute_retention=600, hour_retention=48)
+    meter.record(60, T0 + 30 * MINUTE)
+    meter.record(0, T0 + 90 * MINUTE)
+    hours = meter.take_dirty_hours()
+    assert hours == [(T0 // HOUR, pytest.approx(30)), (T0 // HOUR + 1, pytest.approx(30))]
+    assert meter.take_dirty_hours() == []
+    restored = EnergyMeter(minute_retention=600, hour_retention=48)
+    restored.load_hours(hours)
+    assert restored.hourly(T0, 2, now=T0 + 2 * HOUR) == pytest.approx([30, 30])
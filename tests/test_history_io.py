@@ -0,0 +1,58 @@
+import pytest
+
+from history_io import controller_actions, controller_energy, export_history, import_history, read_history
+from home_controller import HomeController
+from storage import HomeStore
+
+
+@pytest.fixture
+def controller(clock):
+    controller = HomeController(clock=clock)
+    for i in range(300):
+        clock.advance_to(clock() + 90)
+        if i % 3:
+            controller.toggle("light1")
+        else:
+            controller.set_value("thermostat", 16 + i % 20 / 2)
+    controller.log("system", 'Quotes " and, commas', user="Automation")
+    return controller
+
+
+def rows(chunks):
+    return [tuple(row) for chunk in chunks for row in chunk]
+
+
+@pytest.mark.parametrize("extension", [".csv", ".shc"])
+@pytest.mark.parametrize("kind", ["actions", "energy"])
+def test_round_trip(tmp_path, controller, extension, kind):
+    source = controller_actions if kind == "actions" else controller_energy
+    expected = rows(source(controller, chunk=64))
+    assert expected
+    path = str(tmp_path / f"{kind}{extension}")
+    stats = export_history(path, kind, source(controller, chunk=64))
+    assert stats.rows == len(expected)
+    read_kind, chunks = read_history(path)
+    assert read_kind == kind
+    assert rows(chunks) == expected
+
+
+@pytest.mark.parametrize("extension", [".csv", ".shc"])
+def test_import_skips_stored_rows(tmp_path, controller, extension):
+    path = str(tmp_path / f"actions{extension}")
+    export_history(path, "actions", controller_actions(controller))
+    store = HomeStore(str(tmp_path / "home.db"))
+    try:
+        assert import_history(store, path).rows == len(controller.action_log)
+        assert import_history(store, path).rows == 0
+        assert store.action_count == len(controller.action_log)
+        assert rows([store.read_actions(0, store.action_count)]) == rows(controller_actions(controller))
+        # Imported rows are indexed like logged ones
+        set_to = [record for record in controller.action_log.recent(len(controller.action_log)) if record.action.startswith("Set to")]
+        assert len(store.find_actions(store.action_count, 0, store.action_count, action="set to")) == len(set_to)
+    finally:
+        store.close()
+
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        read_history(str(tmp_path / "actions.txt"))
@@ -0,0 +1,74 @@
+from home_controller import HomeController
+from home_hub import HomeHub
+
+
+class FakePubSubHub:
+    # Stands in for the process-wide Flet pubsub hub
+    def __init__(self):
+        self.subscribers = {}
+
+
+class FakePubSub:
+    def __init__(self, hub):
+        self.hub = hub
+
+    def subscribe_topic(self, topic, handler):
+        self.hub.subscribers.setdefault(topic, {})[self] = handler
+
+    def unsubscribe_topic(self, topic):
+        self.hub.subscribers.get(topic, {}).pop(self, None)
+
+    def send_all_on_topic(self, topic, message):
+        for handler in list(self.hub.subscribers.get(topic, {}).values()):
+            handler(topic, message)
+
+
+class FakePage:
+    def __init__(self, hub):
+        self.pubsub = FakePubSub(hub)
+
+
+def sessions(hub, count):
+    pubsub_hub = FakePubSubHub()
+    received = []
+    detach = []
+    for i in range(count):
+        deltas = []
+        received.append(deltas)
+        detach.append(hub.attach(FakePage(pubsub_hub), deltas.append))
+    return received, detach
+
+
+def test_every_session_gets_each_change_once(clock):
+    controller = HomeController(clock=clock)
+    hub = HomeHub(controller)
+    received, _ = sessions(hub, 3)
+    assert hub.sessions == 3
+    controller.toggle("light1")
+    for deltas in received:
+        assert len(deltas) == 1
+        assert deltas[0]["devices"] == ["light1"]
+        assert deltas[0]["entry"].action == "Turn ON"
+
+
+def test_batch_delta_names_every_device(clock):
+    controller = HomeController(clock=clock)
+    hub = HomeHub(controller)
+    received, _ = sessions(hub, 2)
+    controller.apply_batch("Evening", [("light1", True, None), ("fan", None, 1)])
+    assert [deltas[0]["devices"] for deltas in received] == [["light1", "fan"]] * 2
+
+
+def test_detached_sessions_stop_receiving(clock):
+    controller = HomeController(clock=clock)
+    hub = HomeHub(controller)
+    received, detach = sessions(hub, 2)
+    detach[0]()
+    detach[0]()
+    assert hub.sessions == 1
+    controller.toggle("light1")
+    assert [len(deltas) for deltas in received] == [0, 1]
+    detach[1]()
+    # Nobody to publish to
+    controller.toggle("light1")
+    assert hub.sessions == 0
@@ -0,0 +1,44 @@
+from energy import HOUR
+from home_controller import HomeController
+from loadgen import LoadGenerator, SimulatedClock, household
+
+
+# Two simulated days of a 12-device household; returns the controller and report
+def simulate(seed, devices=12, **kwargs):
+    clock = SimulatedClock()
+    controller = HomeController(household(devices), clock=clock)
+    report = LoadGenerator(controller, clock, seed=seed, **kwargs).run(2 * 24 * HOUR, sample_every=6 * HOUR)
+    return controller, report
+
+
+def logged(controller):
+    return [(r.timestamp, r.device, r.action, r.user) for r in controller.action_log.recent(len(controller.action_log))]
+
+
+def test_same_seed_same_run():
+    first, first_report = simulate(seed=7)
+    second, second_report = simulate(seed=7)
+    assert first_report.events == second_report.events > 0
+    assert logged(first) == logged(second)
+    assert first.device_states() == second.device_states()
+    assert first_report.final_power == second_report.final_power
+    assert [s.ts for s in first_report.samples] == [s.ts for s in second_report.samples]
+
+
+def test_other_seed_other_run():
+    first, _ = simulate(seed=7)
+    second, _ = simulate(seed=8)
+    assert logged(first) != logged(second)
+
+
+def test_rate_is_the_daily_mean():
+    _, report = simulate(seed=1, rate=120)
+    # 120 events an hour over two days, give or take the randomness
+    assert 0.85 * 120 * 48 < report.events < 1.15 * 120 * 48
+
+
+def test_household_mix():
+    devices = household(12)
+    assert [device.id for device in devices[:6]] == ["light1", "light2", "light3", "door1", "thermostat1", "fan1"]
+    assert sum(device.kind == "light" for device in devices) == 6
+    assert len({device.id for device in devices}) == 12
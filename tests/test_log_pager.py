@@ -0,0 +1,145 @@
+from itertools import islice
+
+from action_log import ActionLog
+from log_pager import LogPager, QueryPager
+
+
+def ring(capacity, count):
+    log = ActionLog(capacity=capacity)
+    append(log, count)
+    return log
+
+
+def append(log, count):
+    for _ in range(count):
+        seq = log.next_seq
+        log.append(1000.0 + seq, f"light{seq % 2}", "Turn ON", "User")
+
+
+def pager(log, **kwargs):
+    return LogPager(lambda: (log.first_seq, log.next_seq),
+                    lambda start, stop: [log.record(seq) for seq in range(start, stop)], **kwargs)
+
+
+def seqs(records):
+    return [record.seq for record in records]
+
+
+def test_newest_first_windows():
+    log = ring(1000, 450)
+    history = pager(log, page_size=100)
+    assert len(history) == 450
+    assert seqs(history.newest(0, 3)) == [449, 448, 447]
+    assert seqs(history.newest(48, 5)) == [401, 400, 399, 398, 397]
+    assert seqs(history.newest(445, 10)) == [4, 3, 2, 1, 0]
+    assert history.newest(450, 10) == []
+
+
+def test_full_pages_are_cached_and_the_newest_is_reread():
+    log = ring(1000, 450)
+    history = pager(log, page_size=100)
+    history.newest(0, 450)
+    assert history.fetches == 5
+    history.newest(100, 200)
+    assert history.fetches == 5
+    append(log, 10)
+    assert seqs(history.newest(0, 2)) == [459, 458]
+    assert history.fetches == 6
+
+
+def test_least_recently_used_pages_are_dropped():
+    log = ring(1000, 500)
+    history = pager(log, page_size=100, cached_pages=2)
+    history.newest(0, 500)
+    fetches = history.fetches
+    history.newest(0, 200)
+    assert history.fetches == fetches
+    history.newest(400, 100)
+    assert history.fetches == fetches + 1
+
+
+def test_page_cut_short_by_eviction_is_not_read_from_cache():
+    log = ring(1000, 1000)
+    history = pager(log, page_size=200)
+    # Caches the full oldest page, 0..199
+    assert seqs(history.newest(995, 5)) == [4, 3, 2, 1, 0]
+    append(log, 50)
+    assert seqs(history.newest(995, 5)) == [54, 53, 52, 51, 50]
+
+
+def query_pager(log, device, chunk, **kwargs):
+    return QueryPager(lambda limit, **cursor: [log.record(seq) for seq in islice(log.query(device=device, **cursor), limit)],
+                      chunk=chunk, **kwargs)
+
+
+def test_query_pager_reads_in_chunks():
+    log = ring(1000, 100)
+    matches = query_pager(log, "light1", chunk=10)
+    assert seqs(matches.newest(0, 5)) == [99, 97, 95, 93, 91]
+    assert matches.fetches == 2
+    assert not matches.exhausted
+    assert seqs(matches.newest(45, 10)) == [9, 7, 5, 3, 1]
+    assert matches.exhausted
+    assert len(matches) == 50
+
+
+def test_query_pager_refresh():
+    log = ring(1000, 100)
+    matches = query_pager(log, "light1", chunk=10)
+    matches.newest(0, 5)
+    append(log, 4)
+    matches.refresh()
+    assert seqs(matches.newest(0, 3)) == [103, 101, 99]
+    # A burst of a chunk or more starts the query over
+    append(log, 40)
+    matches.refresh()
+    assert len(matches) == 0
+    assert seqs(matches.newest(0, 1)) == [143]
+
+
+def test_query_without_matches_is_not_searched_again():
+    log = ring(1000, 100)
+    searched = []
+
+    def fetch(limit, before=None, after=None):
+        searched.append(after)
+        return [log.record(seq) for seq in islice(log.query(device="light7", before=before, after=after), limit)]
+
+    matches = QueryPager(fetch, chunk=10, stop=lambda: log.next_seq)
+    assert matches.newest(0, 5) == []
+    assert matches.exhausted
+    append(log, 3)
+    matches.refresh()
+    # Only what was logged since the query ran is searched
+    assert searched == [None, 99]
+    assert matches.exhausted
+    log.append(2000.0, "light7", "Turn ON", "User")
+    matches.refresh()
+    assert searched[-1] == 102
+    assert seqs(matches.loaded(0, 5)) == [103]
+
+
+def test_loaded_entries_and_stale_fetches():
+    log = ring(1000, 100)
+    matches = query_pager(log, "light1", chunk=10)
+    assert matches.needs_fetch(0, 5)
+    assert matches.loaded(0, 5) == []
+    matches.newest(0, 5)
+    assert not matches.needs_fetch(0, 5)
+    assert seqs(matches.loaded(0, 2)) == [99, 97]
+    assert matches.needs_fetch(20, 5)
+    # A fetch that finishes after the entries were replaced is dropped
+    fetch = matches.fetch
+
+    def racing_fetch(limit, **cursor):
+        matches.fetch = fetch
+        found = fetch(limit, **cursor)
+        # The view refreshes after a burst while the fetch runs
+        append(log, 40)
+        matches.refresh()
+        return found
+
+    matches.fetch = racing_fetch
+    matches.newest(20, 5)
+    assert seqs(matches.entries) == list(range(139, 139 - 2 * len(matches), -2))
+    assert len(matches) >= 35
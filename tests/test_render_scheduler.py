@@ -0,0 +1,54 @@
+from render_scheduler import RenderScheduler
+
+
+class CountingPage:
+    def __init__(self):
+        self.updates = 0
+
+    def update(self):
+        self.updates += 1
+
+
+def test_one_flush_per_event():
+    page = CountingPage()
+    scheduler = RenderScheduler(page)
+
+    @scheduler.event
+    def inner(control):
+        scheduler.mark_dirty(control)
+
+    @scheduler.event
+    def handler():
+        for control in range(20):
+            inner(control)
+        scheduler.mark_dirty(0, 1, 2)
+
+    handler()
+    assert page.updates == 1
+    assert scheduler.controls_flushed == 20
+    handler()
+    assert page.updates == 2
+
+
+def test_event_without_changes_does_not_flush():
+    page = CountingPage()
+    scheduler = RenderScheduler(page)
+    scheduler.event(lambda: None)()
+    assert page.updates == 0
+
+
+def test_frame_limit_defers_to_one_flush():
+    page = CountingPage()
+    now = [0.0]
+    scheduler = RenderScheduler(page, max_fps=10, clock=lambda: now[0])
+    with scheduler.batch():
+        scheduler.mark_dirty("first")
+    assert page.updates == 1
+    # Within the same frame: deferred, and later events join the pending flush
+    for control in ("second", "third"):
+        with scheduler.batch():
+            scheduler.mark_dirty(control)
+    assert page.updates == 1
+    scheduler.flush()
+    assert page.updates == 2
+    assert scheduler.controls_flushed == 3
@@ -0,0 +1,88 @@
+import threading
+
+from slider_input import SliderInput
+
+
+class FakeSlider:
+    def __init__(self, value):
+        self.value = value
+        self.on_change = None
+        self.on_change_end = None
+
+
+class FakeEvent:
+    def __init__(self, control):
+        self.control = control
+
+
+def drag(slider, *values, release=True):
+    for value in values:
+        slider.value = value
+        slider.on_change(FakeEvent(slider))
+    if release:
+        slider.on_change_end(FakeEvent(slider))
+
+
+def make(value=20, debounce=60):
+    slider = FakeSlider(value)
+    previews, commits = [], []
+    pipeline = SliderInput(slider, previews.append, commits.append, debounce=debounce, preview_fps=None)
+    return slider, pipeline, previews, commits
+
+
+def test_release_commits_final_value_once():
+    slider, _, previews, commits = make()
+    drag(slider, 21, 22, 23)
+    assert previews == [21, 22, 23]
+    assert commits == [23]
+    slider.on_change_end(FakeEvent(slider))
+    assert commits == [23]
+
+
+def test_returning_to_committed_value_is_not_committed():
+    slider, _, _, commits = make()
+    drag(slider, 21, 20)
+    assert commits == []
+
+
+def test_sync_then_drag_back_commits():
+    slider, pipeline, _, commits = make()
+    drag(slider, 22)
+    # Another session sets 25; dragging back to 22 must apply again
+    pipeline.sync(25)
+    drag(slider, 24, 22)
+    assert commits == [22, 22]
+
+
+def test_sync_keeps_drag_in_progress():
+    slider, pipeline, _, commits = make()
+    drag(slider, 23, release=False)
+    pipeline.sync(25)
+    slider.on_change_end(FakeEvent(slider))
+    assert commits == [23]
+
+
+def test_debounce_commits_without_release():
+    committed = threading.Event()
+    slider = FakeSlider(20)
+    commits = []
+    SliderInput(slider, lambda value: None, lambda value: (commits.append(value), committed.set()),
+                debounce=0.01, preview_fps=None)
+    drag(slider, 21, 24, release=False)
+    assert committed.wait(5)
+    assert commits == [24]
+
+
+def test_previews_are_throttled_to_the_latest_value():
+    slider = FakeSlider(20)
+    previewed = threading.Event()
+    previews = []
+    now = [0.0]
+    SliderInput(slider, lambda value: (previews.append(value), previewed.set()), lambda value: None,
+                debounce=60, preview_fps=20, clock=lambda: now[0])
+    drag(slider, 21, 22, 23, release=False)
+    # Only the first is previewed now; the latest follows at the end of the frame
+    assert previews == [21]
+    previewed.clear()
+    assert previewed.wait(5)
+    assert previews == [21, 23]
@@ -0,0 +1,223 @@
+import sqlite3
+import time
+
+import pytest
+
+from automation import scene_from_dict
+from conftest import reopen
+from home_controller import BATCH_LOG_DEVICE, HomeController
+from storage import action_kind
+
+NIGHT = scene_from_dict({"name": "Night", "devices": {"light1": {"on": False}, "fan": {"value": 2}}})
+HOME = scene_from_dict({"name": "Home", "devices": {"light1": {"on": True}, "thermostat": {"value": 21}}})
+
+
+# A mix of single commands, scenes and telemetry; returns (ts, states) after each
+def exercise(controller, clock, steps=120):
+    moments = []
+    for i in range(steps):
+        clock.advance_to(clock() + 37)
+        kind = i % 6
+        if kind == 0:
+            controller.toggle("light1")
+        elif kind == 1:
+            controller.set_value("thermostat", 15 + i % 30 / 2)
+        elif kind == 2:
+            (NIGHT if i % 4 else HOME).run(controller)
+        elif kind == 3:
+            controller.apply_telemetry([("door1", i % 4 == 3, None), ("fan", None, i % 4)], {})
+        elif kind == 4:
+            controller.set_value("fan", i % 4)
+        else:
+            controller.log("system", "Ping")
+        moments.append((clock(), controller.device_states()))
+    return moments
+
+
+def test_restore_brings_back_state_and_log(stored_controller, db_path, clock):
+    moments = exercise(stored_controller, clock)
+    recent = [(r.timestamp, r.device, r.action, r.user) for r in stored_controller.recent_actions(50)]
+    stored_controller.close()
+
+    restored = reopen(db_path, clock)
+    try:
+        assert restored.restored
+        assert restored.device_states() == moments[-1][1]
+        assert [(r.timestamp, r.device, r.action, r.user) for r in restored.recent_actions(50)] == recent
+    finally:
+        restored.close()
+
+
+def test_history_reaches_past_the_log(stored_controller, db_path, clock):
+    exercise(stored_controller, clock)
+    everything = stored_controller.history(*stored_controller.history_bounds())
+    stored_controller.close()
+
+    restored = reopen(db_path, clock, log_capacity=20)
+    try:
+        first, stop = restored.history_bounds()
+        assert (first, stop) == (0, len(everything))
+        assert len(restored.action_log) == 20
+        records = restored.history(first, stop)
+        assert [record.seq for record in records] == list(range(stop))
+        assert [(r.timestamp, r.action) for r in records] == [(r.timestamp, r.action) for r in everything]
+        # A window straddling the log's oldest entry
+        window = restored.history(stop - 25, stop - 15)
+        assert [(r.seq, r.action) for r in window] == [(r.seq, r.action) for r in everything[-25:-15]]
+    finally:
+        restored.close()
+
+
+def test_state_at_is_exact(stored_controller, db_path, clock):
+    moments = exercise(stored_controller, clock)
+    stored_controller.close()
+
+    restored = reopen(db_path, clock)
+    try:
+        for ts, states in moments:
+            past = restored.state_at(ts)
+            assert past.states == states
+            # A checkpoint every 10 actions bounds the replay
+            assert past.replayed <= 10
+        assert restored.state_at(moments[0][0] - 1000).states == restored._initial_states
+    finally:
+        restored.close()
+
+
+def test_state_at_after_rebuilding_checkpoints(stored_controller, db_path, clock):
+    moments = exercise(stored_controller, clock)
+    stored_controller.close()
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("DELETE FROM checkpoints")
+        restored = reopen(db_path, clock)
+        restored.store._rebuild_checkpoints(conn)
+    try:
+        assert all(restored.state_at(ts).states == states for ts, states in moments)
+    finally:
+        restored.close()
+
+
+def test_checkpoints_follow_the_cadence(stored_controller, db_path, clock):
+    exercise(stored_controller, clock)
+    count = stored_controller.store.action_count
+    stored_controller.close()
+    with sqlite3.connect(db_path) as conn:
+        ids = [row[0] for row in conn.execute("SELECT last_action_id FROM checkpoints ORDER BY 1")]
+    assert ids == list(range(10, count + 1, 10))
+
+
+def test_state_at_needs_a_store(clock):
+    assert HomeController(clock=clock).state_at(clock()) is None
+
+
+def wait_for_error(store):
+    deadline = time.monotonic() + 5
+    while store.last_error is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return store.last_error
+
+
+def test_failed_writes_stop_the_store(stored_controller, db_path, clock):
+    stored_controller.toggle("light1")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TRIGGER refuse BEFORE INSERT ON actions BEGIN SELECT RAISE(ABORT, 'refused'); END")
+    stored_controller.toggle("light1")
+    store = stored_controller.store
+    assert wait_for_error(store) is not None
+    assert store.write_errors == 1
+    # Later commands fail before touching anything
+    states = stored_controller.device_states()
+    with pytest.raises(RuntimeError, match="writes failed"):
+        stored_controller.toggle("light1")
+    with pytest.raises(RuntimeError):
+        stored_controller.apply_batch("Scene", [("door1", True, None)])
+    assert stored_controller.device_states() == states
+    with pytest.raises(RuntimeError):
+        stored_controller.close()
+    assert not store.running
+
+
+
+def test_grouped_entries_stay_indexed_after_restart(stored_controller, db_path, clock):
+    stored_controller.toggle("light1")
+    NIGHT.run(stored_controller)
+    stored_controller.log("system", "Ping")
+    stored_controller.close()
+
+    restored = reopen(db_path, clock)
+    try:
+        assert [r.device for r in restored.recent_actions(5, device="fan")] == [BATCH_LOG_DEVICE]
+    finally:
+        restored.close()
+    # Past the in-memory log, from the store
+    restored = reopen(db_path, clock, log_capacity=1)
+    try:
+        assert [r.seq for r in restored.find_actions(10, device="light1")] == [1, 0]
+        assert [r.seq for r in restored.find_actions(10, device="fan")] == [1]
+    finally:
+        restored.close()
+
+
+# Positions of the stored actions matching the filters, newest first; a
+# grouped entry matches every device it changed
+def scan(store, device=None, action=None, text=None):
+    _, actions, _ = store.load(recent=store.action_count)
+    seqs = []
+    for seq in range(len(actions) - 1, -1, -1):
+        _, logged_device, logged_action, user, changed = actions[seq]
+        fields = (logged_device.lower(), logged_action.lower(), user.lower())
+        if device is not None and device != logged_device and device not in changed:
+            continue
+        if action is not None and not logged_action.lower().startswith(action.lower()):
+            continue
+        if not all(any(term in field for field in fields) for term in (text or "").lower().split()):
+            continue
+        seqs.append(seq)
+    return seqs
+
+
+def test_find_actions_continues_into_the_store(stored_controller, db_path, clock):
+    exercise(stored_controller, clock)
+    stored_controller.close()
+
+    restored = reopen(db_path, clock, log_capacity=20)
+    try:
+        expected = scan(restored.store, device="light1")
+        found = restored.find_actions(restored.store.action_count, device="light1")
+        assert [r.seq for r in found] == expected
+        page = restored.find_actions(5, device="light1", before=expected[9])
+        assert [r.seq for r in page] == expected[10:15]
+    finally:
+        restored.close()
+
+
+@pytest.mark.parametrize("filters", [
+    {"device": "fan", "action": "speed"},
+    {"device": "fan", "action": "Night"},
+    {"action": "Set to 2"},
+    {"text": "ping"},
+    {"text": "door1 unlock"},
+    {"device": "door1", "text": "lock"},
+    {"text": "nothing like this"},
+])
+def test_store_filters_match_a_scan(stored_controller, db_path, clock, filters):
+    exercise(stored_controller, clock)
+    stored_controller.close()
+
+    restored = reopen(db_path, clock, log_capacity=10)
+    try:
+        found = restored.find_actions(restored.store.action_count, **filters)
+        assert [r.seq for r in found] == scan(restored.store, **filters)
+    finally:
+        restored.close()
+
+
+@pytest.mark.parametrize("action, kind", [
+    ("Turn ON", "Turn ON"),
+    ("Set to 21.5°C", "Set to"),
+    ("Speed set to 2", "Speed set to"),
+    ("Night: light1 Turn OFF, fan Speed set to 2", "Night"),
+    ("Ping", "Ping"),
+])
+def test_action_kind(action, kind):
+    assert action_kind(action) == kind
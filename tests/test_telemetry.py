@@ -0,0 +1,103 @@
+import time
+
+import pytest
+
+from home_controller import HomeController
+from telemetry import TelemetryIngestor, TelemetryServer, connect, validate
+
+
+@pytest.fixture
+def controller(clock):
+    return HomeController(clock=clock)
+
+
+@pytest.mark.parametrize("message", [
+    ["light1"],
+    {"device": "oven", "on": True},
+    {"device": "light1"},
+    {"device": "light1", "on": 1},
+    {"device": "fan", "on": True},
+    {"device": "light1", "value": 3},
+    {"device": "thermostat", "value": "21"},
+    {"device": "thermostat", "value": 40},
+    {"device": "fan", "watts": -1},
+    {"device": "fan", "watts": True},
+])
+def test_validate_rejects(controller, message):
+    with pytest.raises(ValueError):
+        validate(message, controller.registry)
+
+
+def test_validate_accepts(controller):
+    assert validate({"device": "thermostat", "on": True, "value": 21.5}, controller.registry) == ("thermostat", True, 21.5, None)
+    assert validate({"device": "fan", "watts": 58.2}, controller.registry) == ("fan", None, None, 58.2)
+
+
+def test_batch_is_coalesced_per_device(controller):
+    ingestor = TelemetryIngestor(controller)
+    notified = []
+    controller.subscribe(notified.append)
+    logged = len(controller.action_log)
+    ingestor.apply([
+        {"device": "fan", "value": 1},
+        {"device": "light1", "on": True},
+        {"device": "fan", "value": 3},
+        {"device": "oven", "on": True},
+        {"device": "light1", "on": False},
+        {"device": "light1", "on": True},
+        {"device": "fan", "watts": 10.0},
+        {"device": "fan", "watts": 12.5},
+    ])
+    # The latest state wins, and the whole batch is one command
+    assert controller.device("fan").value == 3 and controller.device("light1").on
+    assert len(notified) == 1
+    assert len(controller.action_log) == logged + 1
+    assert (ingestor.applied, ingestor.batches, ingestor.rejected) == (8, 1, 1)
+    assert ingestor.last_error == "unknown device: 'oven'"
+
+
+def test_worker_survives_a_failed_batch(controller):
+    ingestor = TelemetryIngestor(controller, max_rate=None)
+    apply_telemetry = controller.apply_telemetry
+
+    def fail_once(*args, **kwargs):
+        controller.apply_telemetry = apply_telemetry
+        raise RuntimeError("store stopped")
+
+    controller.apply_telemetry = fail_once
+    ingestor.submit({"device": "light1", "on": True})
+    ingestor.submit({"device": "oven", "on": True})
+    ingestor.start()
+    deadline = time.monotonic() + 5
+    while ingestor.rejected < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    ingestor.submit({"device": "fan", "value": 2})
+    ingestor.stop()
+    assert ingestor.rejected == 2
+    assert ingestor.last_error == "batch failed: store stopped"
+    assert not controller.device("light1").on
+    assert controller.device("fan").value == 2
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize("token, applied", [("secret", True), ("wrong", False), (None, False)])
+def test_socket_needs_the_token(controller, token, applied):
+    ingestor = TelemetryIngestor(controller, max_rate=None)
+    server = TelemetryServer(ingestor, port=0, token="secret")
+    ingestor.start()
+    server.start()
+    try:
+        send, close = connect(*server.address, token=token)
+        send({"device": "light1", "on": True})
+        close()
+        wait_for(lambda: ingestor.applied or ingestor.rejected)
+    finally:
+        server.stop()
+        ingestor.stop()
+    assert controller.device("light1").on == applied
+    assert ingestor.rejected == (0 if applied else 1)
@@ -0,0 +1,59 @@
+import time
+
+
+class ViewTiming:
+    def __init__(self):
+        self.build_ms = None
+        self.visits = 0
+        self.last_ms = 0.0
+        self.total_ms = 0.0
+
+    @property
+    def average_ms(self):
+        return self.total_ms / self.visits if self.visits else 0.0
+
+
+class ViewManager:
+    # Builds each registered view the first time it is shown and caches it.
+    # Later visits only run the view's refresh callback, which updates the
+    # data-bound controls in place. Build and navigation times are recorded
+    # per view (server side, up to the point the page is marked dirty).
+
+    def __init__(self, page, scheduler, clock=time.perf_counter):
+        self.page = page
+        self.scheduler = scheduler
+        self.clock = clock
+        self.current = None
+        self.timings = {}
+        # Milliseconds from app start to the first view being handed to the page
+        self.first_frame_ms = None
+        self._builders = {}
+        self._views = {}
+
+    def register(self, name, build, refresh=None):
+        self._builders[name] = (build, refresh)
+        self.timings[name] = ViewTiming()
+
+    def is_built(self, name):
+        return name in self._views
+
+    def show(self, name, *args):
+        start = self.clock()
+        timing = self.timings[name]
+        build, refresh = self._builders[name]
+        view = self._views.get(name)
+        if view is None:
+            view = self._views[name] = build()
+            timing.build_ms = (self.clock() - start) * 1000
+        if refresh is not None:
+            refresh(*args)
+        if self.current != name:
+            self.page.controls.clear()
+            self.page.controls.append(view)
+            self.scheduler.mark_dirty(self.page)
+            self.current = name
+        elapsed = (self.clock() - start) * 1000
+        timing.visits += 1
+        timing.last_ms = elapsed
+        timing.total_ms += elapsed
+        return view